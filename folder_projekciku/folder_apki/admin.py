@@ -1,27 +1,112 @@
 from django.contrib import admin
-from django.contrib.auth.admin import UserAdmin  
-from .models import User, Category, Product, Rental
+from django.contrib.auth.admin import UserAdmin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from .models import User, Category, Product, Rental, ArchivedRental
+from .search import get_backend
+
+
+def estimated_count(queryset):
+    """
+    Liczba wierszy całej tabeli ze statystyk bazy (bez COUNT(*)) albo None, gdy ich brak:
+    PostgreSQL - pg_class.reltuples, SQLite - sqlite_stat1 po ANALYZE.
+    """
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+        elif connection.vendor == 'sqlite':
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            # Wiersz tabeli albo indeksu; indeksy częściowe (is_available=True) liczą tylko swoje
+            # wiersze, więc cała tabela to największa z liczb.
+            cursor.execute('SELECT MAX(CAST(stat AS INTEGER)) FROM sqlite_stat1 WHERE tbl = %s', [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None or row[0] is None:
+        return None
+    # reltuples = -1 - tabela nieanalizowana.
+    estimate = int(row[0])
+    return estimate if estimate >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator list zmian admina: dla niefiltrowanej dużej tabeli liczba wierszy pochodzi
+    ze statystyk bazy, więc wejście na listę nie skanuje całej tabeli przez COUNT(*).
+    Poniżej `exact_below` wierszy i dla list filtrowanych liczba jest dokładna.
+    """
+    exact_below = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_count(queryset)
+            if estimate is not None and estimate >= self.exact_below:
+                return estimate
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    # Bez drugiego COUNT(*) całej tabeli przy wyszukiwaniu i filtrach ("x z y").
+    show_full_result_count = False
+
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
-    list_display = ['name', 'category', 'is_available', 'date_added']  
-    list_filter = ['category', 'is_available', 'date_added']  
-    search_fields = ['name', 'description']  
-    
+class ProductAdmin(LargeTableAdmin):
+    list_display = ['name', 'category', 'is_available', 'date_added']
+    list_filter = ['category', 'is_available', 'date_added']
+    list_select_related = ['category']
+    search_fields = ['name', 'description']
+    autocomplete_fields = ['category', 'owner']
+    # Najwięcej wyników wyszukiwania (indeks zwraca id od najlepiej dopasowanych).
+    search_limit = 1000
+
+    def get_search_results(self, request, queryset, search_term):
+        # Indeks pełnotekstowy (search.py) zamiast LIKE po nazwie i opisie.
+        if not search_term:
+            return queryset, False
+        ids = get_backend().search(search_term, request.user, limit=self.search_limit)
+        return queryset.filter(pk__in=ids), False
+
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ['name', 'description'] 
-    
+    list_display = ['name', 'description', 'product_count', 'available_count']
+    readonly_fields = ['product_count', 'available_count']
+    search_fields = ['name']
+
 @admin.register(Rental)
-class RentalAdmin(admin.ModelAdmin):
+class RentalAdmin(LargeTableAdmin):
     list_display = ['user', 'product', 'status', 'get_product_category']
     list_filter = ['status', 'product__category']
+    list_select_related = ['user', 'product__category']
     search_fields = ['user__username', 'product__name']
+    autocomplete_fields = ['user']
+    raw_id_fields = ['product']
 
     @admin.display(ordering='product__category', description='Category')
     def get_product_category(self, obj):
         return obj.product.category
 
+@admin.register(ArchivedRental)
+class ArchivedRentalAdmin(LargeTableAdmin):
+    # Archiwum tylko do odczytu - wiersze dopisuje wyłącznie archive_rentals.
+    list_display = ['id', 'user', 'product', 'start_date', 'returned_at', 'archived_at']
+    list_select_related = ['user', 'product']
+    search_fields = ['user__username']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 @admin.register(User)
 class CustomUserAdmin(UserAdmin):  # Dziedziczymy po UserAdmin dla dodatkowych funkcji
     fieldsets = UserAdmin.fieldsets + (  # Dodanie pola "role" do edytora użytkownika
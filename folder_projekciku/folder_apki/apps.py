@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class FolderApkiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'folder_apki'
+
+    def ready(self):
+        from . import signals  # noqa: F401 - rejestruje odbiorniki sygnałów
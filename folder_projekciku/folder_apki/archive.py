@@ -0,0 +1,80 @@
+import datetime
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils.timezone import now
+
+from .conditional import rentals_scope
+from .models import ArchivedRental, Rental
+from .signals import notify_changed
+
+# Kolumny kopiowane 1:1 z Rental do ArchivedRental.
+ARCHIVED_FIELDS = ('id', 'user_id', 'product_id', 'status', 'start_date', 'end_date', 'returned_at')
+
+
+def archive_after():
+    return datetime.timedelta(days=getattr(settings, 'FOLDER_APKI_RENTAL_ARCHIVE_AFTER_DAYS', 180))
+
+
+def archive_batch_size():
+    return getattr(settings, 'FOLDER_APKI_RENTAL_ARCHIVE_BATCH', 1000)
+
+
+def archivable(older_than=None):
+    """
+    Zwrócone wypożyczenia starsze niż `older_than` (domyślnie FOLDER_APKI_RENTAL_ARCHIVE_AFTER_DAYS).
+    Wiek liczy się od zwrotu (indeks rental_returned_idx); każdy zwrot ma returned_at -
+    wiersze sprzed tego pola uzupełnia migracja 0013.
+    """
+    cutoff = now() - (older_than if older_than is not None else archive_after())
+    return Rental.objects.filter(returned_at__lt=cutoff, status='returned')
+
+
+def archive_batch(older_than=None, batch_size=None):
+    """
+    Przenosi jedną paczkę (najstarsze id) do ArchivedRental w jednej transakcji; zwraca jej rozmiar.
+    Przerwany przebieg zostawia spójny stan - kolejny zaczyna od pozostałych wierszy.
+    """
+    with transaction.atomic():
+        rows = list(
+            archivable(older_than).select_for_update()
+            .order_by('id')
+            .values_list(*ARCHIVED_FIELDS)[:batch_size or archive_batch_size()]
+        )
+        if not rows:
+            return 0
+        archived_at = now()
+        ArchivedRental.objects.bulk_create(
+            [ArchivedRental(**dict(zip(ARCHIVED_FIELDS, row)), archived_at=archived_at) for row in rows],
+            ignore_conflicts=True,
+        )
+        _delete_rentals([row[0] for row in rows])
+        # RentalDailyStats liczy obie tabele, więc przeniesienie ich nie zmienia;
+        # znaczniki unieważniają ETagi list i historii wypożyczeń właścicieli.
+        notify_changed(*{rentals_scope(row[1]) for row in rows})
+    return len(rows)
+
+
+def _delete_rentals(ids):
+    # Bez kolektora i sygnałów post_delete: rental_deleted zmniejszyłby statystyki,
+    # a kolektor pobierałby każdy wiersz. Na Rental nie wskazują żadne klucze obce.
+    connection = connections[router.db_for_write(Rental)]
+    table = connection.ops.quote_name(Rental._meta.db_table)
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE id IN ({placeholders})', ids)
+
+
+def archive_rentals(older_than=None, batch_size=None, max_batches=None):
+    """
+    Archiwizuje paczkami, aż zabraknie wierszy albo minie `max_batches` paczek.
+    Zwraca liczbę przeniesionych wypożyczeń.
+    """
+    archived = batches = 0
+    while max_batches is None or batches < max_batches:
+        moved = archive_batch(older_than, batch_size)
+        if not moved:
+            break
+        archived += moved
+        batches += 1
+    return archived
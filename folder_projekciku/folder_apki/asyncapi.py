@@ -0,0 +1,98 @@
+import functools
+import math
+
+from django.http import HttpResponse
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+
+from .authentication import acached_token, aremember_token
+from .fastjson import FastJSONRenderer
+
+# Odpowiednik @authentication_classes([CachedTokenAuthentication, SessionAuthentication]) dla widoków async.
+# DRF wywołuje uwierzytelnianie, uprawnienia i widok synchronicznie, więc pod ASGI każdy widok
+# @api_view zajmuje wątek; tu całe żądanie jest obsługiwane w pętli zdarzeń (async ORM).
+
+# Dane widoków async nie zawierają liczb zmiennoprzecinkowych (patrz FastJSONRenderer).
+_renderer = FastJSONRenderer()
+
+
+class JSONResponse(HttpResponse):
+    """
+    Odpowiedź JSON o tych samych bajtach co Response z DRF (JSONRenderer; orjson, gdy jest).
+    Dane zostają w `data`, jak w Response, na potrzeby cache odpowiedzi.
+    """
+    def __init__(self, data, status=200, headers=None):
+        self.data = data
+        super().__init__(_renderer.render(data), content_type=_renderer.media_type, status=status, headers=headers)
+
+
+async def authenticate(request):
+    """
+    Token z nagłówka `Authorization: Token <klucz>`, a bez niego użytkownik sesji.
+    Zwraca (użytkownik, token albo None) jak authenticate() w DRF, albo None (anonim).
+    """
+    header = request.headers.get('Authorization', '').split()
+    if header and header[0].lower() == 'token':
+        if len(header) != 2:
+            raise exceptions.AuthenticationFailed(_('Invalid token header.'))
+        token = await acached_token(header[1])
+        if token is not None:
+            return token.user, token
+        try:
+            token = await Token.objects.select_related('user').aget(key=header[1])
+        except Token.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        await aremember_token(token)
+        return token.user, token
+
+    user = await request.auser()
+    return (user, None) if user.is_authenticated else None
+
+
+def error_response(error):
+    headers = {'WWW-Authenticate': 'Token'} if error.status_code == 401 else None
+    if isinstance(error, exceptions.Throttled) and error.wait is not None:
+        headers = {'Retry-After': str(math.ceil(error.wait))}
+    # Jak exception_handler DRF: błędy walidacji (słownik, lista) bez opakowania w 'detail'.
+    data = error.detail if isinstance(error.detail, (list, dict)) else {'detail': error.detail}
+    return JSONResponse(data, status=error.status_code, headers=headers)
+
+
+def async_api_view(methods=('GET',), admin=False, throttles=()):
+    """
+    Dekorator widoku async: metoda HTTP, uwierzytelnienie, uprawnienia (IsAuthenticated
+    albo IsAdminUser), limity (`throttles` - klasy jak w @throttle_classes) i błędy API
+    jak w @api_view. Widok dostaje Request z DRF (query_params, user), więc paginatory
+    i walidatory działają bez zmian.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            try:
+                credentials = await authenticate(request)
+                if credentials is None:
+                    raise exceptions.NotAuthenticated()
+                user, auth = credentials
+                if admin and not user.is_staff:
+                    raise exceptions.PermissionDenied()
+                if request.method not in methods:
+                    raise exceptions.MethodNotAllowed(request.method)
+                request = Request(request)
+                request.user = user
+                # Token jak w DRF - limity (throttling.py) liczą klienta tak samo w widokach sync i async.
+                request.auth = auth
+                for throttle in (throttle_class() for throttle_class in throttles):
+                    if not throttle.allow_request(request, None):
+                        raise exceptions.Throttled(throttle.wait())
+                return await view(request, *args, **kwargs)
+            except exceptions.APIException as error:
+                response = error_response(error)
+                if isinstance(error, exceptions.MethodNotAllowed):
+                    response['Allow'] = ', '.join(methods)
+                return response
+        return wrapper
+    return decorator
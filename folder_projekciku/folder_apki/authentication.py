@@ -0,0 +1,172 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication
+
+# Liczniki są per proces, jak w caching.py.
+_stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def token_cache_stats():
+    """
+    Zwraca liczniki trafień lokalnego LRU, trafień współdzielonego cache i chybień (zapytań do bazy).
+    """
+    with _stats_lock:
+        return dict(_stats)
+
+
+class LRUCache:
+    """
+    Ograniczony rozmiarem słownik z czasem życia wpisów, bezpieczny dla wątków.
+    """
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def discard(self, keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+# Lokalny TTL ogranicza, jak długo inny proces może widzieć unieważniony token
+# (unieważnienie czyści lokalny LRU tylko w procesie, który je wykonał, i wspólny cache).
+_local = LRUCache(
+    getattr(settings, 'FOLDER_APKI_TOKEN_CACHE_SIZE', 10000),
+    getattr(settings, 'FOLDER_APKI_TOKEN_CACHE_TTL', 60),
+)
+
+
+def shared_cache():
+    alias = getattr(settings, 'FOLDER_APKI_TOKEN_CACHE', 'default')
+    return caches[alias] if alias else None
+
+
+def _digest(key):
+    # Klucze tokenów nie trafiają do współdzielonego cache jawnym tekstem.
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def _shared_key(digest):
+    return f'folder_apki:token:{digest}'
+
+
+def _shared_timeout():
+    return getattr(settings, 'FOLDER_APKI_TOKEN_CACHE_TIMEOUT', 300)
+
+
+def cached_token(key):
+    """
+    Token (z załadowanym użytkownikiem) z lokalnego LRU albo współdzielonego cache; None przy chybieniu.
+    """
+    digest = _digest(key)
+    token = _local.get(digest)
+    if token is not None:
+        _count('local_hits')
+        return token
+    shared = shared_cache()
+    token = shared.get(_shared_key(digest)) if shared else None
+    if token is not None:
+        _count('shared_hits')
+        _local.set(digest, token)
+        return token
+    _count('misses')
+    return None
+
+
+async def acached_token(key):
+    digest = _digest(key)
+    token = _local.get(digest)
+    if token is not None:
+        _count('local_hits')
+        return token
+    shared = shared_cache()
+    token = await shared.aget(_shared_key(digest)) if shared else None
+    if token is not None:
+        _count('shared_hits')
+        _local.set(digest, token)
+        return token
+    _count('misses')
+    return None
+
+
+def remember_token(token):
+    digest = _digest(token.key)
+    _local.set(digest, token)
+    shared = shared_cache()
+    if shared:
+        shared.set(_shared_key(digest), token, _shared_timeout())
+
+
+async def aremember_token(token):
+    digest = _digest(token.key)
+    _local.set(digest, token)
+    shared = shared_cache()
+    if shared:
+        await shared.aset(_shared_key(digest), token, _shared_timeout())
+
+
+def forget_tokens(keys):
+    """
+    Usuwa tokeny z lokalnego LRU i współdzielonego cache (usunięcie tokenu, zmiana użytkownika).
+    """
+    digests = [_digest(key) for key in keys]
+    _local.discard(digests)
+    shared = shared_cache()
+    if shared and digests:
+        shared.delete_many([_shared_key(digest) for digest in digests])
+
+
+def clear_token_cache():
+    _local.clear()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication bez zapytania do bazy przy każdym żądaniu: token -> użytkownik
+    z lokalnego LRU (rozmiar FOLDER_APKI_TOKEN_CACHE_SIZE, TTL FOLDER_APKI_TOKEN_CACHE_TTL),
+    a dalej ze wspólnego cache Django (FOLDER_APKI_TOKEN_CACHE) dla wielu procesów.
+    Wpisy unieważniają sygnały przy usunięciu tokenu i zmianie roli / aktywności użytkownika.
+    """
+    def authenticate_credentials(self, key):
+        token = cached_token(key)
+        if token is not None:
+            return token.user, token
+        user, token = super().authenticate_credentials(key)
+        remember_token(token)
+        return user, token
@@ -0,0 +1,100 @@
+from collections import defaultdict
+
+from django.db.models import Exists, OuterRef, Q
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import is_naive, make_aware
+
+from .models import Rental
+
+
+# ====================
+# Przedziały zajętości
+# ====================
+# Wypożyczenie zajmuje produkt w półotwartym przedziale [start_date, end_date); end_date None
+# oznacza brak końca. Okno [start, end) koliduje z nim, gdy start_date < end i end_date > start.
+# Indeks rental_product_interval_idx (product, end_date, start_date) ogranicza dla produktu
+# skan do przedziałów kończących się po początku okna - zakończona historia jest pomijana.
+# Zarchiwizowane wypożyczenia (archive.py) są dawno zakończone, więc nie kolidują z bieżącymi oknami.
+# Rezerwacja (rentals.py) przyjmuje przedział tylko wtedy, gdy nie koliduje z żadnym innym.
+
+def overlapping(start, end):
+    """
+    Warunek na Rental: przedział wypożyczenia nachodzi na okno [start, end); end None - bez końca.
+    """
+    ending = Q(end_date__gt=start) | Q(end_date__isnull=True)
+    return ending if end is None else Q(start_date__lt=end) & ending
+
+
+def intersects(start, end, other_start, other_end):
+    """
+    overlapping dla przedziałów już pobranych z bazy.
+    """
+    return (other_end is None or start < other_end) and (end is None or other_start < end)
+
+
+def busy(start, end, product_ids=None):
+    rentals = Rental.objects.filter(overlapping(start, end))
+    if product_ids is not None:
+        rentals = rentals.filter(product_id__in=product_ids)
+    return rentals
+
+
+def free_products(products, start, end):
+    """
+    Zawęża queryset produktów do wolnych w całym oknie [start, end) - jedno zapytanie
+    z NOT EXISTS skorelowanymi po indeksie przedziałów. end None - wolne od `start` bez końca.
+    """
+    # Dwa podzapytania zamiast jednego z OR: każde jest zakresem w indeksie
+    # (product, end_date > start) i (product, end_date IS NULL).
+    rentals = Rental.objects.filter(product=OuterRef('pk'))
+    if end is not None:
+        rentals = rentals.filter(start_date__lt=end)
+    return products.filter(
+        ~Exists(rentals.filter(end_date__gt=start)),
+        ~Exists(rentals.filter(end_date__isnull=True)),
+    )
+
+
+def is_free(product_id, start, end):
+    return not busy(start, end, [product_id]).exists()
+
+
+def calendar(product_ids, start, end):
+    """
+    Zajęte przedziały produktów w oknie: {id_produktu: [(początek, koniec), ...]},
+    przycięte do okna i scalone, gdy na siebie nachodzą. Produkty bez wpisu są wolne.
+    """
+    intervals = defaultdict(list)
+    rows = (
+        busy(start, end, product_ids)
+        .order_by('product_id', 'start_date')
+        .values_list('product_id', 'start_date', 'end_date')
+    )
+    for product_id, rental_start, rental_end in rows:
+        rental_start, rental_end = max(rental_start, start), min(rental_end or end, end)
+        merged = intervals[product_id]
+        if merged and rental_start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], rental_end))
+        else:
+            merged.append((rental_start, rental_end))
+    return dict(intervals)
+
+
+def parse_window(params):
+    """
+    Okno [start, end) z parametrów zapytania (ISO 8601; bez strefy - strefa bieżąca).
+    Rzuca ValueError z komunikatem dla użytkownika.
+    """
+    window = []
+    for name in ('start', 'end'):
+        value = params.get(name)
+        try:
+            moment = parse_datetime(value) if value else None
+        except ValueError:
+            moment = None
+        if moment is None:
+            raise ValueError(f'Parametr {name} musi być datą ISO 8601.')
+        window.append(make_aware(moment) if is_naive(moment) else moment)
+    if window[1] <= window[0]:
+        raise ValueError('Koniec okna musi być po jego początku.')
+    return tuple(window)
@@ -0,0 +1,677 @@
+import asyncio
+import datetime
+import io
+import json
+import platform
+import random
+import resource
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+
+from django.contrib.auth.hashers import make_password
+from django.core.asgi import get_asgi_application
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.db.models import Count
+from django.template.loader import render_to_string
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import resolve, reverse
+from django.utils.timezone import now
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from . import availability, compression, fastjson, urls
+from .models import User, Category, Product, Rental, RentalDailyStats, CategoryOwnerStats
+from .search import get_backend
+from .serializers import ProductSerializer, RentalSerializer
+
+
+# ====================
+# Dane testowe
+# ====================
+def seed(users=10, categories=10, products=1000, rentals=1000, seed=0):
+    """
+    Wypełnia bazę danymi przez bulk_create i odświeża struktury pochodne
+    (indeks wyszukiwania, statystyki wypożyczeń, liczniki kategorii), które bulk_create pomija.
+    Pierwszy użytkownik jest adminem. Zwraca {'admin': User, 'user': User}.
+    """
+    rng = random.Random(seed)
+    password = make_password('benchmark')
+    stamp = time.time_ns()
+    created_users = User.objects.bulk_create(
+        User(
+            username=f'bench-{stamp}-{i}', password=password,
+            role='adminki' if i == 0 else 'user', is_staff=i == 0,
+        )
+        for i in range(max(users, 2))
+    )
+    Token.objects.bulk_create(Token(key=Token.generate_key(), user=user) for user in created_users)
+    created_categories = Category.objects.bulk_create(
+        Category(name=f'Kategoria {stamp}-{i}', description='Opis kategorii') for i in range(max(categories, 1))
+    )
+
+    batch_size = 5000
+    for start in range(0, products, batch_size):
+        Product.objects.bulk_create(
+            Product(
+                name=f'Produkt {i:08d}', description=f'Opis produktu {i} ' * 5,
+                category=rng.choice(created_categories), owner=rng.choice(created_users),
+                is_available=rng.random() < 0.8,
+            )
+            for i in range(start, min(start + batch_size, products))
+        )
+    product_ids = list(
+        Product.objects.filter(category__in=created_categories).values_list('id', flat=True)
+    )
+    month_start = now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    month_span = now() - month_start
+    for start in range(0, rentals if product_ids else 0, batch_size):
+        batch = []
+        for _ in range(start, min(start + batch_size, rentals)):
+            status = rng.choice(['pending', 'approved', 'returned'])
+            start_date = month_start + rng.random() * month_span
+            # Zwrot kończy przedział zajętości (availability.py) - jak w transition_rentals.
+            returned_at = start_date + rng.random() * (now() - start_date) if status == 'returned' else None
+            batch.append(Rental(
+                user=rng.choice(created_users), product_id=rng.choice(product_ids), status=status,
+                start_date=start_date, end_date=returned_at, returned_at=returned_at,
+            ))
+        Rental.objects.bulk_create(batch)
+    get_backend().rebuild()
+    RentalDailyStats.rebuild()
+    CategoryOwnerStats.rebuild()
+    cache.clear()
+    return {'admin': created_users[0], 'user': created_users[1]}
+
+
+# ====================
+# Scenariusze tras
+# ====================
+def route_scenarios(admin, user):
+    """
+    Dla każdej nazwanej trasy folder_apki: (użytkownik, funkcja(i) -> argumenty wywołania klienta).
+    Trasy modyfikujące dane dostają w każdej iteracji inny obiekt.
+    """
+    own_products = list(Product.objects.filter(owner=user).values_list('id', flat=True)[:1000])
+    free_products = iter(availability.free_products(Product.objects.all(), now(), None).values_list('id', flat=True)[:5000])
+    rental = Rental.objects.filter(user=user).first() or Rental.objects.create(user=user, product_id=own_products[0])
+    category_id = Product.objects.filter(owner=user).values_list('category_id', flat=True).first()
+    pending = list(Rental.objects.filter(status='pending').values_list('id', flat=True)[:5000])
+    deletable = list(Product.objects.order_by('-id').values_list('id', flat=True)[:5000])
+    category_name = Category.objects.values_list('name', flat=True).first()
+
+    def take(items, i):
+        return items[i % len(items)]
+
+    def get(name, *args):
+        return lambda i: {'path': reverse(name, args=args)}
+
+    def import_file(i):
+        content = f'name,description,category,owner\nImport {i},Opis,{category_name},{admin.username}\n'
+        upload = SimpleUploadedFile(f'import-{i}.csv', content.encode())
+        return {'path': reverse('product-import'), 'data': {'file': upload}, 'format': 'multipart', 'method': 'post'}
+
+    return {
+        'product-list': (user, get('product-list')),
+        'product-detail': (user, lambda i: {'path': reverse('product-detail', args=[take(own_products, i)])}),
+        'category-products': (user, get('category-products', category_id)),
+        'category-availability': (user, lambda i: {
+            'path': reverse('category-availability', args=[category_id]),
+            'data': {'start': now().isoformat(), 'end': (now() + datetime.timedelta(days=7)).isoformat()},
+        }),
+        'rental-list': (user, get('rental-list')),
+        'rental-detail': (user, get('rental-detail', rental.pk)),
+        'rental-history': (user, get('rental-history')),
+        'rental-bulk': (user, lambda i: {
+            'path': reverse('rental-bulk'), 'data': [{'product': next(free_products)}],
+            'format': 'json', 'method': 'post',
+        }),
+        'rental-bulk-status': (admin, lambda i: {
+            'path': reverse('rental-bulk-status'), 'data': {'ids': [take(pending, i)], 'status': 'approved'},
+            'format': 'json', 'method': 'post',
+        }),
+        'monthly-report': (admin, get('monthly-report')),
+        'category-summary': (user, get('category-summary')),
+        'product-search': (user, get('product-search', 'produkt')),
+        'product-import': (admin, import_file),
+        'delete-product-admin': (admin, lambda i: {
+            'path': reverse('delete-product-admin', args=[take(deletable, i)]), 'method': 'delete',
+        }),
+        'export-products': (admin, get('export-products', 'csv')),
+        'export-rentals': (admin, get('export-rentals', 'ndjson')),
+        'metrics': (admin, get('metrics')),
+        'register': (None, get('register')),
+        'welcome': (None, get('welcome')),
+        'product-list-html': (user, get('product-list-html')),
+        'product-detail-html': (user, lambda i: {
+            'path': reverse('product-detail-html', args=[take(own_products, i)]),
+        }),
+        'async-product-list': (user, get('async-product-list')),
+        'async-product-detail': (user, lambda i: {
+            'path': reverse('async-product-detail', args=[take(own_products, i)]),
+        }),
+        'async-category-products': (user, get('async-category-products', category_id)),
+        'async-rental-list': (user, get('async-rental-list')),
+        'async-rental-detail': (user, get('async-rental-detail', rental.pk)),
+        'async-product-search': (user, get('async-product-search', 'produkt')),
+    }
+
+
+def app_route_names():
+    return {pattern.name for pattern in urls.urlpatterns if pattern.name}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def timed(call, repeat):
+    """
+    Wywołuje `call` `repeat` razy; zwraca (mediana czasu w ms, wynik ostatniego wywołania).
+    """
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = call()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), result
+
+
+# Benchmarki mierzą widoki, nie limity żądań (throttling.py) - te odrzucałyby serie żądań.
+@override_settings(FOLDER_APKI_THROTTLE_RATES={})
+def run(requests=50, cold=False, users=None, routes=None):
+    """
+    Wykonuje `requests` żądań na każdą trasę przez klienta testowego i zwraca wyniki:
+    percentyle czasu (ms), średnią liczbę zapytań SQL i szczytowe RSS procesu.
+    `cold=True` czyści cache przed każdym żądaniem.
+    """
+    users = users or seed()
+    scenarios = route_scenarios(users['admin'], users['user'])
+    if routes:
+        scenarios = {name: scenarios[name] for name in routes}
+    tokens = dict(Token.objects.filter(user__in=[users['admin'], users['user']]).values_list('user_id', 'key'))
+    client = APIClient()
+    results = {}
+    for name, (user, build) in scenarios.items():
+        # API przez token (jak klienci), widoki HTML przez sesję.
+        client.logout()
+        client.credentials()
+        if user and name.endswith('-html'):
+            client.force_login(user)
+        elif user:
+            client.credentials(HTTP_AUTHORIZATION=f'Token {tokens[user.pk]}')
+        timings, queries, statuses = [], [], set()
+        for i in range(requests):
+            call = build(i)
+            method = getattr(client, call.pop('method', 'get'))
+            if cold:
+                cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = method(**call)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries.append(len(context))
+            statuses.add(response.status_code)
+        results[name] = {
+            'p50_ms': round(statistics.median(timings), 3),
+            'p95_ms': round(percentile(timings, 0.95), 3),
+            'p99_ms': round(percentile(timings, 0.99), 3),
+            'queries_per_request': round(statistics.mean(queries), 2),
+            'statuses': sorted(statuses),
+        }
+    return {
+        'meta': {
+            'requests_per_route': requests,
+            'cold_cache': cold,
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'missing_routes': sorted(app_route_names() - set(scenarios)),
+        },
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'routes': results,
+    }
+
+
+def compare(current, baseline, threshold=1.2, metric='p95_ms'):
+    """
+    Zwraca listę regresji: trasy, dla których `metric` lub liczba zapytań wzrosła
+    ponad `threshold` razy względem poprzedniego pomiaru.
+    """
+    regressions = []
+    for name, result in current['routes'].items():
+        previous = baseline.get('routes', {}).get(name)
+        if not previous:
+            continue
+        for key in (metric, 'queries_per_request'):
+            if previous[key] and result[key] > previous[key] * threshold:
+                regressions.append(f'{name}: {key} {previous[key]} -> {result[key]}')
+    return regressions
+
+
+def dump(results, path):
+    with open(path, 'w', encoding='utf-8') as output:
+        json.dump(results, output, indent=2, sort_keys=True)
+
+
+# ====================
+# Współbieżność: WSGI vs ASGI
+# ====================
+# Trasa synchroniczna -> jej wersja async (te same argumenty ścieżki).
+ASYNC_ROUTES = {
+    'product-list': 'async-product-list',
+    'product-detail': 'async-product-detail',
+    'category-products': 'async-category-products',
+    'rental-list': 'async-rental-list',
+    'rental-detail': 'async-rental-detail',
+    'product-search': 'async-product-search',
+}
+
+
+def deployment_paths(users, routes=None):
+    """
+    {trasa: (ścieżka widoku sync, ścieżka widoku async)} dla użytkownika `users['user']`.
+    """
+    scenarios = route_scenarios(users['admin'], users['user'])
+    paths = {}
+    for name in routes or ASYNC_ROUTES:
+        path = scenarios[name][1](0)['path']
+        paths[name] = (path, reverse(ASYNC_ROUTES[name], kwargs=resolve(path).kwargs))
+    return paths
+
+
+def wsgi_get(application, path, headers):
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SCRIPT_NAME': '',
+        'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': 'testserver', 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr, 'wsgi.multithread': True, 'wsgi.multiprocess': False,
+        'wsgi.run_once': False, 'wsgi.version': (1, 0),
+        **{'HTTP_' + name.upper().replace('-', '_'): value for name, value in headers.items()},
+    }
+    started = []
+    body = application(environ, lambda status, response_headers, exc_info=None: started.append(status))
+    try:
+        b''.join(body)
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+    return int(started[0].split()[0])
+
+
+async def asgi_get(application, path, headers):
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+        'headers': [(b'host', b'testserver')] + [
+            (name.lower().encode(), value.encode()) for name, value in headers.items()
+        ],
+        'server': ('testserver', 80), 'client': ('127.0.0.1', 0),
+    }
+    request = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+    status = []
+
+    async def receive():
+        if request:
+            return request.pop()
+        # Klient nie rozłącza się przed końcem odpowiedzi.
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    await application(scope, receive, send)
+    return status[0]
+
+
+def http_get(url, headers):
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers)) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as error:
+        return error.code
+
+
+def summarize(timings, statuses, elapsed):
+    return {
+        'requests_per_second': round(len(timings) / elapsed, 1),
+        'p50_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'statuses': dict(sorted(statuses.items())),
+    }
+
+
+def measure_threads(call, connections, requests):
+    """
+    `connections` wątków (jak wątki serwera WSGI) wykonuje łącznie `requests` wywołań `call()`.
+    """
+    timings, statuses = [], Counter()
+    lock = threading.Lock()
+
+    def worker(count):
+        local_timings, local_statuses = [], Counter()
+        try:
+            for _ in range(count):
+                started = time.perf_counter()
+                local_statuses[call()] += 1
+                local_timings.append((time.perf_counter() - started) * 1000)
+        finally:
+            connection.close()
+            with lock:
+                timings.extend(local_timings)
+                statuses.update(local_statuses)
+
+    threads = [
+        threading.Thread(target=worker, args=(requests // connections + (i < requests % connections),))
+        for i in range(connections)
+    ]
+    began = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(timings, statuses, time.perf_counter() - began)
+
+
+async def measure_tasks(call, connections, requests):
+    """
+    `connections` współbieżnych zadań w jednej pętli zdarzeń wykonuje łącznie `requests` wywołań `call()`.
+    """
+    timings, statuses = [], Counter()
+
+    async def worker(count):
+        for _ in range(count):
+            started = time.perf_counter()
+            statuses[await call()] += 1
+            timings.append((time.perf_counter() - started) * 1000)
+
+    began = time.perf_counter()
+    await asyncio.gather(*(
+        worker(requests // connections + (i < requests % connections)) for i in range(connections)
+    ))
+    return summarize(timings, statuses, time.perf_counter() - began)
+
+
+@override_settings(FOLDER_APKI_THROTTLE_RATES={})
+def compare_deployments(paths, headers, connections=50, requests=1000, wsgi_url=None, asgi_url=None):
+    """
+    Przepustowość widoków sync pod WSGI i ich wersji async pod ASGI przy `connections`
+    jednoczesnych połączeniach. Z adresami `wsgi_url` / `asgi_url` mierzy działające serwery
+    (np. gunicorn --threads N i uvicorn); bez nich wywołuje handlery Django w procesie,
+    z pominięciem sieci.
+    """
+    results = {}
+    for name, (sync_path, async_path) in paths.items():
+        if wsgi_url and asgi_url:
+            wsgi = measure_threads(lambda: http_get(wsgi_url + sync_path, headers), connections, requests)
+            asgi = measure_threads(lambda: http_get(asgi_url + async_path, headers), connections, requests)
+        else:
+            wsgi_app, asgi_app = get_wsgi_application(), get_asgi_application()
+            wsgi = measure_threads(lambda: wsgi_get(wsgi_app, sync_path, headers), connections, requests)
+            asgi = asyncio.run(measure_tasks(lambda: asgi_get(asgi_app, async_path, headers), connections, requests))
+        results[name] = {'wsgi': wsgi, 'asgi': asgi}
+    return {
+        'meta': {
+            'connections': connections,
+            'requests_per_route': requests,
+            'in_process': not (wsgi_url and asgi_url),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+        },
+        'routes': results,
+    }
+
+
+# ====================
+# Renderowanie HTML
+# ====================
+NO_FRAGMENT_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+def html_rendering(user, repeat=5):
+    """
+    Mediana czasu (ms) renderowania listy produktów HTML widocznych dla `user`:
+    cała tabela naraz (jak przed stronicowaniem) i jedna strona widoku, bez cache
+    fragmentów, z zimnym i z ciepłym cache fragmentów.
+    """
+    client = Client()
+    client.force_login(user)
+    path = reverse('product-list-html')
+    everything = Product.objects.for_listing().visible_to(user).filter(is_available=True)
+
+    def render_everything():
+        render_to_string('folder_apki/product_list.html', {
+            'products': everything, 'page_key': 'all', 'fragment_timeout': 600,
+        })
+
+    def render_page():
+        response = client.get(path)
+        assert response.status_code == 200, response.status_code
+
+    def cold_page():
+        cache.clear()
+        render_page()
+
+    def median_ms(render):
+        return round(timed(render, repeat)[0], 3)
+
+    with override_settings(CACHES=NO_FRAGMENT_CACHE):
+        results = {
+            'full_table_no_fragment_cache': median_ms(render_everything),
+            'page_no_fragment_cache': median_ms(render_page),
+        }
+    render_page()
+    results['page_cold_fragment_cache'] = median_ms(cold_page)
+    results['page_warm_fragment_cache'] = median_ms(render_page)
+    return {'products': everything.count(), 'repeat': repeat, 'median_ms': results}
+
+
+# ====================
+# Dostępność produktów
+# ====================
+def seed_rental_history(rentals, days=730, future_days=30, batch_size=5000, seed=0):
+    """
+    Dopisuje `rentals` wypożyczeń istniejących produktów z przedziałami 1-14 dni,
+    rozłożonych od `days` dni wstecz do `future_days` dni naprzód (rezerwacje).
+    bulk_create pomija statystyki wypożyczeń - baza służy tylko do pomiaru.
+    """
+    rng = random.Random(seed)
+    user_ids = list(User.objects.values_list('id', flat=True))
+    product_ids = list(Product.objects.values_list('id', flat=True))
+    origin = now() - datetime.timedelta(days=days)
+    span = (days + future_days) * 86400
+    for start in range(0, rentals, batch_size):
+        batch = []
+        for _ in range(start, min(start + batch_size, rentals)):
+            start_date = origin + datetime.timedelta(seconds=rng.random() * span)
+            batch.append(Rental(
+                user_id=rng.choice(user_ids), product_id=rng.choice(product_ids), status='returned',
+                start_date=start_date, end_date=start_date + datetime.timedelta(days=rng.randint(1, 14)),
+            ))
+        Rental.objects.bulk_create(batch)
+
+
+def availability_windows():
+    today = now().replace(hour=0, minute=0, second=0, microsecond=0)
+    return {
+        'past_week': (today - datetime.timedelta(days=365), today - datetime.timedelta(days=358)),
+        'next_week': (today, today + datetime.timedelta(days=7)),
+        'in_a_month': (today + datetime.timedelta(days=30), today + datetime.timedelta(days=33)),
+    }
+
+
+def product_availability(user, repeat=5):
+    """
+    Mediana czasu (ms) odpowiedzi na "które produkty kategorii są wolne w oknie":
+    endpoint (jedna strona), pełny zbiór z indeksu przedziałów (NOT EXISTS) i skan
+    wszystkich wypożyczeń produktów kategorii w Pythonie - sposób sprzed end_date.
+    Sprawdza, że oba pełne zbiory są równe; dołącza plan zapytania.
+    """
+    category_id = (
+        Product.objects.visible_to(user).values_list('category_id', flat=True)
+        .annotate(n=Count('id')).order_by('-n').first()
+    )
+    products = Product.objects.visible_to(user).filter(category_id=category_id)
+    client = APIClient()
+    client.force_authenticate(user)
+    path = reverse('category-availability', args=[category_id])
+
+    def scan(start, end):
+        ids = set(products.values_list('id', flat=True))
+        rentals = Rental.objects.filter(product__in=products).values_list('product_id', 'start_date', 'end_date')
+        for product_id, rental_start, rental_end in rentals.iterator(chunk_size=5000):
+            if rental_start < end and (rental_end is None or rental_end > start):
+                ids.discard(product_id)
+        return ids
+
+    results = {}
+    for name, (start, end) in availability_windows().items():
+        params = {'start': start.isoformat(), 'end': end.isoformat()}
+        endpoint_ms, response = timed(lambda: client.get(path, params), repeat)
+        assert response.status_code == 200, response.status_code
+        free = availability.free_products(products, start, end).values_list('id', flat=True)
+        indexed_ms, indexed = timed(lambda: set(free.all()), repeat)
+        scan_ms, scanned = timed(lambda: scan(start, end), repeat)
+        assert indexed == scanned, f'{name}: różne wyniki indeksu i skanu'
+        results[name] = {
+            'free_products': len(indexed),
+            'endpoint_page_ms': round(endpoint_ms, 3),
+            'indexed_all_ms': round(indexed_ms, 3),
+            'scan_all_ms': round(scan_ms, 3),
+        }
+    start, end = availability_windows()['next_week']
+    return {
+        'products': Product.objects.count(),
+        'rentals': Rental.objects.count(),
+        'category_products': products.count(),
+        'repeat': repeat,
+        'windows': results,
+        'busy_in_next_week': Rental.objects.filter(availability.overlapping(start, end)).count(),
+        'query_plan': availability.free_products(products, start, end).values('id').explain(),
+    }
+
+
+# ====================
+# Renderowanie JSON list
+# ====================
+def json_rendering(user, repeat=5, page_size=1000):
+    """
+    Przepustowość (wiersze/s) budowania i kodowania JSON list produktów i wypożyczeń:
+    serializatory DRF + JSONRenderer (przed) kontra wiersze z values_list + FastJSONRenderer
+    (po). `serialize` - same dane już pobrane z bazy, `total` - razem z zapytaniem.
+    Do tego mediana (ms) strony `page_size` produktów z endpointu, bez cache odpowiedzi.
+    Sprawdza, że obie ścieżki dają te same bajty.
+    """
+    lists = {
+        'products': (Product.objects.for_listing().visible_to(user).filter(is_available=True), ProductSerializer),
+        'rentals': (Rental.objects.order_by('start_date', 'id'), RentalSerializer),
+    }
+    before_renderer, after_renderer = JSONRenderer(), fastjson.FastJSONRenderer()
+
+    def before(objects, serializer_class):
+        return before_renderer.render(serializer_class(objects, many=True).data)
+
+    def after(tuples, serializer_class):
+        return after_renderer.render(fastjson.values_rows(serializer_class).rows(tuples))
+
+    results = {}
+    for name, (queryset, serializer_class) in lists.items():
+        objects = list(queryset)
+        tuples = list(fastjson.values_rows(serializer_class).values(queryset))
+        before_ms, before_content = timed(lambda: before(objects, serializer_class), repeat)
+        after_ms, after_content = timed(lambda: after(tuples, serializer_class), repeat)
+        assert before_content == after_content, f'{name}: różne bajty odpowiedzi'
+        before_total_ms, _ = timed(lambda: before(list(queryset.all()), serializer_class), repeat)
+        after_total_ms, _ = timed(
+            lambda: after(list(fastjson.values_rows(serializer_class).values(queryset)), serializer_class), repeat,
+        )
+        results[name] = {
+            'rows': len(objects),
+            'bytes': len(before_content),
+            'rows_per_s': {
+                'serialize_before': round(len(objects) * 1000 / before_ms),
+                'serialize_after': round(len(objects) * 1000 / after_ms),
+                'total_before': round(len(objects) * 1000 / before_total_ms),
+                'total_after': round(len(objects) * 1000 / after_total_ms),
+            },
+        }
+
+    client = APIClient()
+    client.force_authenticate(user)
+    path = reverse('product-list')
+    pages = {}
+    with override_settings(CACHES=NO_FRAGMENT_CACHE):
+        for label, fast in (('before', False), ('after', True)):
+            with override_settings(FOLDER_APKI_FAST_JSON=fast):
+                pages[label] = timed(lambda: client.get(path, {'page_size': page_size}), repeat)
+    assert pages['before'][1].content == pages['after'][1].content, 'różne bajty strony endpointu'
+    return {
+        'orjson': fastjson.orjson is not None,
+        'repeat': repeat,
+        'lists': results,
+        'endpoint_page_ms': {label: round(ms, 3) for label, (ms, _) in pages.items()},
+        'page_size': page_size,
+    }
+
+
+# ====================
+# Kompresja odpowiedzi
+# ====================
+def response_compression(user, page_sizes=(10, 100, 1000), repeat=20):
+    """
+    Bajty na łączu i koszt CPU kompresji stron listy produktów różnej wielkości:
+    dla każdego dostępnego kodowania rozmiar, stopień kompresji i mediana czasu (ms)
+    kompresji jednej odpowiedzi; MessagePack (bez i z gzip), gdy biblioteka jest.
+    Na końcu czas całego żądania bez kompresji i z każdym kodowaniem.
+    """
+    client = APIClient()
+    client.force_authenticate(user)
+    path = reverse('product-list')
+
+    results = {}
+    for page_size in page_sizes:
+        response = client.get(path, {'page_size': page_size})
+        assert response.status_code == 200, response.status_code
+        body = response.content
+        sizes = {'identity': {'bytes': len(body)}}
+        for encoding in compression.available_encodings():
+            ms, compressed = timed(lambda: compression.compress(encoding, body), repeat)
+            sizes[encoding] = {
+                'bytes': len(compressed),
+                'ratio': round(len(body) / len(compressed), 2),
+                'compress_ms': round(ms, 4),
+                'mb_per_s': round(len(body) / ms / 1000, 1) if ms else None,
+            }
+        if fastjson.msgpack is not None:
+            packed = fastjson.MessagePackRenderer().render(response.data)
+            sizes['msgpack'] = {'bytes': len(packed)}
+            sizes['msgpack+gzip'] = {'bytes': len(compression.compress('gzip', packed))}
+
+        requests = {}
+        for encoding in ['identity', *compression.available_encodings()]:
+            ms, response = timed(
+                lambda: client.get(path, {'page_size': page_size}, HTTP_ACCEPT_ENCODING=encoding), repeat,
+            )
+            assert response.get('Content-Encoding', 'identity') == encoding or len(body) < compression.min_bytes()
+            requests[encoding] = round(ms, 4)
+        results[page_size] = {'sizes': sizes, 'request_ms': requests}
+    return {
+        'encodings': compression.available_encodings(),
+        'msgpack': fastjson.msgpack is not None,
+        'min_bytes': compression.min_bytes(),
+        'repeat': repeat,
+        'page_sizes': results,
+    }
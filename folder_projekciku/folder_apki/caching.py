@@ -0,0 +1,233 @@
+import asyncio
+import functools
+import threading
+import uuid
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+from .asyncapi import JSONResponse
+
+# Liczniki trafień są per proces (tak jak domyślny backend locmem).
+_stats = {'hits': 0, 'misses': 0, 'coalesced': 0}
+_stats_lock = threading.Lock()
+
+
+def get_cache():
+    return caches[getattr(settings, 'FOLDER_APKI_RESPONSE_CACHE', 'default')]
+
+
+def cache_stats():
+    """
+    Zwraca liczniki trafień i chybień cache odpowiedzi oraz żądań obsłużonych przez coalesced.
+    """
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+# ====================
+# Zakresy unieważniania
+# ====================
+# Każdy zakres ma w cache losowy znacznik wersji, który jest częścią klucza odpowiedzi.
+# Unieważnienie to zmiana znacznika - stare wpisy przestają pasować i wypadają przez LRU/TTL.
+# Znacznik usunięty z cache jest generowany na nowo, więc nigdy nie "wskrzesza" starych wpisów.
+
+def products_scope(user):
+    return 'products:all' if user.is_staff else f'products:owner:{user.pk}'
+
+
+def category_scope(category_id):
+    return f'category:{category_id}'
+
+
+def _version_key(scope):
+    return f'folder_apki:version:{scope}'
+
+
+def scope_versions(scopes):
+    cache = get_cache()
+    keys = [_version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            versions[key] = uuid.uuid4().hex
+            cache.set(key, versions[key], None)
+    return [versions[key] for key in keys]
+
+
+async def ascope_versions(scopes):
+    cache = get_cache()
+    keys = [_version_key(scope) for scope in scopes]
+    versions = await cache.aget_many(keys)
+    for key in keys:
+        if key not in versions:
+            versions[key] = uuid.uuid4().hex
+            await cache.aset(key, versions[key], None)
+    return [versions[key] for key in keys]
+
+
+def invalidate(*scopes):
+    get_cache().set_many({_version_key(scope): uuid.uuid4().hex for scope in scopes}, None)
+
+
+def response_key(view, request, versions):
+    return 'folder_apki:response:' + ':'.join([
+        view.__name__, str(request.user.pk), str(int(request.user.is_staff)),
+        request.get_host(), request.get_full_path(), *versions,
+    ])
+
+
+def cached_response(scopes):
+    """
+    Dekorator widoku API: cache'uje dane odpowiedzi 200 na GET per użytkownik
+    (rola zawiera się w is_staff), ścieżka i parametry zapytania.
+    `scopes(request, **kwargs)` zwraca zakresy, których zmiana unieważnia wpis.
+    Widoki async (zwracające JSONResponse) korzystają z asynchronicznego API cache.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return view(request, *args, **kwargs)
+
+            key = response_key(view, request, scope_versions(scopes(request, **kwargs)))
+            cache = get_cache()
+            data = cache.get(key)
+            if data is not None:
+                _count('hits')
+                response = Response(data)
+                response['X-Cache'] = 'HIT'
+                return response
+
+            _count('misses')
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, response.data, getattr(settings, 'FOLDER_APKI_RESPONSE_CACHE_TIMEOUT', 60))
+            response['X-Cache'] = 'MISS'
+            return response
+
+        @functools.wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return await view(request, *args, **kwargs)
+
+            key = response_key(view, request, await ascope_versions(scopes(request, **kwargs)))
+            cache = get_cache()
+            data = await cache.aget(key)
+            if data is not None:
+                _count('hits')
+                response = JSONResponse(data)
+                response['X-Cache'] = 'HIT'
+                return response
+
+            _count('misses')
+            response = await view(request, *args, **kwargs)
+            if response.status_code == 200:
+                await cache.aset(key, response.data, getattr(settings, 'FOLDER_APKI_RESPONSE_CACHE_TIMEOUT', 60))
+            response['X-Cache'] = 'MISS'
+            return response
+
+        return async_wrapper if iscoroutinefunction(view) else wrapper
+    return decorator
+
+
+# ====================
+# Łączenie równoległych żądań (single-flight)
+# ====================
+class Flight:
+    """
+    Obliczenie odpowiedzi, na które czekają równoległe identyczne żądania.
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+_async_flights = {}
+
+
+def coalesced(timeout=30):
+    """
+    Dekorator widoku API: równoległe identyczne żądania GET (ten sam widok, użytkownik,
+    rola i ścieżka z parametrami - jak klucz cached_response) wykonują widok raz.
+    Pierwsze liczy odpowiedź, pozostałe czekają (najwyżej `timeout` sekund) i dostają
+    jej dane i status w nowej odpowiedzi. Gdy pierwsze zakończy się wyjątkiem albo
+    czekanie się przedłuży, czekające liczą odpowiedź same. Obejmuje żądania jednego
+    procesu; umieszczać najbliżej funkcji widoku (nagłówki zewnętrznych dekoratorów
+    liczy każde żądanie osobno - @conditional robi to z cache, bez zapytań do bazy).
+    Pod ASGI rozłączenie klienta pierwszego żądania nie przerywa obliczenia czekającym.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return view(request, *args, **kwargs)
+
+            key = response_key(view, request, ())
+            with _flights_lock:
+                flight = _flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = _flights[key] = Flight()
+
+            if not leader:
+                if flight.done.wait(timeout) and flight.result is not None:
+                    _count('coalesced')
+                    data, status = flight.result
+                    return Response(data, status=status)
+                return view(request, *args, **kwargs)
+
+            try:
+                response = view(request, *args, **kwargs)
+                if hasattr(response, 'data'):
+                    flight.result = (response.data, response.status_code)
+                return response
+            finally:
+                with _flights_lock:
+                    del _flights[key]
+                flight.done.set()
+
+        @functools.wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return await view(request, *args, **kwargs)
+
+            # Pod ASGI żądania jednej pętli zdarzeń czekają na wspólne zadanie.
+            key = (asyncio.get_running_loop(), response_key(view, request, ()))
+            task = _async_flights.get(key)
+            if task is None:
+                task = asyncio.ensure_future(view(request, *args, **kwargs))
+                _async_flights[key] = task
+                task.add_done_callback(lambda done: finish_flight(key, done))
+                # Anulowanie tego żądania (rozłączony klient) nie może anulować zadania czekających.
+                return await asyncio.shield(task)
+
+            try:
+                response = await asyncio.wait_for(asyncio.shield(task), timeout)
+            except asyncio.CancelledError:
+                if not task.cancelled():
+                    raise  # Anulowano to żądanie, nie wspólne zadanie.
+                return await view(request, *args, **kwargs)
+            except Exception:
+                return await view(request, *args, **kwargs)
+            _count('coalesced')
+            return JSONResponse(response.data, status=response.status_code)
+
+        return async_wrapper if iscoroutinefunction(view) else wrapper
+    return decorator
+
+
+def finish_flight(key, task):
+    _async_flights.pop(key, None)
+    if not task.cancelled():
+        # Wyjątek odebrany także wtedy, gdy nikt już nie czeka (pierwsze żądanie anulowane).
+        task.exception()
@@ -0,0 +1,124 @@
+import threading
+
+try:
+    import brotli
+except ImportError:  # Opcjonalny - bez niego kodowanie br nie jest oferowane.
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # Opcjonalny - bez niego kodowanie zstd nie jest oferowane.
+    zstandard = None
+
+from django.conf import settings
+from django.utils.text import compress_string
+
+# Losowe bajty w nagłówku gzip utrudniają atak BREACH - jak w GZipMiddleware Django.
+GZIP_MAX_RANDOM_BYTES = 100
+# Szybkie poziomy dla odpowiedzi generowanych przy każdym żądaniu (brotli 11 / zstd 19 są
+# dla plików statycznych kompresowanych raz).
+BROTLI_QUALITY = 4
+ZSTD_LEVEL = 3
+
+
+def _gzip(data):
+    return compress_string(data, max_random_bytes=GZIP_MAX_RANDOM_BYTES)
+
+
+def _brotli(data):
+    return brotli.compress(data, quality=BROTLI_QUALITY)
+
+
+def _zstd(data):
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+
+
+CODECS = {'gzip': _gzip}
+if brotli is not None:
+    CODECS['br'] = _brotli
+if zstandard is not None:
+    CODECS['zstd'] = _zstd
+
+
+# Liczniki per proces: odpowiedzi i bajty przed/po kompresji dla każdego kodowania.
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def record(encoding, size, compressed_size):
+    with _stats_lock:
+        stats = _stats.setdefault(encoding, {'responses': 0, 'bytes_in': 0, 'bytes_out': 0})
+        stats['responses'] += 1
+        stats['bytes_in'] += size
+        stats['bytes_out'] += compressed_size
+
+
+def compression_stats():
+    """
+    Zwraca {kodowanie: {'responses', 'bytes_in', 'bytes_out'}} skompresowanych odpowiedzi.
+    """
+    with _stats_lock:
+        return {encoding: dict(stats) for encoding, stats in _stats.items()}
+
+
+def available_encodings():
+    """
+    Kodowania w kolejności preferencji serwera (FOLDER_APKI_COMPRESSION_ENCODINGS),
+    bez tych, których biblioteki nie ma.
+    """
+    preferred = getattr(settings, 'FOLDER_APKI_COMPRESSION_ENCODINGS', ('zstd', 'br', 'gzip'))
+    return [name for name in preferred if name in CODECS]
+
+
+def accepted_encodings(header):
+    """
+    Wagi z nagłówka Accept-Encoding: 'gzip, br;q=0.8' -> {'gzip': 1.0, 'br': 0.8}.
+    """
+    weights = {}
+    for part in header.split(','):
+        name, _, params = part.partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name] = weight
+    return weights
+
+
+def choose_encoding(header):
+    """
+    Kodowanie o najwyższej wadze klienta; przy równych wagach - wg preferencji serwera.
+    None, gdy klient nie przyjmuje żadnego (brak nagłówka, q=0).
+    """
+    weights = accepted_encodings(header)
+    best, best_weight = None, 0.0
+    for name in available_encodings():
+        weight = weights.get(name, weights.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = name, weight
+    return best
+
+
+def compress(encoding, data):
+    return CODECS[encoding](data)
+
+
+def min_bytes():
+    return getattr(settings, 'FOLDER_APKI_COMPRESSION_MIN_BYTES', 1024)
+
+
+def is_compressible(content_type):
+    """
+    Czy typ treści warto kompresować (FOLDER_APKI_COMPRESSIBLE_TYPES - prefiksy typów MIME).
+    Obrazy, archiwa i inne już skompresowane formaty nie są na liście.
+    """
+    media_type = content_type.split(';')[0].strip().lower()
+    prefixes = getattr(settings, 'FOLDER_APKI_COMPRESSIBLE_TYPES', ('text/', 'application/json'))
+    return media_type.startswith(tuple(prefixes))
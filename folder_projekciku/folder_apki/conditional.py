@@ -0,0 +1,128 @@
+import functools
+import hashlib
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import condition
+
+from .caching import ascope_versions, category_scope, get_cache, products_scope, scope_versions
+from .models import ChangeStamp
+
+
+def rentals_scope(user_id):
+    return f'rentals:user:{user_id}'
+
+
+def conditional(validators):
+    """
+    Dekorator widoku API obsługujący If-None-Match / If-Modified-Since (304).
+    `validators(request, **kwargs)` zwraca zakresy ChangeStamp danych widoku; z ich wersji
+    liczone są (etag, last_modified), bez zapytań o same dane. Znaczniki są w cache pod
+    wersjami zakresów (jak odpowiedzi w cached_response), więc przy ciepłym cache walidacja
+    nie wykonuje zapytań. Liczone raz na żądanie; dla widoków async przez async API cache i ORM.
+    ETag zależy od typu odpowiedzi (JSON, MessagePack, przeglądarka API), stąd Vary: Accept.
+    """
+    def compute(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return None, None
+        if not hasattr(request, '_conditional_validators'):
+            request._conditional_validators = validators_for(request, validators(request, **kwargs))
+        return request._conditional_validators
+
+    checked = condition(
+        etag_func=lambda request, *args, **kwargs: compute(request, *args, **kwargs)[0],
+        last_modified_func=lambda request, *args, **kwargs: compute(request, *args, **kwargs)[1],
+    )
+
+    def decorator(view):
+        wrapped = checked(view)
+        if not iscoroutinefunction(view):
+            @functools.wraps(view)
+            def inner(request, *args, **kwargs):
+                response = wrapped(request, *args, **kwargs)
+                patch_vary_headers(response, ('Accept',))
+                return response
+            return inner
+
+        @functools.wraps(view)
+        async def ainner(request, *args, **kwargs):
+            # condition() woła walidatory synchronicznie - liczymy je wcześniej, bez wątku.
+            if request.method in ('GET', 'HEAD'):
+                request._conditional_validators = await avalidators_for(request, validators(request, **kwargs))
+            response = await wrapped(request, *args, **kwargs)
+            patch_vary_headers(response, ('Accept',))
+            return response
+        return ainner
+    return decorator
+
+
+def make_etag(request, *parts):
+    # Ścieżka z parametrami rozróżnia strony i rozmiary stron tej samej listy, a typ odpowiedzi
+    # wybrany przez DRF (z parametrami, np. indent) - jej reprezentacje. Widoki async zwracają JSON.
+    media_type = getattr(request, 'accepted_media_type', 'application/json')
+    raw = '|'.join(str(part) for part in (request.user.pk, request.get_full_path(), media_type, *parts))
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def stamps_key(scopes, versions):
+    return 'folder_apki:stamps:' + ':'.join([*scopes, *versions])
+
+
+def validators_for(request, scopes):
+    """
+    Wersje zakresów zmienia każda zmiana danych - sygnały i operacje masowe
+    (notify_changed w signals.py), więc wykrywają też wstawienia i usunięcia.
+    """
+    cache = get_cache()
+    key = stamps_key(scopes, scope_versions(scopes))
+    stamps = cache.get(key)
+    if stamps is None:
+        stamps = ChangeStamp.read(*scopes)
+        cache.set(key, stamps, getattr(settings, 'FOLDER_APKI_RESPONSE_CACHE_TIMEOUT', 60))
+    return combine(request, stamps)
+
+
+async def avalidators_for(request, scopes):
+    cache = get_cache()
+    key = stamps_key(scopes, await ascope_versions(scopes))
+    stamps = await cache.aget(key)
+    if stamps is None:
+        stamps = await ChangeStamp.aread(*scopes)
+        await cache.aset(key, stamps, getattr(settings, 'FOLDER_APKI_RESPONSE_CACHE_TIMEOUT', 60))
+    return combine(request, stamps)
+
+
+def combine(request, stamps):
+    etag = make_etag(request, *(version for version, _ in stamps.values()))
+    changed = [updated_at for _, updated_at in stamps.values() if updated_at]
+    return etag, max(changed, default=None)
+
+
+# ====================
+# Walidatory widoków
+# ====================
+# Każdy zwraca zakresy ChangeStamp danych widoku dla validators_for.
+def product_list_validators(request):
+    return [products_scope(request.user)]
+
+
+def product_detail_validators(request, pk):
+    return [products_scope(request.user)]
+
+
+def product_search_validators(request, query):
+    return [products_scope(request.user)]
+
+
+def category_products_validators(request, category_id):
+    return [products_scope(request.user), category_scope(category_id)]
+
+
+def rental_validators(request, pk=None):
+    return [rentals_scope(request.user.pk)]
+
+
+def rental_history_validators(request):
+    # Archiwum zmienia się tylko przy archiwizacji, która podbija zakres wypożyczeń użytkownika.
+    return [rentals_scope(request.user.pk)]
@@ -0,0 +1,96 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Product, Rental
+
+CHUNK_SIZE = 2000
+
+# Kolumny eksportu: nagłówek -> ścieżka pola ORM (z dołączonym właścicielem i kategorią).
+PRODUCT_COLUMNS = {
+    'id': 'id',
+    'name': 'name',
+    'description': 'description',
+    'category_id': 'category_id',
+    'category': 'category__name',
+    'is_available': 'is_available',
+    'date_added': 'date_added',
+    'owner': 'owner__username',
+    'owner_role': 'owner__role',
+}
+
+RENTAL_COLUMNS = {
+    'id': 'id',
+    'user': 'user__username',
+    'product_id': 'product_id',
+    'product': 'product__name',
+    'category': 'product__category__name',
+    'status': 'status',
+    'start_date': 'start_date',
+    'end_date': 'end_date',
+    'returned_at': 'returned_at',
+}
+
+EXPORTS = {
+    'products': (Product, PRODUCT_COLUMNS),
+    'rentals': (Rental, RENTAL_COLUMNS),
+}
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def export_rows(name, chunk_size=CHUNK_SIZE):
+    """
+    Zwraca (nagłówki, iterator krotek) dla eksportu `name`.
+    .iterator() czyta wiersze paczkami (w PostgreSQL kursorem po stronie serwera),
+    więc pamięć nie rośnie z liczbą wierszy.
+    """
+    model, columns = EXPORTS[name]
+    rows = model.objects.order_by('pk').values_list(*columns.values()).iterator(chunk_size=chunk_size)
+    return list(columns), rows
+
+
+class Echo:
+    """
+    Bufor dla csv.writer, który zamiast zapisywać zwraca wiersz (wzorzec z dokumentacji Django).
+    """
+    def write(self, value):
+        return value
+
+
+def stream_csv(header, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def stream_ndjson(header, rows):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for row in rows:
+        yield encoder.encode(dict(zip(header, row))) + '\n'
+
+
+def buffered(lines, size=500):
+    # Łączy linie w większe kawałki - mniej wywołań write() po stronie serwera WSGI.
+    buffer = []
+    for line in lines:
+        buffer.append(line)
+        if len(buffer) == size:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+def stream_export(name, fmt, chunk_size=CHUNK_SIZE):
+    """
+    Generator tekstu eksportu `name` ('products' | 'rentals') w formacie `fmt` ('csv' | 'ndjson').
+    """
+    header, rows = export_rows(name, chunk_size)
+    lines = stream_csv(header, rows) if fmt == 'csv' else stream_ndjson(header, rows)
+    return buffered(lines)
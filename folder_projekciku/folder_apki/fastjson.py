@@ -0,0 +1,276 @@
+import functools
+
+try:
+    import orjson
+except ImportError:  # Opcjonalny - bez niego odpowiedzi koduje json z biblioteki standardowej.
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # Opcjonalny - bez niego API odpowiada tylko JSON-em.
+    msgpack = None
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.timezone import is_naive
+from rest_framework import ISO_8601, serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import BaseRenderer, BrowsableAPIRenderer, JSONRenderer
+from rest_framework.settings import api_settings
+
+
+def enabled():
+    return getattr(settings, 'FOLDER_APKI_FAST_JSON', True)
+
+
+# ====================
+# Wiersze z values_list
+# ====================
+# Pola, których to_representation zwraca wartość z bazy bez zmian (klucz obcy jako id).
+IDENTITY_FIELDS = (
+    serializers.CharField,
+    serializers.IntegerField,
+    serializers.BooleanField,
+    serializers.ChoiceField,
+    serializers.ReadOnlyField,
+    serializers.PrimaryKeyRelatedField,
+)
+
+
+def bind_converter(field):
+    """
+    to_representation pola na czas budowania jednej listy. Dla dat ISO 8601 strefa
+    jest ustalana raz, a nie dla każdej wartości (get_current_timezone jest drogie).
+    """
+    if not isinstance(field, serializers.DateTimeField):
+        return field.to_representation
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    zone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if zone is None or output_format is None or output_format.lower() != ISO_8601:
+        return field.to_representation
+
+    def convert(value):
+        if isinstance(value, str) or is_naive(value):
+            return field.to_representation(value)
+        text = value.astimezone(zone).isoformat()
+        return text[:-6] + 'Z' if text.endswith('+00:00') else text
+    return convert
+
+
+class ValuesRows:
+    """
+    Wiersze listy prosto z krotek values_list, z tymi samymi kluczami i wartościami co
+    `serializer_class(lista, many=True).data` - bez obiektu modelu i przejścia przez
+    serializator dla każdego wiersza. Pola spoza IDENTITY_FIELDS (daty) przechodzą przez
+    to_representation pola serializatora (bind_converter), więc format się nie rozjeżdża.
+    `fields` zawęża wiersze (i kolumny SELECT) do podanych pól serializatora.
+    """
+    def __init__(self, serializer_class, fields=None):
+        self.names, self.lookups, self.converters = [], [], []
+        for name, field in serializer_class().fields.items():
+            if field.write_only or (fields is not None and name not in fields):
+                continue
+            if field.source == '*' or isinstance(field, (serializers.BaseSerializer, serializers.ManyRelatedField)):
+                raise ImproperlyConfigured(f'{serializer_class.__name__}.{name}: pole nie jest kolumną.')
+            if isinstance(field, serializers.FloatField):
+                # orjson zapisuje wykładnik inaczej niż json (1e16 zamiast 1e+16).
+                raise ImproperlyConfigured(f'{serializer_class.__name__}.{name}: FloatField nie jest obsługiwane.')
+            if isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is not None:
+                raise ImproperlyConfigured(f'{serializer_class.__name__}.{name}: pk_field nie jest obsługiwane.')
+            self.names.append(name)
+            self.lookups.append(field.source.replace('.', '__'))
+            if not isinstance(field, IDENTITY_FIELDS):
+                self.converters.append((name, field))
+
+    def values(self, queryset, *extra):
+        """
+        values_list z kolumnami wierszy i polami `extra` (np. kursora paginacji);
+        krotki nazwane, więc KeysetPagination czyta z nich kursor jak z obiektów.
+        """
+        lookups = [*self.lookups, *(field for field in extra if field not in self.lookups)]
+        return queryset.values_list(*lookups, named=True)
+
+    def rows(self, tuples):
+        # zip kończy się na kolumnach wierszy - pola `extra` są na końcu krotki.
+        rows = [dict(zip(self.names, row)) for row in tuples]
+        for name, field in self.converters:
+            convert = bind_converter(field)
+            for row in rows:
+                value = row[name]
+                if value is not None:
+                    row[name] = convert(value)
+        return rows
+
+
+@functools.cache
+def values_rows(serializer_class, fields=None):
+    return ValuesRows(serializer_class, fields)
+
+
+# ====================
+# Projekcja pól (?fields= / ?exclude=)
+# ====================
+# Klient prosi o podzbiór pól serializatora (nazwy po przecinku): ?fields=id,name albo
+# ?exclude=description. Projekcja zawsze idzie przez values_list, więc pominięte kolumny
+# (np. description) nie są czytane z bazy. Klucz cache odpowiedzi i ETag zawierają parametry.
+
+def requested_fields(request, serializer_class):
+    """
+    Wybrane pola w kolejności serializatora albo None (wszystkie). Nieznane pole - 400.
+    """
+    return select_fields(request, values_rows(serializer_class).names)
+
+
+def select_fields(request, available):
+    """
+    Jak requested_fields, dla widoków bez serializatora - pola z listy `available`.
+    """
+    fields = request.query_params.get('fields')
+    exclude = request.query_params.get('exclude')
+    if not fields and not exclude:
+        return None
+    if fields and exclude:
+        raise ValidationError({'error': 'Podaj fields albo exclude, nie oba.'})
+    names = {name.strip() for name in (fields or exclude).split(',')} - {''}
+    unknown = names.difference(available)
+    if unknown:
+        raise ValidationError({'error': f"Nieznane pola: {', '.join(sorted(unknown))}."})
+    selected = tuple(name for name in available if (name in names) == bool(fields))
+    if not selected:
+        raise ValidationError({'error': 'Projekcja nie zostawia żadnego pola.'})
+    return selected
+
+
+def row_plan(request, serializer_class):
+    """
+    Plan wierszy dla żądania albo None, gdy dane ma zbudować serializator
+    (bez projekcji i z wyłączonym FOLDER_APKI_FAST_JSON).
+    """
+    fields = requested_fields(request, serializer_class)
+    if fields is None and not enabled():
+        return None
+    return values_rows(serializer_class, fields)
+
+
+# ====================
+# Serializacja w widokach
+# ====================
+def serialize(queryset, request, serializer_class):
+    """
+    Dane listy jak `serializer_class(queryset, many=True).data`, z projekcją pól żądania;
+    przy FOLDER_APKI_FAST_JSON albo projekcji zbudowane z values_list.
+    """
+    plan = row_plan(request, serializer_class)
+    if plan is None:
+        return serializer_class(queryset, many=True).data
+    return plan.rows(plan.values(queryset))
+
+
+async def aserialize(queryset, request, serializer_class):
+    plan = row_plan(request, serializer_class)
+    if plan is None:
+        return serializer_class([obj async for obj in queryset], many=True).data
+    return plan.rows([row async for row in plan.values(queryset)])
+
+
+def serialize_object(queryset, request, serializer_class):
+    """
+    Jeden obiekt (queryset.get()) jak w serialize(); rzuca DoesNotExist modelu.
+    """
+    plan = row_plan(request, serializer_class)
+    if plan is None:
+        return serializer_class(queryset.get()).data
+    return plan.rows([plan.values(queryset).get()])[0]
+
+
+async def aserialize_object(queryset, request, serializer_class):
+    plan = row_plan(request, serializer_class)
+    if plan is None:
+        return serializer_class(await queryset.aget()).data
+    return plan.rows([await plan.values(queryset).aget()])[0]
+
+
+def serialize_ids(queryset, ids, request, serializer_class):
+    """
+    Obiekty o podanych id w kolejności `ids` (np. wyników wyszukiwania), jak w serialize();
+    id spoza querysetu są pomijane.
+    """
+    plan = row_plan(request, serializer_class)
+    if plan is None:
+        objects = queryset.in_bulk(ids)
+        return serializer_class([objects[pk] for pk in ids if pk in objects], many=True).data
+    rows = {row.id: row for row in plan.values(queryset.filter(pk__in=ids), 'id')}
+    return plan.rows([rows[pk] for pk in ids if pk in rows])
+
+
+async def aserialize_ids(queryset, ids, request, serializer_class):
+    plan = row_plan(request, serializer_class)
+    if plan is None:
+        objects = await queryset.ain_bulk(ids)
+        return serializer_class([objects[pk] for pk in ids if pk in objects], many=True).data
+    rows = {row.id: row async for row in plan.values(queryset.filter(pk__in=ids), 'id')}
+    return plan.rows([rows[pk] for pk in ids if pk in rows])
+
+
+def serialize_page(paginator, queryset, request, serializer_class):
+    """
+    Bieżąca strona KeysetPagination serializowana jak w serialize().
+    """
+    plan = row_plan(request, serializer_class)
+    if plan is None:
+        return serializer_class(paginator.paginate_queryset(queryset, request), many=True).data
+    return plan.rows(paginator.paginate_queryset(plan.values(queryset, *paginator.fields), request))
+
+
+async def aserialize_page(paginator, queryset, request, serializer_class):
+    plan = row_plan(request, serializer_class)
+    if plan is None:
+        return serializer_class(await paginator.apaginate_queryset(queryset, request), many=True).data
+    return plan.rows(await paginator.apaginate_queryset(plan.values(queryset, *paginator.fields), request))
+
+
+# ====================
+# Kodowanie
+# ====================
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer kodujący przez orjson, gdy jest zainstalowany i FOLDER_APKI_FAST_JSON
+    jest włączone. Bajty są te same co z JSONRenderer: zwarte separatory, znaki spoza
+    ASCII jako UTF-8, daty przez JSONEncoder z DRF i escapowane U+2028/U+2029.
+    Wcięcia (Accept: application/json; indent=...) i typy nieobsługiwane przez orjson
+    koduje JSONRenderer. Tylko dla danych bez liczb zmiennoprzecinkowych (patrz ValuesRows).
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None or not enabled()
+            or self.ensure_ascii or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            content = orjson.dumps(data, default=self.encoder_class().default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        return content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    MessagePack dla klientów API, które o niego proszą (Accept: application/msgpack albo
+    ?format=msgpack): te same dane co w JSON, daty i inne typy spoza MessagePack zamienione
+    jak w JSONEncoder z DRF. Mniejszy i szybszy w dekodowaniu od JSON, zwłaszcza dla liczb.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=JSONRenderer.encoder_class().default)
+
+
+# Dla @renderer_classes widoków list - jak domyślne DEFAULT_RENDERER_CLASSES DRF (JSON
+# zostaje domyślny dla Accept: */*), plus MessagePack, gdy biblioteka jest zainstalowana.
+LIST_RENDERERS = [FastJSONRenderer, BrowsableAPIRenderer, *([MessagePackRenderer] if msgpack else [])]
@@ -0,0 +1,198 @@
+import csv
+import itertools
+import json
+import time
+from collections import Counter, defaultdict
+
+from django.db import transaction
+
+from .models import User, Category, Product, CategoryOwnerStats
+from .search import get_backend
+from .signals import notify_products_changed
+
+BATCH_SIZE = 5000
+MAX_REPORTED_ERRORS = 100
+NAME_MAX_LENGTH = Product._meta.get_field('name').max_length
+TRUE_VALUES = {'1', 'true', 'tak', 'yes', 't', 'y'}
+TEXT_FIELDS = ('name', 'description', 'category', 'owner')
+
+
+class ImportReport:
+    """
+    Wynik importu: liczby wierszy, pierwsze błędy i offset do wznowienia.
+    """
+    def __init__(self, offset):
+        self.next_offset = offset
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+        # Błąd całego pliku (np. kodowanie), który przerwał import po zapisanych paczkach.
+        self.error = None
+        self.started = time.monotonic()
+
+    @property
+    def rows_per_second(self):
+        elapsed = time.monotonic() - self.started
+        return (self.imported + self.failed) / elapsed if elapsed else 0.0
+
+    def add_error(self, line, messages):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': line, 'errors': messages})
+
+    def as_dict(self):
+        data = {
+            'imported': self.imported,
+            'failed': self.failed,
+            'errors': self.errors,
+            'next_offset': self.next_offset,
+            'rows_per_second': round(self.rows_per_second),
+        }
+        if self.error:
+            data['error'] = self.error
+        return data
+
+
+class InvalidRow:
+    """
+    Wiersz, którego nie da się odczytać (np. niepoprawny JSON) - raportowany jak błąd walidacji.
+    """
+    def __init__(self, message):
+        self.message = message
+
+
+def read_rows(stream, fmt):
+    """
+    Iteruje słowniki wierszy z pliku tekstowego CSV (z nagłówkiem) lub JSONL.
+    Nieczytelne wiersze są zwracane jako InvalidRow, więc nie przerywają importu.
+    """
+    if fmt == 'csv':
+        return read_csv(stream)
+    return (read_json(line) for line in stream if line.strip())
+
+
+def read_csv(stream):
+    reader = csv.DictReader(stream)
+    while True:
+        try:
+            yield next(reader)
+        except StopIteration:
+            return
+        except csv.Error as error:
+            yield InvalidRow(f'Niepoprawny wiersz CSV: {error}.')
+
+
+def read_json(line):
+    try:
+        return json.loads(line)
+    except ValueError as error:
+        return InvalidRow(f'Niepoprawny JSON: {error}.')
+
+
+def clean_row(row):
+    """
+    Sprawdza typy pól wiersza; zwraca (pola name/description/category/owner jako tekst
+    i is_available, lista błędów). JSON może zawierać dowolne typy, CSV - tylko tekst.
+    """
+    if isinstance(row, InvalidRow):
+        return None, [row.message]
+    if not isinstance(row, dict):
+        return None, ['Wiersz musi być obiektem JSON.']
+    values, errors = {}, []
+    for field in TEXT_FIELDS:
+        value = row.get(field)
+        if value is not None and not isinstance(value, str):
+            errors.append(f'Pole {field} musi być tekstem.')
+        values[field] = value if isinstance(value, str) else ''
+    is_available = row.get('is_available')
+    if is_available is None:
+        # Brak pola i JSON-owe null - wartość domyślna modelu.
+        is_available = True
+    elif isinstance(is_available, str):
+        is_available = is_available.strip().lower() in TRUE_VALUES
+    elif not isinstance(is_available, (bool, int)):
+        errors.append('Pole is_available musi być wartością logiczną.')
+    values['is_available'] = bool(is_available)
+    return values, errors
+
+
+def import_products(stream, fmt, offset=0, batch_size=BATCH_SIZE, progress=None):
+    """
+    Importuje produkty z kolumnami name, description, category (nazwa), owner (login)
+    i opcjonalnie is_available. Wiersze są czytane strumieniowo paczkami po `batch_size`;
+    każda paczka to jedno zapytanie o kategorie, jedno o właścicieli i jeden bulk_create
+    w osobnej transakcji, więc przerwany import można wznowić od `report.next_offset`.
+    Błędne wiersze trafiają do `report.errors`; plik, którego nie da się dalej czytać,
+    kończy import z `report.error` i offsetem ostatniej zapisanej paczki.
+    """
+    report = ImportReport(offset)
+    rows = itertools.islice(read_rows(stream, fmt), offset, None)
+    while True:
+        try:
+            batch = list(itertools.islice(rows, batch_size))
+        except ValueError as error:
+            # Np. plik nie w UTF-8 - wiersze bieżącej paczki nie są zapisywane.
+            report.error = f'Nie można odczytać pliku: {error}.'
+            break
+        if not batch:
+            break
+        import_batch(batch, report)
+        if progress:
+            progress(report)
+    return report
+
+
+def import_batch(batch, report):
+    first_line = report.next_offset
+    failures = []
+    rows = []
+    for line, row in enumerate(batch, start=first_line):
+        values, errors = clean_row(row)
+        if errors:
+            failures.append((line, errors))
+        else:
+            rows.append((line, values))
+
+    # Nazwa kategorii nie jest unikalna - wiersz z nazwą kilku kategorii jest odrzucany.
+    categories = defaultdict(list)
+    for category in Category.objects.filter(name__in={values['category'] for _, values in rows}):
+        categories[category.name].append(category)
+    owners = dict(
+        User.objects.filter(username__in={values['owner'] for _, values in rows}).values_list('username', 'id')
+    )
+
+    products = []
+    for line, values in rows:
+        name = values['name'].strip()
+        description = values['description']
+        errors = Product.validation_errors(name, description)
+        if len(name) > NAME_MAX_LENGTH:
+            errors.append(f'Nazwa produktu może mieć najwyżej {NAME_MAX_LENGTH} znaków.')
+        matches = categories.get(values['category'], [])
+        category = matches[0] if len(matches) == 1 else None
+        if not matches:
+            errors.append(f"Kategoria {values['category']!r} nie istnieje.")
+        elif category is None:
+            errors.append(f"Nazwa kategorii {values['category']!r} jest niejednoznaczna.")
+        owner_id = owners.get(values['owner'])
+        if owner_id is None:
+            errors.append(f"Użytkownik {values['owner']!r} nie istnieje.")
+        if errors:
+            failures.append((line, errors))
+            continue
+        products.append(Product(
+            name=name, description=description, category=category,
+            owner_id=owner_id, is_available=values['is_available'],
+        ))
+    for line, errors in sorted(failures, key=lambda failure: failure[0]):
+        report.add_error(line, errors)
+
+    # bulk_create pomija Product.save i sygnały: indeks wyszukiwania, liczniki kategorii,
+    # cache i znaczniki zmian odświeżamy tu.
+    with transaction.atomic():
+        Product.objects.bulk_create(products)
+        get_backend().index_products(products)
+        CategoryOwnerStats.bump(Counter(product.stats_key() for product in products))
+        notify_products_changed({product.owner_id for product in products})
+    report.imported += len(products)
+    report.next_offset = first_line + len(batch)
@@ -0,0 +1,30 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from folder_apki.archive import archivable, archive_after, archive_batch_size, archive_rentals
+
+
+class Command(BaseCommand):
+    help = (
+        'Przenosi zwrócone wypożyczenia starsze niż FOLDER_APKI_RENTAL_ARCHIVE_AFTER_DAYS '
+        'do tabeli archiwum paczkami, każdą w osobnej transakcji. Można przerwać '
+        'i uruchomić ponownie - kontynuuje od pozostałych wierszy.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Wiek zwrotu w dniach (domyślnie z ustawień).')
+        parser.add_argument('--batch-size', type=int, help='Wierszy w jednej transakcji (domyślnie z ustawień).')
+        parser.add_argument('--max-batches', type=int, help='Zatrzymuje się po tylu paczkach.')
+        parser.add_argument('--dry-run', action='store_true', help='Tylko liczy wiersze do archiwizacji.')
+
+    def handle(self, *args, **options):
+        older_than = datetime.timedelta(days=options['days']) if options['days'] is not None else archive_after()
+        if options['dry_run']:
+            self.stdout.write(f'Do archiwizacji: {archivable(older_than).count()} wypożyczeń.')
+            return
+
+        archived = archive_rentals(
+            older_than, options['batch_size'] or archive_batch_size(), options['max_batches'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'Zarchiwizowano {archived} wypożyczeń.'))
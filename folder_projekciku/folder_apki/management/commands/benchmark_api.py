@@ -0,0 +1,58 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from folder_apki import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark wszystkich tras folder_apki: p50/p95/p99, zapytania SQL na żądanie i szczytowe RSS. '
+        'Domyślnie działa na osobnej bazie testowej; wynik zapisuje do pliku JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--products', type=int, default=10000)
+        parser.add_argument('--rentals', type=int, default=10000)
+        parser.add_argument('--requests', type=int, default=50, help='Żądania na trasę.')
+        parser.add_argument('--route', action='append', dest='routes', help='Tylko wybrane trasy (można powtarzać).')
+        parser.add_argument('--cold', action='store_true', help='Czyść cache przed każdym żądaniem.')
+        parser.add_argument('--output', default='benchmark.json')
+        parser.add_argument('--baseline', help='Poprzedni wynik JSON do porównania.')
+        parser.add_argument('--threshold', type=float, default=1.2, help='Dopuszczalny wzrost p95 i liczby zapytań.')
+        parser.add_argument('--use-current-database', action='store_true', help='Nie twórz bazy testowej (dopisuje dane!).')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = None
+        if not options['use_current_database']:
+            old_name = connection.settings_dict['NAME']
+            connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            users = benchmark.seed(
+                options['users'], options['categories'], options['products'], options['rentals'],
+            )
+            results = benchmark.run(options['requests'], options['cold'], users, options['routes'])
+        finally:
+            if old_name is not None:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        benchmark.dump(results, options['output'])
+        for name, result in results['routes'].items():
+            self.stdout.write(
+                f"{name:24} p50={result['p50_ms']:8.2f} ms  p95={result['p95_ms']:8.2f} ms  "
+                f"p99={result['p99_ms']:8.2f} ms  sql={result['queries_per_request']:6.1f}  {result['statuses']}"
+            )
+        self.stdout.write(f"peak RSS: {results['peak_rss_kb'] / 1024:.1f} MB -> {options['output']}")
+
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as baseline:
+                regressions = benchmark.compare(results, json.load(baseline), options['threshold'])
+            if regressions:
+                raise CommandError('Regresje wydajności:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('Brak regresji względem poprzedniego pomiaru.'))
@@ -0,0 +1,71 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from rest_framework.authtoken.models import Token
+
+from folder_apki import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Porównuje przepustowość widoków API pod WSGI (wątki) i ich wersji async pod ASGI '
+        'przy wielu jednoczesnych połączeniach. Bez --wsgi-url/--asgi-url wywołuje handlery '
+        'Django w procesie na osobnej bazie testowej; wynik zapisuje do pliku JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=50, help='Jednoczesne połączenia.')
+        parser.add_argument('--requests', type=int, default=1000, help='Żądania na trasę i wdrożenie.')
+        parser.add_argument(
+            '--route', action='append', dest='routes', choices=sorted(benchmark.ASYNC_ROUTES),
+            help='Tylko wybrane trasy (można powtarzać).',
+        )
+        parser.add_argument('--products', type=int, default=10000)
+        parser.add_argument('--rentals', type=int, default=10000)
+        parser.add_argument('--wsgi-url', help='Adres działającego serwera WSGI, np. http://127.0.0.1:8000')
+        parser.add_argument('--asgi-url', help='Adres działającego serwera ASGI, np. http://127.0.0.1:8001')
+        parser.add_argument('--username', help='Użytkownik z tokenem na serwerach (tryb z adresami).')
+        parser.add_argument('--output', default='benchmark-asgi.json')
+
+    def handle(self, *args, **options):
+        live = options['wsgi_url'] or options['asgi_url']
+        if live and not (options['wsgi_url'] and options['asgi_url'] and options['username']):
+            raise CommandError('Tryb z serwerami wymaga --wsgi-url, --asgi-url i --username.')
+
+        if live:
+            results = self.measure(self.server_users(options['username']), options)
+        else:
+            setup_test_environment()
+            old_name = connection.settings_dict['NAME']
+            connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                users = benchmark.seed(users=10, categories=10, products=options['products'], rentals=options['rentals'])
+                results = self.measure(users, options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+
+        benchmark.dump(results, options['output'])
+        for name, result in results['routes'].items():
+            wsgi, asgi = result['wsgi'], result['asgi']
+            self.stdout.write(
+                f"{name:18} WSGI {wsgi['requests_per_second']:8.1f} req/s p95={wsgi['p95_ms']:8.2f} ms  "
+                f"ASGI {asgi['requests_per_second']:8.1f} req/s p95={asgi['p95_ms']:8.2f} ms  "
+                f"{wsgi['statuses']} {asgi['statuses']}"
+            )
+        self.stdout.write(f"{options['connections']} połączeń -> {options['output']}")
+
+    def server_users(self, username):
+        token = Token.objects.select_related('user').filter(user__username=username).first()
+        if token is None:
+            raise CommandError(f'Użytkownik {username!r} nie istnieje lub nie ma tokenu.')
+        return {'admin': token.user, 'user': token.user}
+
+    def measure(self, users, options):
+        key = Token.objects.get(user=users['user']).key
+        return benchmark.compare_deployments(
+            benchmark.deployment_paths(users, options['routes']),
+            {'Authorization': f'Token {key}'},
+            options['connections'], options['requests'],
+            options['wsgi_url'], options['asgi_url'],
+        )
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from folder_apki import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark zapytania "które produkty kategorii są wolne w oknie" (indeks przedziałów '
+        'wypożyczeń) kontra skan wszystkich wypożyczeń produktów kategorii. Działa na osobnej '
+        'bazie testowej; domyślnie 100k produktów i 10M wypożyczeń (zasiew trwa kilka minut).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000)
+        parser.add_argument('--rentals', type=int, default=10000000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--output', default='benchmark-availability.json')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            users = benchmark.seed(users=10, categories=10, products=options['products'], rentals=0)
+            benchmark.seed_rental_history(options['rentals'])
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            results = benchmark.product_availability(users['admin'], options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        benchmark.dump(results, options['output'])
+        self.stdout.write(
+            f"{results['products']} produktów, {results['rentals']} wypożyczeń, "
+            f"{results['category_products']} w kategorii; mediana z {results['repeat']} powtórzeń:"
+        )
+        for name, window in results['windows'].items():
+            self.stdout.write(
+                f"{name:12} wolnych {window['free_products']:6}  strona {window['endpoint_page_ms']:9.2f} ms  "
+                f"indeks {window['indexed_all_ms']:9.2f} ms  skan {window['scan_all_ms']:9.2f} ms"
+            )
+        self.stdout.write(results['query_plan'])
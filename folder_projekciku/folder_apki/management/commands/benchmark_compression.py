@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from folder_apki import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark kompresji odpowiedzi: bajty na łączu i czas CPU kompresji stron listy produktów '
+        'dla gzip oraz br/zstd (jeśli są biblioteki), rozmiar MessagePack. Działa na osobnej bazie testowej.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=5000)
+        parser.add_argument('--page-sizes', type=int, nargs='+', default=[10, 100, 1000])
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--output', default='benchmark-compression.json')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            users = benchmark.seed(products=options['products'], rentals=0)
+            with override_settings(CACHES=benchmark.NO_FRAGMENT_CACHE):
+                results = benchmark.response_compression(users['admin'], options['page_sizes'], options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        benchmark.dump(results, options['output'])
+        self.stdout.write(
+            f"kodowania: {', '.join(results['encodings'])}; MessagePack: {'tak' if results['msgpack'] else 'nie'}; "
+            f"próg {results['min_bytes']} B; mediana z {results['repeat']} powtórzeń"
+        )
+        for page_size, result in results['page_sizes'].items():
+            self.stdout.write(f"strona {page_size} produktów:")
+            for name, size in result['sizes'].items():
+                line = f"  {name:13} {size['bytes']:9} B"
+                if 'compress_ms' in size:
+                    line += f"  x{size['ratio']:<6} kompresja {size['compress_ms']:8.3f} ms ({size['mb_per_s']} MB/s)"
+                self.stdout.write(line)
+            self.stdout.write('  żądanie: ' + ', '.join(
+                f'{name} {ms:.2f} ms' for name, ms in result['request_ms'].items()
+            ))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from folder_apki import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark renderowania listy produktów HTML: cała tabela bez cache fragmentów '
+        'kontra stronicowany widok z zimnym i ciepłym cache fragmentów. Działa na osobnej bazie testowej.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--output', default='benchmark-html.json')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            # Jeden użytkownik-admin widzi wszystkie produkty na jednej liście.
+            users = benchmark.seed(users=2, categories=10, products=options['products'], rentals=0)
+            results = benchmark.html_rendering(users['admin'], options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        benchmark.dump(results, options['output'])
+        self.stdout.write(f"{results['products']} dostępnych produktów, mediana z {results['repeat']} powtórzeń:")
+        for name, value in results['median_ms'].items():
+            self.stdout.write(f'{name:32} {value:10.2f} ms')
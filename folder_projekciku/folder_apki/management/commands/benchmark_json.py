@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from folder_apki import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark renderowania JSON list: serializatory DRF + JSONRenderer kontra wiersze '
+        'z values_list + FastJSONRenderer (orjson, jeśli jest). Działa na osobnej bazie testowej.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=20000)
+        parser.add_argument('--rentals', type=int, default=20000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--page-size', type=int, default=1000)
+        parser.add_argument('--output', default='benchmark-json.json')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            users = benchmark.seed(products=options['products'], rentals=options['rentals'])
+            results = benchmark.json_rendering(users['admin'], options['repeat'], options['page_size'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        benchmark.dump(results, options['output'])
+        self.stdout.write(f"orjson: {'tak' if results['orjson'] else 'nie'}; mediana z {results['repeat']} powtórzeń")
+        for name, result in results['lists'].items():
+            rates = result['rows_per_s']
+            self.stdout.write(
+                f"{name:9} {result['rows']:7} wierszy  serializacja {rates['serialize_before']:9} -> "
+                f"{rates['serialize_after']:9} wierszy/s  z zapytaniem {rates['total_before']:9} -> "
+                f"{rates['total_after']:9} wierszy/s"
+            )
+        page = results['endpoint_page_ms']
+        self.stdout.write(
+            f"strona {results['page_size']} produktów: {page['before']:.2f} ms -> {page['after']:.2f} ms"
+        )
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from folder_apki.exports import CHUNK_SIZE, EXPORTS, FORMATS, stream_export
+
+
+class Command(BaseCommand):
+    help = 'Strumieniowo eksportuje produkty lub wypożyczenia do CSV albo NDJSON (stała zajętość pamięci).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(EXPORTS))
+        parser.add_argument('--format', dest='fmt', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--output', help='Plik wyjściowy (domyślnie standardowe wyjście).')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        chunks = stream_export(options['name'], options['fmt'], options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                output.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from folder_apki.imports import BATCH_SIZE, import_products
+
+
+class Command(BaseCommand):
+    help = (
+        'Importuje produkty z pliku CSV lub JSONL paczkami (bulk_create). '
+        'Po przerwaniu można wznowić z --offset równym ostatnio wypisanemu next_offset.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', dest='fmt', choices=['csv', 'jsonl'], help='Domyślnie z rozszerzenia pliku.')
+        parser.add_argument('--offset', type=int, default=0, help='Liczba wierszy danych do pominięcia.')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        fmt = options['fmt'] or ('jsonl' if options['path'].endswith(('.jsonl', '.ndjson')) else 'csv')
+
+        def progress(report):
+            self.stdout.write(
+                f'next_offset={report.next_offset} zaimportowano={report.imported} '
+                f'błędy={report.failed} ({report.rows_per_second:.0f} wierszy/s)'
+            )
+
+        try:
+            with open(options['path'], encoding='utf-8', newline='') as stream:
+                report = import_products(stream, fmt, options['offset'], options['batch_size'], progress)
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+
+        for error in report.errors:
+            self.stderr.write(f"wiersz {error['row']}: {' '.join(error['errors'])}")
+        if report.error:
+            raise CommandError(f'{report.error} Wznów z --offset {report.next_offset}.')
+        self.stdout.write(self.style.SUCCESS(
+            f'Zaimportowano {report.imported} produktów, odrzucono {report.failed} '
+            f'({report.rows_per_second:.0f} wierszy/s).'
+        ))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from folder_apki.models import RentalDailyStats
+
+
+class Command(BaseCommand):
+    help = 'Przelicza od nowa dzienne statystyki wypożyczeń albo (z --check) porównuje je z pełnym przeliczeniem.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Tylko sprawdza zgodność, niczego nie zapisuje.')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            mismatches = RentalDailyStats.mismatches()
+            for (date, status, category_id), (stored, expected) in sorted(mismatches.items()):
+                self.stderr.write(f'{date} {status} kategoria={category_id}: jest {stored}, powinno być {expected}')
+            if mismatches:
+                raise CommandError(f'Statystyki niezgodne w {len(mismatches)} wierszach.')
+            self.stdout.write(self.style.SUCCESS('Statystyki zgodne z tabelą wypożyczeń.'))
+            return
+
+        rows = RentalDailyStats.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Zapisano {rows} wierszy statystyk.'))
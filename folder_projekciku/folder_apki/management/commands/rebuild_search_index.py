@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from folder_apki.search import get_backend
+
+
+class Command(BaseCommand):
+    help = 'Przebudowuje indeks wyszukiwania produktów od zera (np. po bulk_create).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        count = get_backend().rebuild(batch_size=options['batch_size'])
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Zaindeksowano {count} produktów w {elapsed:.1f} s.'))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from folder_apki.models import CategoryOwnerStats
+
+
+class Command(BaseCommand):
+    help = (
+        'Przelicza od nowa liczniki produktów w kategoriach (sumy i per właściciel) '
+        'albo (z --check) porównuje je z pełnym przeliczeniem.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Tylko sprawdza zgodność, niczego nie zapisuje.')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            mismatches = CategoryOwnerStats.mismatches()
+            for (category_id, owner_id), (stored, expected) in sorted(
+                mismatches.items(), key=lambda item: (item[0][0], item[0][1] or 0)
+            ):
+                scope = f'właściciel={owner_id}' if owner_id else 'suma'
+                self.stderr.write(
+                    f'kategoria={category_id} {scope}: jest {stored[0]}/{stored[1]} (wszystkie/dostępne), '
+                    f'powinno być {expected[0]}/{expected[1]}'
+                )
+            if mismatches:
+                raise CommandError(f'Liczniki niezgodne w {len(mismatches)} wierszach.')
+            self.stdout.write(self.style.SUCCESS('Liczniki zgodne z tabelą produktów.'))
+            return
+
+        rows = CategoryOwnerStats.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Zapisano {rows} wierszy liczników.'))
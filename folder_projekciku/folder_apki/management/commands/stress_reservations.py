@@ -0,0 +1,85 @@
+import random
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.db.models import Count
+
+from folder_apki.models import User, Category, Product, Rental, CategoryOwnerStats
+from folder_apki.rentals import ProductUnavailable, reserve_product
+
+
+class Command(BaseCommand):
+    help = (
+        'Test obciążeniowy rezerwacji: wiele wątków jednocześnie rezerwuje te same produkty. '
+        'Uruchamiać na bazie plikowej (SQLite) lub PostgreSQL - nie na produkcji.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--products', type=int, default=20)
+        parser.add_argument('--attempts', type=int, default=50, help='Próby rezerwacji na wątek.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        category = Category.objects.create(name='stress-test')
+        users = [User.objects.create(username=f'stress-{i}-{time.time_ns()}') for i in range(options['threads'])]
+        products = Product.objects.bulk_create(
+            Product(name=f'Stress {i}', description='Opis', category=category, owner=users[0])
+            for i in range(options['products'])
+        )
+        CategoryOwnerStats.bump({products[0].stats_key(): len(products)})
+        product_ids = list(Product.objects.filter(category=category).values_list('id', flat=True))
+        results = {'reserved': 0, 'rejected': 0, 'busy': 0}
+        lock = threading.Lock()
+        start = threading.Barrier(len(users))
+
+        def worker(user, rng):
+            counts = dict.fromkeys(results, 0)
+            try:
+                start.wait()
+                for _ in range(options['attempts']):
+                    try:
+                        reserve_product(user, rng.choice(product_ids))
+                        counts['reserved'] += 1
+                    except ProductUnavailable:
+                        counts['rejected'] += 1
+                    except OperationalError:
+                        # SQLite: przekroczony limit oczekiwania na blokadę zapisu.
+                        counts['busy'] += 1
+            finally:
+                connection.close()
+                with lock:
+                    for key, value in counts.items():
+                        results[key] += value
+
+        threads = [
+            threading.Thread(target=worker, args=(user, random.Random(options['seed'] + i)))
+            for i, user in enumerate(users)
+        ]
+        began = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - began
+
+        reserved_products = Product.objects.filter(category=category, is_available=False).count()
+        double_booked = (
+            Rental.objects.filter(product__category=category)
+            .values('product')
+            .annotate(n=Count('id'))
+            .filter(n__gt=1)
+            .count()
+        )
+        total = options['threads'] * options['attempts']
+        self.stdout.write(
+            f"{connection.vendor}: {total} prób w {elapsed:.2f} s ({total / elapsed:.0f} req/s), "
+            f"zarezerwowano {results['reserved']}, odrzucono {results['rejected']}, "
+            f"blokada bazy {results['busy']}, podwójne rezerwacje {double_booked}"
+        )
+        category.delete()
+        User.objects.filter(pk__in=[user.pk for user in users]).delete()
+        if double_booked or results['reserved'] != reserved_products:
+            raise CommandError('Wykryto podwójne rezerwacje.')
@@ -0,0 +1,379 @@
+import contextvars
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+from . import compression, routers
+from .authentication import token_cache_stats
+from .caching import cache_stats
+from .throttling import throttle_stats
+
+logger = logging.getLogger('folder_apki.performance')
+
+# Progi histogramu czasu odpowiedzi (sekundy), jak domyślne w klientach Prometheusa.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROJECT_DIR = str(settings.BASE_DIR)
+THIS_FILE = os.path.abspath(__file__)
+
+
+class ViewMetrics:
+    """
+    Skumulowane pomiary jednego widoku (per proces).
+    """
+    def __init__(self):
+        self.requests = 0
+        self.seconds = 0.0
+        self.db_seconds = 0.0
+        self.db_queries = 0
+        self.render_seconds = 0.0
+        self.response_bytes = 0
+        self.buckets = [0] * len(BUCKETS)
+
+    def add(self, record):
+        self.requests += 1
+        self.seconds += record['total']
+        self.db_seconds += record['db']
+        self.db_queries += record['queries']
+        self.render_seconds += record['render']
+        self.response_bytes += record['bytes'] or 0
+        for i, bound in enumerate(BUCKETS):
+            if record['total'] <= bound:
+                self.buckets[i] += 1
+
+
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+
+def metrics_snapshot():
+    with _metrics_lock:
+        return {view: vars(metrics).copy() for view, metrics in _metrics.items()}
+
+
+def call_site():
+    """
+    Pierwsza ramka stosu z kodu projektu (poza tym plikiem) - miejsce wywołania zapytania.
+    """
+    frame = sys._getframe(1)
+    while frame:
+        filename = frame.f_code.co_filename
+        if (
+            filename.startswith(PROJECT_DIR)
+            and 'site-packages' not in filename
+            and os.path.abspath(filename) != THIS_FILE
+        ):
+            return f'{os.path.relpath(filename, PROJECT_DIR)}:{frame.f_lineno} ({frame.f_code.co_name})'
+        frame = frame.f_back
+    return 'nieznane'
+
+
+class QueryRecorder:
+    """
+    execute_wrapper zliczający zapytania i ich czas bez włączania DEBUG.
+    Stos (call_site) jest przeglądany tylko dla zapytań, które zostaną zalogowane:
+    wolnych i tych, które osiągnęły próg powtórzeń - nie dla każdego zapytania żądania.
+    """
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+        self.sites = {}
+        self.slow_ms = getattr(settings, 'FOLDER_APKI_SLOW_QUERY_MS', 100)
+        self.duplicate_threshold = getattr(settings, 'FOLDER_APKI_DUPLICATE_QUERY_THRESHOLD', 5)
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.seconds += elapsed
+            self.statements[sql] += 1
+            if self.statements[sql] == self.duplicate_threshold:
+                # Powtórzenie z pętli N+1 - to samo miejsce wywołania co poprzednie.
+                self.sites[sql] = call_site()
+            if self.slow_ms is not None and elapsed * 1000 >= self.slow_ms:
+                logger.warning('Wolne zapytanie (%.1f ms) w %s: %s', elapsed * 1000, call_site(), sql)
+
+
+# Rejestrator bieżącego żądania. Zmienna kontekstu przechodzi do wątków sync_to_async,
+# w których async ORM wykonuje zapytania (połączenia z bazą są tam inne niż w pętli zdarzeń).
+_recorder = contextvars.ContextVar('folder_apki_query_recorder', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """
+    Odbiornik connection_created: dokłada record_query do każdego nowego połączenia.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class PerformanceMiddleware:
+    """
+    Mierzy dla każdego widoku: czas całkowity, liczbę i czas zapytań SQL, czas renderowania
+    (serializacji) odpowiedzi i jej rozmiar. Wynik trafia do nagłówka Server-Timing
+    i do metryk Prometheusa (widok metrics_view). Wykrywa wolne i powtarzane (N+1) zapytania.
+    Działa pod WSGI i ASGI (nie wymusza przełączania widoków async do wątku).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        request._perf_render = [None, None]
+        token = _recorder.set(recorder)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        return self.finish(request, response, recorder, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        request._perf_render = [None, None]
+        token = _recorder.set(recorder)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        return self.finish(request, response, recorder, time.perf_counter() - started)
+
+    def finish(self, request, response, recorder, total):
+        view = self.view_name(request)
+        if view is None:
+            return response
+        render_started, render_finished = request._perf_render
+        record = {
+            'total': total,
+            'db': recorder.seconds,
+            'queries': recorder.count,
+            'render': render_finished - render_started if render_finished else 0.0,
+            'bytes': None if response.streaming else len(response.content),
+        }
+        with _metrics_lock:
+            _metrics.setdefault(view, ViewMetrics()).add(record)
+
+        response['Server-Timing'] = ', '.join([
+            f'total;dur={total * 1000:.1f};desc="{view}"',
+            f'db;dur={recorder.seconds * 1000:.1f};desc="{recorder.count} queries"',
+            f'render;dur={record["render"] * 1000:.1f}',
+        ])
+        self.report_duplicates(view, recorder)
+        return response
+
+    def view_name(self, request):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return None
+        # Widoki @api_view są opakowane w klasę; jej nazwa to nazwa funkcji z views.py.
+        return getattr(match.func, 'view_class', match.func).__name__
+
+    def process_template_response(self, request, response):
+        # Wywoływane tuż przed render(); koniec renderowania zapisuje callback.
+        request._perf_render[0] = time.perf_counter()
+        response.add_post_render_callback(lambda rendered: self.render_finished(request))
+        return response
+
+    def render_finished(self, request):
+        request._perf_render[1] = time.perf_counter()
+
+    def report_duplicates(self, view, recorder):
+        threshold = recorder.duplicate_threshold
+        if not threshold:
+            return
+        for sql, count in recorder.statements.items():
+            if count >= threshold:
+                logger.warning(
+                    'Możliwe N+1 w %s: %d× to samo zapytanie z %s: %s',
+                    view, count, recorder.sites[sql], sql,
+                )
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Wybiera replikę do odczytów żądania (routers.ReplicaRouter): tylko dla GET/HEAD/OPTIONS,
+    gdy skonfigurowano repliki, a klient nie jest przyklejony do primary po niedawnym zapisie.
+    Po żądaniu, które coś zapisało, przykleja klienta do primary.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        keys = routers.client_keys(request)
+        replica = None
+        if self.may_use_replica(request) and not routers.is_pinned(keys):
+            replica = routers.selector.choose()
+        state, token = routers.begin(replica)
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.end(token)
+        if state.wrote or request.method not in routers.SAFE_METHODS:
+            routers.pin(routers.client_keys(request, response))
+        return response
+
+    async def __acall__(self, request):
+        keys = routers.client_keys(request)
+        replica = None
+        if self.may_use_replica(request) and not await routers.ais_pinned(keys):
+            replica = routers.selector.choose()
+        state, token = routers.begin(replica)
+        try:
+            response = await self.get_response(request)
+        finally:
+            routers.end(token)
+        if state.wrote or request.method not in routers.SAFE_METHODS:
+            await routers.apin(routers.client_keys(request, response))
+        return response
+
+    def may_use_replica(self, request):
+        return request.method in routers.SAFE_METHODS and bool(routers.replicas())
+
+
+class CompressionMiddleware:
+    """
+    Kompresuje odpowiedzi kodowaniem wynegocjowanym z Accept-Encoding (compression.py):
+    zstd i br, gdy są ich biblioteki, zawsze gzip. Pomija odpowiedzi strumieniowe (eksporty),
+    krótsze niż FOLDER_APKI_COMPRESSION_MIN_BYTES, już zakodowane (Content-Encoding),
+    z Cache-Control: no-transform i typów spoza FOLDER_APKI_COMPRESSIBLE_TYPES.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.compress(request, await self.get_response(request))
+
+    def compress(self, request, response):
+        if (
+            response.streaming
+            or response.has_header('Content-Encoding')
+            or len(response.content) < compression.min_bytes()
+            or not compression.is_compressible(response.get('Content-Type', ''))
+            or 'no-transform' in response.get('Cache-Control', '')
+        ):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = compression.choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+        content = compression.compress(encoding, response.content)
+        if len(content) >= len(response.content):
+            return response
+
+        compression.record(encoding, len(response.content), len(content))
+        response.content = content
+        response['Content-Length'] = str(len(content))
+        # Inne bajty niż odpowiedź bez kompresji - ETag staje się słaby (RFC 9110 8.8.1),
+        # a porównanie If-None-Match w @conditional pomija prefiks W/.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
+
+
+def prometheus_text():
+    """
+    Metryki w formacie tekstowym Prometheusa (wersja 0.0.4).
+    """
+    lines = []
+
+    def family(name, kind, help_text):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+
+    snapshot = metrics_snapshot()
+    family('folder_apki_request_duration_seconds', 'histogram', 'Czas obsługi żądania.')
+    for view, metrics in sorted(snapshot.items()):
+        for bound, count in zip(BUCKETS, metrics['buckets']):
+            lines.append(f'folder_apki_request_duration_seconds_bucket{{view="{view}",le="{bound}"}} {count}')
+        lines.append(f'folder_apki_request_duration_seconds_bucket{{view="{view}",le="+Inf"}} {metrics["requests"]}')
+        lines.append(f'folder_apki_request_duration_seconds_sum{{view="{view}"}} {metrics["seconds"]:.6f}')
+        lines.append(f'folder_apki_request_duration_seconds_count{{view="{view}"}} {metrics["requests"]}')
+
+    for name, key, help_text in (
+        ('folder_apki_db_seconds_total', 'db_seconds', 'Czas zapytań SQL.'),
+        ('folder_apki_db_queries_total', 'db_queries', 'Liczba zapytań SQL.'),
+        ('folder_apki_render_seconds_total', 'render_seconds', 'Czas renderowania odpowiedzi.'),
+        ('folder_apki_response_bytes_total', 'response_bytes', 'Rozmiar odpowiedzi (bez strumieniowych).'),
+    ):
+        family(name, 'counter', help_text)
+        for view, metrics in sorted(snapshot.items()):
+            lines.append(f'{name}{{view="{view}"}} {metrics[key]}')
+
+    stats = cache_stats()
+    family('folder_apki_response_cache_total', 'counter', 'Trafienia i chybienia cache odpowiedzi.')
+    lines.append(f'folder_apki_response_cache_total{{result="hit"}} {stats["hits"]}')
+    lines.append(f'folder_apki_response_cache_total{{result="miss"}} {stats["misses"]}')
+    family('folder_apki_coalesced_requests_total', 'counter', 'Żądania obsłużone wynikiem równoległego identycznego żądania.')
+    lines.append(f'folder_apki_coalesced_requests_total {stats["coalesced"]}')
+
+    stats = throttle_stats()
+    family('folder_apki_throttle_total', 'counter', 'Żądania widoków z limitem: przepuszczone i odrzucone (429).')
+    lines.append(f'folder_apki_throttle_total{{result="allowed"}} {stats["allowed"]}')
+    lines.append(f'folder_apki_throttle_total{{result="throttled"}} {stats["throttled"]}')
+
+    stats = compression.compression_stats()
+    family('folder_apki_compressed_responses_total', 'counter', 'Skompresowane odpowiedzi wg kodowania.')
+    for encoding, values in sorted(stats.items()):
+        lines.append(f'folder_apki_compressed_responses_total{{encoding="{encoding}"}} {values["responses"]}')
+    family('folder_apki_compression_bytes_total', 'counter', 'Bajty skompresowanych odpowiedzi przed (in) i po (out) kompresji.')
+    for encoding, values in sorted(stats.items()):
+        lines.append(f'folder_apki_compression_bytes_total{{encoding="{encoding}",stage="in"}} {values["bytes_in"]}')
+        lines.append(f'folder_apki_compression_bytes_total{{encoding="{encoding}",stage="out"}} {values["bytes_out"]}')
+
+    stats = token_cache_stats()
+    family('folder_apki_token_cache_total', 'counter', 'Uwierzytelnienia tokenem: trafienia cache i zapytania do bazy.')
+    lines.append(f'folder_apki_token_cache_total{{result="local_hit"}} {stats["local_hits"]}')
+    lines.append(f'folder_apki_token_cache_total{{result="shared_hit"}} {stats["shared_hits"]}')
+    lines.append(f'folder_apki_token_cache_total{{result="miss"}} {stats["misses"]}')
+    lookups = sum(stats.values())
+    family('folder_apki_token_cache_hit_ratio', 'gauge', 'Odsetek uwierzytelnień tokenem bez zapytania do bazy.')
+    lines.append(f'folder_apki_token_cache_hit_ratio {(lookups - stats["misses"]) / lookups if lookups else 0.0:.4f}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,55 @@
+import unicodedata
+from itertools import islice
+
+from django.db import migrations
+
+FTS_TABLE = 'folder_apki_product_fts'
+BATCH_SIZE = 2000
+
+# Kopia search.fold z chwili utworzenia indeksu - migracja nie zależy od bieżącego kodu aplikacji.
+EXTRA_FOLDING = str.maketrans({'ł': 'l', 'Ł': 'L', 'ß': 'ss', 'ø': 'o', 'Ø': 'O'})
+
+
+def fold(text):
+    text = text or ''
+    if text.isascii():
+        return text.lower()
+    text = unicodedata.normalize('NFKD', text.translate(EXTRA_FOLDING))
+    return ''.join(ch for ch in text if not unicodedata.combining(ch)).lower()
+
+
+def create_fts_table(apps, schema_editor):
+    # FTS5 istnieje tylko w SQLite; inne bazy używają LikeSearchBackend.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+        'name, description, category, tokenize="unicode61 remove_diacritics 2")'
+    )
+    Product = apps.get_model('folder_apki', 'Product')
+    products = (
+        Product.objects.values_list('pk', 'name', 'description', 'category__name')
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+    with schema_editor.connection.cursor() as cursor:
+        while batch := list(islice(products, BATCH_SIZE)):
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, description, category) VALUES (%s, %s, %s, %s)',
+                [(pk, fold(name), fold(description), fold(category)) for pk, name, description, category in batch],
+            )
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('folder_apki', '0007_product_rental_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
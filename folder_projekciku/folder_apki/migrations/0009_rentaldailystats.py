@@ -0,0 +1,45 @@
+# Generated by Django 5.1.15 on 2026-10-18 03:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def backfill(apps, schema_editor):
+    Rental = apps.get_model('folder_apki', 'Rental')
+    RentalDailyStats = apps.get_model('folder_apki', 'RentalDailyStats')
+    rows = (
+        Rental.objects.annotate(day=TruncDate('start_date'))
+        .values_list('day', 'status', 'product__category')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    RentalDailyStats.objects.bulk_create(
+        RentalDailyStats(date=day, status=status, category_id=category_id, count=n)
+        for day, status, category_id, n in rows
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('folder_apki', '0008_product_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RentalDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('approved', 'Approved'), ('returned', 'Returned')], max_length=10)),
+                ('count', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='folder_apki.category')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('date', 'status', 'category'), name='rental_stats_unique')],
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
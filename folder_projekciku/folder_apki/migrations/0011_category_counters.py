@@ -0,0 +1,63 @@
+# Generated by Django 5.1.15 on 2026-10-18 03:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill(apps, schema_editor):
+    Category = apps.get_model('folder_apki', 'Category')
+    Product = apps.get_model('folder_apki', 'Product')
+    CategoryOwnerStats = apps.get_model('folder_apki', 'CategoryOwnerStats')
+    rows = (
+        Product.objects.values_list('category', 'owner')
+        .annotate(total=Count('id'), available=Count('id', filter=Q(is_available=True)))
+        .order_by()
+    )
+    CategoryOwnerStats.objects.bulk_create(
+        CategoryOwnerStats(category_id=category_id, owner_id=owner_id, total=total, available=available)
+        for category_id, owner_id, total, available in rows
+    )
+    categories = list(
+        Category.objects.annotate(
+            total=Count('product'), available=Count('product', filter=Q(product__is_available=True)),
+        )
+    )
+    for category in categories:
+        category.product_count, category.available_count = category.total, category.available
+    Category.objects.bulk_update(categories, ['product_count', 'available_count'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('folder_apki', '0010_changestamp'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='available_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='product_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='CategoryOwnerStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total', models.IntegerField(default=0)),
+                ('available', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='owner_stats', to='folder_apki.category')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('category', 'owner'), name='category_owner_stats_unique')],
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
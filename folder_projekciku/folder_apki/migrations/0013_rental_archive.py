@@ -0,0 +1,58 @@
+# Generated by Django 5.1.15 on 2026-10-18 03:43
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_returned_at(apps, schema_editor):
+    # Moment zwrotu starszych wierszy jest nieznany - przyjmujemy początek wypożyczenia,
+    # więc archivable() wybiera je tym samym indeksem częściowym co nowe.
+    Rental = apps.get_model('folder_apki', 'Rental')
+    Rental.objects.filter(status='returned', returned_at__isnull=True).update(returned_at=F('start_date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('folder_apki', '0012_product_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedRental',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('approved', 'Approved'), ('returned', 'Returned')], max_length=10)),
+                ('start_date', models.DateTimeField()),
+                ('returned_at', models.DateTimeField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='rental',
+            name='returned_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_returned_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='rental',
+            index=models.Index(condition=models.Q(('status', 'returned')), fields=['returned_at', 'id'], name='rental_returned_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedrental',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='folder_apki.product'),
+        ),
+        migrations.AddField(
+            model_name='archivedrental',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='archivedrental',
+            index=models.Index(fields=['user', 'start_date', 'id'], name='archived_rental_user_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.15 on 2026-10-18 03:54
+
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Coalesce
+
+
+def backfill_end_date(apps, schema_editor):
+    # Zwrócone wypożyczenia sprzed pola end_date kończą się w chwili zwrotu - inaczej
+    # availability.py traktowałoby je jako bezterminowe i produkt byłby zajęty na zawsze.
+    for model in ('Rental', 'ArchivedRental'):
+        apps.get_model('folder_apki', model).objects.filter(status='returned', end_date__isnull=True).update(
+            end_date=Coalesce(F('returned_at'), F('start_date')),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('folder_apki', '0013_rental_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedrental',
+            name='end_date',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='rental',
+            name='end_date',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_end_date, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='rental',
+            index=models.Index(fields=['product', 'end_date', 'start_date'], name='rental_product_interval_idx'),
+        ),
+    ]
@@ -1,6 +1,10 @@
-from django.db import models
+from collections import Counter, defaultdict
+
+from django.db import models, transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncDate
 from django.contrib.auth.models import AbstractUser
-from django.utils.timezone import now
+from django.utils.timezone import now, localtime
 from django.core.exceptions import ValidationError
 from django.conf import settings
 
@@ -22,26 +26,101 @@ class User(AbstractUser):
 class Category(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
+    # Liczniki produktów utrzymywane przyrostowo (patrz CategoryOwnerStats).
+    product_count = models.IntegerField(default=0)
+    available_count = models.IntegerField(default=0)
+
+    COUNTER_FIELDS = ('product_count', 'available_count')
+
+    def save(self, *args, **kwargs):
+        # Liczniki zmienia tylko CategoryOwnerStats.bump (F()) - zapis starej instancji
+        # (np. z panelu admina) nie może ich nadpisać.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
 
+class ProductQuerySet(models.QuerySet):
+    # Kolumny potrzebne ProductSerializer i szablonom HTML - bez nich Django
+    # dociąga właściciela i kategorię osobnym zapytaniem dla każdego wiersza.
+    LISTING_FIELDS = [
+        'id', 'name', 'description', 'category', 'is_available', 'date_added', 'updated_at', 'owner',
+        'owner__username', 'owner__role',
+        'category__name',
+    ]
+
+    def for_listing(self):
+        """
+        Dołącza właściciela i kategorię jednym JOIN-em i pobiera tylko potrzebne kolumny.
+        """
+        return self.select_related('owner', 'category').only(*self.LISTING_FIELDS)
+
+    def visible_to(self, user):
+        """
+        Admin widzi wszystkie produkty, zwykły użytkownik tylko swoje.
+        """
+        if user.is_staff:
+            return self
+        return self.filter(owner=user)
+
+
 class Product(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField()
     category = models.ForeignKey('Category', on_delete=models.CASCADE)
     is_available = models.BooleanField(default=True)
     date_added = models.DateTimeField(auto_now_add=True)
+    # Czas ostatniej zmiany - część klucza fragmentów szablonów; UPDATE-y masowe ustawiają go jawnie.
+    updated_at = models.DateTimeField(auto_now=True)
     owner = models.ForeignKey(
         settings.AUTH_USER_MODEL,  # Odniesienie do niestandardowego modelu użytkownika
         on_delete=models.CASCADE
     )
+
+    objects = ProductQuerySet.as_manager()
     
     def clean(self):
-        if len(self.name) < 3:
-            raise ValidationError("Nazwa produktu musi mieć co najmniej 3 znaki.")
-        if self.description.strip() == "":
-            raise ValidationError("Opis produktu nie może być pusty.")
+        errors = self.validation_errors(self.name, self.description)
+        if errors:
+            raise ValidationError(errors[0])
+
+    @staticmethod
+    def validation_errors(name, description):
+        """
+        Reguły clean() bez tworzenia instancji - używane też przy imporcie masowym.
+        """
+        errors = []
+        if len(name) < 3:
+            errors.append("Nazwa produktu musi mieć co najmniej 3 znaki.")
+        if description.strip() == "":
+            errors.append("Opis produktu nie może być pusty.")
+        return errors
+
+    def save(self, *args, **kwargs):
+        # Zapis i aktualizacja liczników kategorii w jednej transakcji.
+        with transaction.atomic():
+            previous = None
+            if not self._state.adding:
+                previous = (
+                    Product.objects.filter(pk=self.pk)
+                    .values_list('category_id', 'owner_id', 'is_available')
+                    .first()
+                )
+            # Przeniesienie produktu do innego właściciela unieważnia też listę poprzedniego (signals.py).
+            self._previous_owner_id = previous[1] if previous else None
+            super().save(*args, **kwargs)
+            deltas = Counter({self.stats_key(): 1})
+            if previous:
+                deltas[CategoryOwnerStats.key(*previous)] -= 1
+            CategoryOwnerStats.bump(deltas)
+
+    def stats_key(self):
+        return CategoryOwnerStats.key(self.category_id, self.owner_id, self.is_available)
 
     def check_availability(self):
         return "Dostępny" if self.is_available else "Niedostępny"
@@ -51,6 +130,25 @@ class Product(models.Model):
     
     class Meta:
         ordering = ['name']
+        # Indeksy częściowe (tylko dostępne produkty) odpowiadają filtrom widoków API;
+        # na bazach bez obsługi indeksów częściowych Django je pomija.
+        indexes = [
+            models.Index(
+                fields=['owner', 'name', 'id'],
+                condition=models.Q(is_available=True),
+                name='product_owner_avail_idx',
+            ),
+            models.Index(
+                fields=['category', 'owner', 'name', 'id'],
+                condition=models.Q(is_available=True),
+                name='product_cat_owner_avail_idx',
+            ),
+            models.Index(
+                fields=['name', 'id'],
+                condition=models.Q(is_available=True),
+                name='product_avail_name_idx',
+            ),
+        ]
 
 class Rental(models.Model):
     STATUS_CHOICES = [
@@ -62,6 +160,53 @@ class Rental(models.Model):
     product = models.ForeignKey('Product', on_delete=models.CASCADE)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
     start_date = models.DateTimeField(default=now)
+    # Koniec wypożyczenia (wyłącznie); None - bez ustalonego końca. Zwrot skraca je do chwili zwrotu.
+    # Przedział [start_date, end_date) zajmuje produkt - patrz availability.py.
+    end_date = models.DateTimeField(null=True, blank=True)
+    # Moment zwrotu - od niego liczy się wiek przy archiwizacji (archive.py).
+    returned_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'start_date', 'id'], name='rental_user_start_idx'),
+            models.Index(fields=['start_date'], name='rental_start_date_idx'),
+            models.Index(
+                fields=['returned_at', 'id'],
+                condition=models.Q(status='returned'),
+                name='rental_returned_idx',
+            ),
+            # Zapytania o zajętość: dla produktu tylko przedziały kończące się po początku okna.
+            models.Index(fields=['product', 'end_date', 'start_date'], name='rental_product_interval_idx'),
+        ]
+
+    def clean(self):
+        if self.end_date is not None and self.end_date <= self.start_date:
+            raise ValidationError({'end_date': 'Koniec wypożyczenia musi być po jego początku.'})
+
+    def save(self, *args, **kwargs):
+        if self.status == 'returned' and self.returned_at is None:
+            self.returned_at = now()
+            if self.end_date is None or self.end_date > self.returned_at:
+                self.end_date = max(self.returned_at, self.start_date)
+        # Zapis i aktualizacja RentalDailyStats w jednej transakcji.
+        with transaction.atomic():
+            previous = None
+            if not self._state.adding:
+                previous = (
+                    Rental.objects.filter(pk=self.pk)
+                    .values_list('start_date', 'status', 'product__category')
+                    .first()
+                )
+            # Zwrot zwalnia produkt (signals.py) - odbiornik post_save porównuje statusy.
+            self._previous_status = previous[1] if previous else None
+            super().save(*args, **kwargs)
+            deltas = Counter({self.stats_key(): 1})
+            if previous:
+                deltas[RentalDailyStats.key(*previous)] -= 1
+            RentalDailyStats.bump(deltas)
+
+    def stats_key(self):
+        return RentalDailyStats.key(self.start_date, self.status, self.product.category_id)
 
     def is_pending(self):
         return self.status == 'pending'
@@ -69,3 +214,283 @@ class Rental(models.Model):
     def __str__(self):
         return f"{self.user.username} rented {self.product.name}"
 
+
+class ArchivedRental(models.Model):
+    """
+    Zwrócone wypożyczenie przeniesione z `Rental` przez archive.py - tylko dopisywane.
+    Zachowuje id, użytkownika, produkt, status i daty oryginału, więc historia
+    i RentalDailyStats (które liczą obie tabele) nie zmieniają się przy archiwizacji.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey('User', on_delete=models.CASCADE, related_name='+')
+    product = models.ForeignKey('Product', on_delete=models.CASCADE, related_name='+')
+    status = models.CharField(max_length=10, choices=Rental.STATUS_CHOICES)
+    start_date = models.DateTimeField()
+    end_date = models.DateTimeField(null=True, blank=True)
+    returned_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(default=now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'start_date', 'id'], name='archived_rental_user_idx'),
+        ]
+
+    def stats_key(self):
+        return RentalDailyStats.key(self.start_date, self.status, self.product.category_id)
+
+    def __str__(self):
+        return f"{self.user.username} rented {self.product.name} (archiwum)"
+
+
+
+class CategoryOwnerStats(models.Model):
+    """
+    Liczba produktów (wszystkich i dostępnych) jednego właściciela w kategorii,
+    a w Category.product_count / available_count - sumy dla całej kategorii.
+    Utrzymywane przyrostowo przez F() przy zapisie i usuwaniu `Product` (Product.save,
+    signals.py) oraz w operacjach masowych (rentals.py, imports.py); inne operacje
+    masowe na querysetach ich nie aktualizują - wtedy `repair_category_counters`.
+    """
+    category = models.ForeignKey('Category', on_delete=models.CASCADE, related_name='owner_stats')
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    total = models.IntegerField(default=0)
+    available = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'owner'], name='category_owner_stats_unique'),
+        ]
+
+    @staticmethod
+    def key(category_id, owner_id, is_available):
+        return (category_id, owner_id, bool(is_available))
+
+    @classmethod
+    def bump(cls, deltas):
+        """
+        Dodaje przyrosty {(id_kategorii, id_właściciela, dostępny): delta} atomowo przez F().
+        """
+        owners = defaultdict(lambda: [0, 0])
+        categories = defaultdict(lambda: [0, 0])
+        for (category_id, owner_id, is_available), delta in deltas.items():
+            for counts in (owners[category_id, owner_id], categories[category_id]):
+                counts[0] += delta
+                counts[1] += delta if is_available else 0
+
+        for (category_id, owner_id), (total, available) in owners.items():
+            if not total and not available:
+                continue
+            rows = cls.objects.filter(category_id=category_id, owner_id=owner_id)
+            change = {'total': F('total') + total, 'available': F('available') + available}
+            if rows.update(**change) or total <= 0:
+                # Brak wiersza bez nowych produktów: właściciel lub kategoria są usuwani kaskadowo.
+                continue
+            cls.objects.get_or_create(category_id=category_id, owner_id=owner_id)
+            rows.update(**change)
+
+        for category_id, (total, available) in categories.items():
+            if total or available:
+                Category.objects.filter(pk=category_id).update(
+                    product_count=F('product_count') + total,
+                    available_count=F('available_count') + available,
+                )
+
+    @classmethod
+    def reservation_deltas(cls, products, sign=1):
+        """
+        Przyrosty dla produktów (id_kategorii, id_właściciela), które stają się
+        niedostępne (sign=1) albo znowu dostępne (sign=-1).
+        """
+        deltas = Counter()
+        for category_id, owner_id in products:
+            deltas[cls.key(category_id, owner_id, True)] -= sign
+            deltas[cls.key(category_id, owner_id, False)] += sign
+        return deltas
+
+    @staticmethod
+    def recount():
+        """
+        Pełne przeliczenie z tabeli Product: {(id_kategorii, id_właściciela): (wszystkie, dostępne)}.
+        """
+        counts = defaultdict(lambda: [0, 0])
+        rows = (
+            Product.objects.values_list('category', 'owner', 'is_available')
+            .annotate(n=Count('id'))
+            .order_by()
+        )
+        for category_id, owner_id, is_available, n in rows:
+            counts[category_id, owner_id][0] += n
+            counts[category_id, owner_id][1] += n if is_available else 0
+        return {key: tuple(value) for key, value in counts.items()}
+
+    @staticmethod
+    def category_totals(counts):
+        totals = defaultdict(lambda: (0, 0))
+        for (category_id, _), (total, available) in counts.items():
+            totals[category_id] = (totals[category_id][0] + total, totals[category_id][1] + available)
+        return totals
+
+    @classmethod
+    def rebuild(cls):
+        counts = cls.recount()
+        totals = cls.category_totals(counts)
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create(
+                cls(category_id=category_id, owner_id=owner_id, total=total, available=available)
+                for (category_id, owner_id), (total, available) in counts.items()
+            )
+            categories = list(Category.objects.only('id'))
+            for category in categories:
+                category.product_count, category.available_count = totals[category.pk]
+            Category.objects.bulk_update(categories, ['product_count', 'available_count'], batch_size=1000)
+        return len(counts)
+
+    @classmethod
+    def mismatches(cls):
+        """
+        Liczniki różne od pełnego przeliczenia: {(id_kategorii, id_właściciela): (zapisane, poprawne)},
+        gdzie id_właściciela None oznacza sumy w Category.
+        """
+        expected = cls.recount()
+        stored = {
+            (category_id, owner_id): (total, available)
+            for category_id, owner_id, total, available in cls.objects.exclude(total=0, available=0)
+            .values_list('category', 'owner', 'total', 'available')
+        }
+        expected_totals = cls.category_totals(expected)
+        stored_totals = {
+            category_id: (total, available)
+            for category_id, total, available in Category.objects.values_list('id', 'product_count', 'available_count')
+        }
+        mismatches = {
+            key: (stored.get(key, (0, 0)), expected.get(key, (0, 0)))
+            for key in stored.keys() | expected.keys()
+            if stored.get(key, (0, 0)) != expected.get(key, (0, 0))
+        }
+        mismatches.update(
+            ((category_id, None), (stored_totals[category_id], expected_totals[category_id]))
+            for category_id in stored_totals
+            if stored_totals[category_id] != expected_totals[category_id]
+        )
+        return mismatches
+
+
+class RentalDailyStats(models.Model):
+    """
+    Dzienna liczba wypożyczeń w podziale na status i kategorię produktu,
+    łącznie z archiwum (ArchivedRental). Utrzymywana przyrostowo przy zapisie
+    i usuwaniu `Rental` (patrz Rental.save i signals.py); operacje masowe
+    na querysetach jej nie aktualizują - wtedy trzeba uruchomić `rebuild_rental_stats`.
+    """
+    date = models.DateField()
+    status = models.CharField(max_length=10, choices=Rental.STATUS_CHOICES)
+    category = models.ForeignKey('Category', on_delete=models.CASCADE)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'status', 'category'], name='rental_stats_unique'),
+        ]
+
+    @staticmethod
+    def key(start_date, status, category_id):
+        return (localtime(start_date).date(), status, category_id)
+
+    @classmethod
+    def bump(cls, deltas):
+        """
+        Dodaje przyrosty {(data, status, id_kategorii): delta} atomowo przez F().
+        """
+        for (date, status, category_id), delta in deltas.items():
+            if not delta:
+                continue
+            rows = cls.objects.filter(date=date, status=status, category_id=category_id)
+            if rows.update(count=F('count') + delta) or delta < 0:
+                # Ujemny przyrost bez wiersza: kategoria jest właśnie usuwana kaskadowo.
+                continue
+            cls.objects.get_or_create(date=date, status=status, category_id=category_id)
+            rows.update(count=F('count') + delta)
+
+    @staticmethod
+    def recount():
+        """
+        Pełne przeliczenie z tabel Rental i ArchivedRental - do uzupełniania i weryfikacji rollupu.
+        """
+        counts = Counter()
+        for model in (Rental, ArchivedRental):
+            rows = (
+                model.objects.annotate(day=TruncDate('start_date'))
+                .values_list('day', 'status', 'product__category')
+                .annotate(n=Count('id'))
+                .order_by()
+            )
+            counts.update({(day, status, category_id): n for day, status, category_id, n in rows})
+        return counts
+
+    @classmethod
+    def rebuild(cls):
+        counts = cls.recount()
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create(
+                cls(date=date, status=status, category_id=category_id, count=n)
+                for (date, status, category_id), n in counts.items()
+            )
+        return len(counts)
+
+    @classmethod
+    def mismatches(cls):
+        """
+        Klucze, dla których rollup różni się od pełnego przeliczenia.
+        """
+        stored = Counter({
+            (date, status, category_id): n
+            for date, status, category_id, n in cls.objects.exclude(count=0)
+            .values_list('date', 'status', 'category', 'count')
+        })
+        expected = cls.recount()
+        return {
+            key: (stored[key], expected[key])
+            for key in stored.keys() | expected.keys()
+            if stored[key] != expected[key]
+        }
+
+
+class ChangeStamp(models.Model):
+    """
+    Licznik zmian danych w danym zakresie (np. produkty jednego właściciela).
+    Zwiększany przy każdej zmianie przez sygnały i operacje masowe (notify_changed
+    w signals.py); z niego liczone są nagłówki ETag / Last-Modified (patrz conditional.py).
+    """
+    scope = models.CharField(max_length=100, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=now)
+
+    @classmethod
+    def bump(cls, *scopes):
+        for scope in scopes:
+            if not cls.objects.filter(scope=scope).update(version=F('version') + 1, updated_at=now()):
+                cls.objects.get_or_create(scope=scope, defaults={'version': 1})
+
+    @classmethod
+    def read(cls, *scopes):
+        """
+        Zwraca {zakres: (wersja, czas zmiany)}; zakresy bez zmian mają wersję 0.
+        """
+        stamps = dict.fromkeys(scopes, (0, None))
+        stamps.update(
+            (scope, (version, updated_at))
+            for scope, version, updated_at in cls.objects.filter(scope__in=scopes)
+            .values_list('scope', 'version', 'updated_at')
+        )
+        return stamps
+
+    @classmethod
+    async def aread(cls, *scopes):
+        stamps = dict.fromkeys(scopes, (0, None))
+        async for scope, version, updated_at in (
+            cls.objects.filter(scope__in=scopes).values_list('scope', 'version', 'updated_at')
+        ):
+            stamps[scope] = (version, updated_at)
+        return stamps
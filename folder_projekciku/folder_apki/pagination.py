@@ -0,0 +1,188 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class SizedPagination(BasePagination):
+    """
+    Wspólna część paginatorów: rozmiar strony z parametru `page_size`
+    i odpowiedź w postaci {'next': ..., 'results': [...]}.
+    """
+    page_size_query_param = 'page_size'
+    page_size = 100
+    max_page_size = 1000
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_data(self, data):
+        return {'next': self.get_next_link(), 'results': data}
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+
+class KeysetPagination(SizedPagination):
+    """
+    Paginacja kluczowa (keyset) po krotce pól, np. ('name', 'id') albo ('-start_date', '-id').
+    Kursor koduje wartości ostatniego wiersza strony, więc kolejna strona
+    to zwykłe WHERE (name, id) > (...) LIMIT n - bez OFFSET i bez COUNT(*).
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Nieprawidłowy kursor.'
+
+    def __init__(self, ordering):
+        self.ordering = tuple(ordering)
+        self.fields = tuple(field.lstrip('-') for field in self.ordering)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request):
+        return self.set_page([row async for row in self.page_queryset(queryset, request)])
+
+    def page_queryset(self, queryset, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+
+        position = self.decode_cursor(queryset.model, request)
+        if position is not None:
+            queryset = queryset.filter(self.after(position))
+
+        # Jeden wiersz ponad stronę mówi, czy istnieje następna strona.
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, rows):
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        values = [getattr(last, field) for field in self.fields]
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(values))
+
+    def after(self, position):
+        """
+        Buduje warunek (a, b, c) > (x, y, z) jako sumę warunków leksykograficznych
+        (< dla pól malejących).
+        """
+        condition = Q()
+        for i, (field, ordering) in enumerate(zip(self.fields, self.ordering)):
+            equal = {self.fields[j]: position[j] for j in range(i)}
+            lookup = 'lt' if ordering.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{field}__{lookup}': position[i]})
+        return condition
+
+    def encode_cursor(self, values):
+        return encode_cursor(values)
+
+    def decode_cursor(self, model, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = decode_cursor(encoded)
+            if len(values) != len(self.fields):
+                raise ValueError
+            return [
+                model._meta.get_field(field).to_python(value)
+                for field, value in zip(self.fields, values)
+            ]
+        except (ValueError, TypeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class RankedPagination(SizedPagination):
+    """
+    Paginacja kluczowa wyników uszeregowanych według trafności. Kursor koduje parę
+    (ocena, id) ostatniego wyniku strony, a backend wyszukiwania zwraca wyniki po niej
+    (search.py) - bez OFFSET, więc dalsze strony nie są wolniejsze. Nie wykonuje COUNT(*).
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Nieprawidłowy kursor.'
+
+    def paginate_search(self, search, request):
+        """
+        `search(limit, after)` zwraca listę par (ocena, id); zwraca id bieżącej strony.
+        """
+        return self.set_page(search(**self.page_bounds(request)))
+
+    async def apaginate_search(self, search, request):
+        return self.set_page(await search(**self.page_bounds(request)))
+
+    def page_bounds(self, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        return {'limit': self.page_size + 1, 'after': self.decode_cursor(request)}
+
+    def set_page(self, ranked):
+        self.has_next = len(ranked) > self.page_size
+        self.page = ranked[:self.page_size]
+        return [pk for _, pk in self.page]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encode_cursor(list(self.page[-1])))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            rank, pk = decode_cursor(encoded)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(rank, (int, float, str)) or type(pk) is not int:
+            raise NotFound(self.invalid_cursor_message)
+        return rank, pk
+
+
+def encode_cursor(values):
+    # Pełna precyzja dat (DjangoJSONEncoder obcina mikrosekundy).
+    raw = json.dumps(values, default=lambda value: value.isoformat(), separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(encoded):
+    """
+    Lista wartości z kursora; ValueError, gdy kursor jest uszkodzony.
+    """
+    padded = encoded + '=' * (-len(encoded) % 4)
+    try:
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (TypeError, UnicodeDecodeError) as exc:
+        raise ValueError(exc)
+    if not isinstance(values, list):
+        raise ValueError('Kursor nie jest listą.')
+    return values
+
+
+def product_pagination():
+    # Zgodne z Product.Meta.ordering, uzupełnione o id dla jednoznaczności.
+    return KeysetPagination(ordering=('name', 'id'))
+
+
+def rental_pagination():
+    return KeysetPagination(ordering=('start_date', 'id'))
+
+
+def rental_history_pagination():
+    # Od najnowszych - historia jest zwykle przeglądana wstecz.
+    return KeysetPagination(ordering=('-start_date', '-id'))
@@ -0,0 +1,164 @@
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import F, Q, Case, When, Value
+from django.utils.timezone import now
+
+from .models import Product, Rental, RentalDailyStats
+from .availability import busy, intersects, is_free
+from .conditional import rentals_scope
+from .serializers import BulkRentalItemSerializer
+from .signals import notify_changed, occupy_products, release_products
+
+MAX_BATCH = 1000
+
+# Dozwolone przejścia statusu: nowy status -> wymagany status poprzedni.
+TRANSITIONS = {
+    'approved': 'pending',
+    'returned': 'approved',
+}
+
+
+class ProductUnavailable(Exception):
+    pass
+
+
+def lock_products(product_ids):
+    """
+    Zajmuje wiersze produktów do końca transakcji (blokada zapisu w SQLite, blokady wierszy
+    w PostgreSQL), więc rezerwacje jednego produktu są sprawdzane i zapisywane po kolei.
+    Zaczyna od zapisu - w SQLite nie ma ryzyka zakleszczenia przy podnoszeniu blokady odczytu.
+    Zwraca liczbę istniejących produktów.
+    """
+    return Product.objects.filter(pk__in=product_ids).update(updated_at=now())
+
+
+def reserve_product(user, product_id, start_date=None, end_date=None):
+    """
+    Atomowo rezerwuje produkt w przedziale [start_date, end_date) i tworzy oczekujące wypożyczenie.
+    Przedział nachodzący na inne wypożyczenie produktu (availability.py) daje ProductUnavailable;
+    z równoległych żądań o ten sam termin wygrywa dokładnie jedno.
+    """
+    start_date = start_date or now()
+    with transaction.atomic():
+        if not lock_products([product_id]) or not is_free(product_id, start_date, end_date):
+            raise ProductUnavailable('Produkt jest niedostępny.')
+        rental = Rental.objects.create(user=user, product_id=product_id, start_date=start_date, end_date=end_date)
+        occupy_products([product_id])
+    return rental
+
+
+def create_rentals(user, items):
+    """
+    Tworzy paczkę wypożyczeń użytkownika `user`, rezerwując ich produkty.
+    Walidacja pól jest lokalna; istnienie produktów i kolizje przedziałów sprawdzają dwa
+    zapytania, a poprawne pozycje są wstawiane jednym bulk_create w jednej transakcji.
+    Zwraca (utworzone wypożyczenia, [{'index': i, 'errors': {...}}]).
+    """
+    errors = []
+    valid = []
+    moment = now()
+    for index, item in enumerate(items):
+        serializer = BulkRentalItemSerializer(data=item)
+        if serializer.is_valid():
+            data = serializer.validated_data
+            valid.append((index, data['product'], data.get('start_date') or moment, data.get('end_date')))
+        else:
+            errors.append({'index': index, 'errors': serializer.errors})
+
+    rentals = _reserve_batch(user, valid, errors) if valid else []
+    errors.sort(key=lambda error: error['index'])
+    return rentals, errors
+
+
+def _reserve_batch(user, valid, errors):
+    """
+    Rezerwacja paczki w jednej transakcji: blokada produktów, jedno zapytanie o kolidujące
+    przedziały, bulk_create wypożyczeń i aktualizacja statystyk. Odrzucone pozycje dopisuje do `errors`.
+    """
+    with transaction.atomic():
+        product_ids = {product_id for _, product_id, _, _ in valid}
+        lock_products(product_ids)
+        categories = dict(Product.objects.filter(pk__in=product_ids).values_list('id', 'category_id'))
+        # Przedziały produktów paczki w oknie obejmującym wszystkie jej pozycje.
+        first = min(start for _, _, start, _ in valid)
+        last = None if any(end is None for _, _, _, end in valid) else max(end for _, _, _, end in valid)
+        taken = defaultdict(list)
+        for product_id, start, end in busy(first, last, product_ids).values_list('product_id', 'start_date', 'end_date'):
+            taken[product_id].append((start, end))
+
+        pending = {}
+        for index, product_id, start, end in valid:
+            if product_id not in categories:
+                errors.append({'index': index, 'errors': {'product': ['Produkt nie istnieje.']}})
+            elif product_id in pending:
+                errors.append({'index': index, 'errors': {'product': ['Produkt powtarza się w paczce.']}})
+            elif any(intersects(start, end, *interval) for interval in taken[product_id]):
+                errors.append({'index': index, 'errors': {'product': ['Produkt jest niedostępny.']}})
+            else:
+                pending[product_id] = (start, end)
+        if not pending:
+            return []
+
+        rentals = [
+            Rental(user=user, product_id=product_id, status='pending', start_date=start, end_date=end)
+            for product_id, (start, end) in pending.items()
+        ]
+        # bulk_create pomija Rental.save i sygnały, więc statystyki i znaczniki zmian aktualizujemy tu.
+        Rental.objects.bulk_create(rentals)
+        RentalDailyStats.bump(Counter(
+            RentalDailyStats.key(rental.start_date, rental.status, categories[rental.product_id])
+            for rental in rentals
+        ))
+        notify_changed(rentals_scope(user.pk))
+        occupy_products(pending)
+    return rentals
+
+
+def transition_rentals(ids, new_status):
+    """
+    Zmienia status paczki wypożyczeń (pending -> approved -> returned) jednym UPDATE.
+    Zwraca (id zmienionych wypożyczeń, [{'id': id, 'errors': [...]}]).
+    """
+    required = TRANSITIONS[new_status]
+    errors = []
+    with transaction.atomic():
+        rows = (
+            Rental.objects.select_for_update()
+            .filter(pk__in=ids)
+            .values_list('id', 'status', 'start_date', 'user_id', 'product__category', 'product_id')
+        )
+        found = {row[0]: row for row in rows}
+        changed = []
+        for pk in dict.fromkeys(ids):
+            row = found.get(pk)
+            if row is None:
+                errors.append({'id': pk, 'errors': ['Wypożyczenie nie istnieje.']})
+            elif row[1] != required:
+                errors.append({'id': pk, 'errors': [f'Niedozwolone przejście {row[1]} -> {new_status}.']})
+            else:
+                changed.append(row)
+
+        if changed:
+            change = {'status': new_status}
+            if new_status == 'returned':
+                # Zwrot kończy przedział zajętości (availability.py) najpóźniej teraz.
+                returned_at = now()
+                change['returned_at'] = returned_at
+                change['end_date'] = Case(
+                    When(Q(end_date__isnull=True) | Q(end_date__gt=returned_at), then=Value(returned_at)),
+                    default=F('end_date'),
+                )
+            Rental.objects.filter(pk__in=[row[0] for row in changed]).update(**change)
+            deltas = Counter()
+            for _, old_status, start_date, _, category_id, _ in changed:
+                deltas[RentalDailyStats.key(start_date, old_status, category_id)] -= 1
+                deltas[RentalDailyStats.key(start_date, new_status, category_id)] += 1
+            RentalDailyStats.bump(deltas)
+            notify_changed(*{rentals_scope(row[3]) for row in changed})
+            if new_status == 'returned':
+                # UPDATE pomija Rental.save i sygnały - produkty zwalniamy jak odbiornik post_save.
+                release_products([row[5] for row in changed])
+
+    return [row[0] for row in changed], errors
+
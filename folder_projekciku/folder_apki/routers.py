@@ -0,0 +1,148 @@
+import contextvars
+import hashlib
+import itertools
+import random
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PRIMARY = DEFAULT_DB_ALIAS
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def replicas():
+    """
+    Repliki do odczytu: {alias: waga} z FOLDER_APKI_READ_REPLICAS (puste - wszystko na primary).
+    """
+    configured = getattr(settings, 'FOLDER_APKI_READ_REPLICAS', {})
+    return {alias: weight for alias, weight in configured.items() if weight > 0}
+
+
+class ReplicaSelector:
+    """
+    Wybór repliki dla żądania: losowo z wagami ('weighted') albo po kolei,
+    każda tyle razy, ile wynosi jej waga ('round_robin') - FOLDER_APKI_REPLICA_SELECTION.
+    """
+    def __init__(self):
+        self.counter = itertools.count()
+
+    def choose(self):
+        weights = replicas()
+        if not weights:
+            return None
+        aliases = sorted(weights)
+        if getattr(settings, 'FOLDER_APKI_REPLICA_SELECTION', 'weighted') == 'round_robin':
+            ring = [alias for alias in aliases for _ in range(weights[alias])]
+            return ring[next(self.counter) % len(ring)]
+        return random.choices(aliases, weights=[weights[alias] for alias in aliases])[0]
+
+
+selector = ReplicaSelector()
+
+
+# ====================
+# Stan żądania
+# ====================
+class RoutingState:
+    """
+    Replika wybrana dla bieżącego żądania (None - primary) i czy żądanie coś zapisało.
+    """
+    def __init__(self, replica):
+        self.replica = replica
+        self.wrote = False
+
+
+# Ustawiana przez ReplicaRoutingMiddleware; przechodzi do wątków sync_to_async.
+# Poza żądaniem (komendy, testy, sygnały po odpowiedzi) brak stanu oznacza primary.
+_state = contextvars.ContextVar('folder_apki_db_routing', default=None)
+
+
+def begin(replica):
+    state = RoutingState(replica)
+    return state, _state.set(state)
+
+
+def end(token):
+    _state.reset(token)
+
+
+# ====================
+# Przyklejanie do primary po zapisie
+# ====================
+# Klient (token w Authorization albo ciasteczko sesji), który zapisał dane, przez
+# FOLDER_APKI_PRIMARY_STICKY_SECONDS czyta z primary - repliki mogą jeszcze nie mieć zmian.
+# Znacznik jest we wspólnym cache, więc działa między procesami.
+
+def pin_cache():
+    return caches[getattr(settings, 'FOLDER_APKI_PRIMARY_PIN_CACHE', 'default')]
+
+
+def credential_key(credential):
+    return hashlib.sha256(credential.encode()).hexdigest() if credential else None
+
+
+def client_keys(request, response=None):
+    credentials = [
+        request.META.get('HTTP_AUTHORIZATION'),
+        request.COOKIES.get(settings.SESSION_COOKIE_NAME),
+    ]
+    if response is not None and settings.SESSION_COOKIE_NAME in response.cookies:
+        # Nowa sesja (logowanie) - kolejne żądania przyjdą już z tym ciasteczkiem.
+        credentials.append(response.cookies[settings.SESSION_COOKIE_NAME].value)
+    return [key for key in map(credential_key, credentials) if key]
+
+
+def _pin_key(key):
+    return f'folder_apki:primary-pin:{key}'
+
+
+def sticky_seconds():
+    return getattr(settings, 'FOLDER_APKI_PRIMARY_STICKY_SECONDS', 5)
+
+
+def is_pinned(keys):
+    return bool(keys) and bool(pin_cache().get_many([_pin_key(key) for key in keys]))
+
+
+async def ais_pinned(keys):
+    return bool(keys) and bool(await pin_cache().aget_many([_pin_key(key) for key in keys]))
+
+
+def pin(keys):
+    if keys and sticky_seconds():
+        pin_cache().set_many({_pin_key(key): True for key in keys}, sticky_seconds())
+
+
+async def apin(keys):
+    if keys and sticky_seconds():
+        await pin_cache().aset_many({_pin_key(key): True for key in keys}, sticky_seconds())
+
+
+class ReplicaRouter:
+    """
+    Router baz: zapisy zawsze na primary (`default`), odczyty na replikę wybraną
+    przez ReplicaRoutingMiddleware dla żądań GET/HEAD/OPTIONS. Na primary czyta się
+    poza żądaniem, w transakcji, po zapisie w tym samym żądaniu i przez okno
+    przyklejenia po zapisie tego samego klienta.
+    """
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.replica is None or state.wrote:
+            return PRIMARY
+        if connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Repliki mają te same dane co primary.
+        aliases = {PRIMARY, *replicas()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
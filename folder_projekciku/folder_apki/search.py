@@ -0,0 +1,247 @@
+import re
+import unicodedata
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import CharField, Func, Q, Value
+from django.db.models.functions import Lower, Replace
+from django.utils.module_loading import import_string
+
+from .models import Product
+
+# Litery, których NFKD nie rozkłada na literę bazową + znak diakrytyczny.
+EXTRA_FOLDING = str.maketrans({'ł': 'l', 'Ł': 'L', 'ß': 'ss', 'ø': 'o', 'Ø': 'O'})
+TOKEN_RE = re.compile(r'\w+')
+
+
+def fold(text):
+    """
+    Zamienia tekst na małe litery bez znaków diakrytycznych ("Dostępny" -> "dostepny").
+    """
+    text = text or ''
+    if text.isascii():
+        return text.lower()
+    text = unicodedata.normalize('NFKD', text.translate(EXTRA_FOLDING))
+    return ''.join(ch for ch in text if not unicodedata.combining(ch)).lower()
+
+
+def tokenize(query):
+    return TOKEN_RE.findall(fold(query))
+
+
+# Małe litery z Latin-1 i Latin Extended-A, które fold() zmienia - dla baz bez funkcji fold w SQL.
+FOLD_TABLE = {
+    ch: fold(ch) for ch in map(chr, range(0xC0, 0x180))
+    if ch == ch.lower() and fold(ch) != ch
+}
+
+
+class Fold(Func):
+    """
+    fold() w SQL. W SQLite to funkcja Pythona rejestrowana w każdym połączeniu
+    (install_fold_function), w pozostałych bazach TRANSLATE(LOWER(...)) liter z FOLD_TABLE.
+    """
+    function = 'folder_apki_fold'
+    arity = 1
+    output_field = CharField()
+
+    def as_sql(self, compiler, connection, **extra_context):
+        single = {char: folded for char, folded in FOLD_TABLE.items() if len(folded) == 1}
+        expression = Func(
+            Lower(self.source_expressions[0]), Value(''.join(single)), Value(''.join(single.values())),
+            function='TRANSLATE', output_field=CharField(),
+        )
+        for char, folded in FOLD_TABLE.items():
+            if len(folded) != 1:
+                expression = Replace(expression, Value(char), Value(folded))
+        return compiler.compile(expression)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        # Domyślne kolacje MySQL (utf8mb4_0900_ai_ci) same ignorują znaki diakrytyczne.
+        return compiler.compile(Lower(self.source_expressions[0]))
+
+
+def install_fold_function(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        connection.connection.create_function(Fold.function, 1, fold, deterministic=True)
+
+
+class SearchBackend:
+    """
+    Interfejs indeksu wyszukiwania produktów.
+    """
+    def index_products(self, products):
+        raise NotImplementedError
+
+    def remove_products(self, ids):
+        raise NotImplementedError
+
+    def rebuild(self, batch_size=5000):
+        raise NotImplementedError
+
+    def search(self, query, user, limit):
+        """
+        Zwraca listę id produktów widocznych dla `user`, od najlepiej dopasowanych.
+        """
+        return [pk for _, pk in self.ranked(query, user, limit)]
+
+    def ranked(self, query, user, limit, after=None):
+        """
+        Jak search(), ale zwraca pary (ocena, id) w kolejności wyników; `after` - para
+        ostatniego wyniku poprzedniej strony (kursor RankedPagination).
+        """
+        raise NotImplementedError
+
+    async def aranked(self, query, user, limit, after=None):
+        # Surowe SQL nie ma async API w Django - zapytanie idzie do wątku.
+        return await sync_to_async(self.ranked)(query, user, limit, after)
+
+    def index_category(self, category, batch_size=1000):
+        # Paczkami - kategoria może mieć więcej produktów, niż warto trzymać w pamięci.
+        products = (
+            Product.objects.filter(category=category)
+            .select_related('category')
+            .only('id', 'name', 'description', 'category__name')
+            .order_by()
+            .iterator(chunk_size=batch_size)
+        )
+        while batch := list(islice(products, batch_size)):
+            self.index_products(batch)
+
+
+class LikeSearchBackend(SearchBackend):
+    """
+    Rezerwowy backend dla baz bez FTS5: LIKE po nazwie, opisie i kategorii, bez indeksu.
+    Teksty i słowa zapytania przechodzą przez `fold()` jak w SQLiteFTSBackend,
+    więc oba backendy znajdują te same produkty; wyniki są uszeregowane po nazwie.
+    """
+    def index_products(self, products):
+        pass
+
+    def remove_products(self, ids):
+        pass
+
+    def index_category(self, category, batch_size=1000):
+        pass
+
+    def rebuild(self, batch_size=5000):
+        return 0
+
+    def ranked(self, query, user, limit, after=None):
+        return list(self.matching(query, user, after)[:limit])
+
+    async def aranked(self, query, user, limit, after=None):
+        return [row async for row in self.matching(query, user, after)[:limit]]
+
+    def matching(self, query, user, after=None):
+        tokens = tokenize(query)
+        if not tokens:
+            return Product.objects.none().values_list('name', 'id')
+        products = Product.objects.visible_to(user).annotate(
+            folded_name=Fold('name'), folded_description=Fold('description'), folded_category=Fold('category__name'),
+        )
+        for token in tokens:
+            products = products.filter(
+                Q(folded_name__contains=token) | Q(folded_description__contains=token)
+                | Q(folded_category__contains=token)
+            )
+        if after is not None:
+            products = products.filter(Q(name__gt=after[0]) | Q(name=after[0], id__gt=after[1]))
+        return products.order_by('name', 'id').values_list('name', 'id')
+
+
+class SQLiteFTSBackend(SearchBackend):
+    """
+    Indeks pełnotekstowy w tabeli wirtualnej FTS5 (rowid = id produktu).
+    Teksty są zapisywane po `fold()`, więc wyszukiwanie ignoruje polskie znaki.
+    """
+    table = 'folder_apki_product_fts'
+
+    def row(self, product):
+        return (product.pk, fold(product.name), fold(product.description), fold(product.category.name))
+
+    def index_products(self, products):
+        rows = [self.row(product) for product in products]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(row[0],) for row in rows])
+            self.insert(cursor, rows)
+
+    def remove_products(self, ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(pk,) for pk in ids])
+
+    def rebuild(self, batch_size=5000):
+        products = (
+            Product.objects.select_related('category')
+            .only('id', 'name', 'description', 'category__name')
+            .order_by()
+            .iterator(chunk_size=batch_size)
+        )
+        count = 0
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            batch = []
+            for product in products:
+                batch.append(self.row(product))
+                if len(batch) == batch_size:
+                    self.insert(cursor, batch)
+                    count += len(batch)
+                    batch = []
+            self.insert(cursor, batch)
+            count += len(batch)
+            cursor.execute(f"INSERT INTO {self.table} ({self.table}) VALUES ('optimize')")
+        return count
+
+    def insert(self, cursor, rows):
+        if rows:
+            cursor.executemany(
+                f'INSERT INTO {self.table} (rowid, name, description, category) VALUES (%s, %s, %s, %s)',
+                rows,
+            )
+
+    def match_expression(self, query):
+        # Każde słowo jako prefiks ("dost" znajdzie "Dostępny"); słowa łączone przez AND.
+        return ' '.join(f'"{token}"*' for token in tokenize(query))
+
+    def ranked(self, query, user, limit, after=None):
+        expression = self.match_expression(query)
+        if not expression:
+            return []
+        # Nazwa waży więcej niż kategoria i opis (bm25 z wagami kolumn; mniejsza ocena - lepiej).
+        matches = (
+            f'SELECT p.id, bm25({self.table}, 10.0, 1.0, 2.0) AS score FROM {self.table} '
+            f'JOIN {Product._meta.db_table} p ON p.id = {self.table}.rowid '
+            f'WHERE {self.table} MATCH %s'
+        )
+        params = [expression]
+        if not user.is_staff:
+            matches += ' AND p.owner_id = %s'
+            params.append(user.pk)
+        sql = f'SELECT score, id FROM ({matches}) ranked'
+        if after is not None:
+            sql += ' WHERE score > %s OR (score = %s AND id > %s)'
+            params += [after[0], after[0], after[1]]
+        sql += ' ORDER BY score, id LIMIT %s'
+        params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+
+def get_backend():
+    """
+    Backend z ustawienia FOLDER_APKI_SEARCH_BACKEND albo domyślny dla bazy danych.
+    """
+    path = getattr(settings, 'FOLDER_APKI_SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    if connection.vendor == 'sqlite':
+        return SQLiteFTSBackend()
+    return LikeSearchBackend()
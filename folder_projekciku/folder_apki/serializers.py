@@ -1,5 +1,6 @@
+from django.utils.timezone import now
 from rest_framework import serializers
-from .models import User, Category, Product, Rental
+from .models import User, Category, Product, Rental, ArchivedRental
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -22,4 +23,41 @@ class ProductSerializer(serializers.ModelSerializer):
 class RentalSerializer(serializers.ModelSerializer):
     class Meta:
         model = Rental
-        fields = ['id', 'user', 'product', 'status']
+        fields = ['id', 'user', 'product', 'status', 'end_date']
+        # Nowe wypożyczenie zawsze oczekuje (reserve_product); status zmienia admin.
+        read_only_fields = ['status']
+
+    def validate_end_date(self, value):
+        # Nowe wypożyczenie zaczyna się teraz (reserve_product).
+        if value is not None and value <= now():
+            raise serializers.ValidationError('Koniec wypożyczenia musi być w przyszłości.')
+        return value
+
+class ArchivedRentalSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ArchivedRental
+        fields = ['id', 'user', 'product', 'status', 'start_date', 'end_date', 'returned_at', 'archived_at']
+
+class BulkRentalItemSerializer(serializers.Serializer):
+    # Produkt jako zwykła liczba - istnienie i kolizje przedziałów sprawdza się dla całej paczki naraz.
+    product = serializers.IntegerField(min_value=1)
+    # Status zmienia tylko admin (rental_bulk_status_view) - paczka tworzy wyłącznie oczekujące.
+    status = serializers.ChoiceField(choices=['pending'], default='pending')
+    start_date = serializers.DateTimeField(required=False)
+    end_date = serializers.DateTimeField(required=False)
+
+    def validate_start_date(self, value):
+        # Wsteczna data ominęłaby kontrolę nakładania się przedziałów i zafałszowała statystyki.
+        if value < now():
+            raise serializers.ValidationError('Początek wypożyczenia nie może być w przeszłości.')
+        return value
+
+    def validate(self, attrs):
+        end_date = attrs.get('end_date')
+        if end_date is not None and end_date <= (attrs.get('start_date') or now()):
+            raise serializers.ValidationError({'end_date': ['Koniec wypożyczenia musi być po jego początku.']})
+        return attrs
+
+class BulkRentalTransitionSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=1000)
+    status = serializers.ChoiceField(choices=['approved', 'returned'])
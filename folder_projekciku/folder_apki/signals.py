@@ -0,0 +1,193 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models import Exists, OuterRef
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils.timezone import now
+from rest_framework.authtoken.models import Token
+
+from . import caching
+from .authentication import forget_tokens
+from .conditional import rentals_scope
+from .middleware import install_query_recorder
+from .models import User, Category, Product, Rental, ArchivedRental, RentalDailyStats, CategoryOwnerStats, ChangeStamp
+from .search import get_backend, install_fold_function
+
+
+# ====================
+# Indeks wyszukiwania
+# ====================
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, **kwargs):
+    if not raw:
+        get_backend().index_products([instance])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    get_backend().remove_products([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def reindex_category(sender, instance, created=False, raw=False, **kwargs):
+    # Nowa kategoria nie ma jeszcze produktów.
+    if not created and not raw:
+        get_backend().index_category(instance)
+
+
+connection_created.connect(install_fold_function, dispatch_uid='folder_apki_fold_function')
+
+
+# ====================
+# Statystyki wypożyczeń
+# ====================
+@receiver(post_delete, sender=Rental)
+@receiver(post_delete, sender=ArchivedRental)
+def rental_deleted(sender, instance, **kwargs):
+    # Sygnał (a nie Rental.delete), bo obejmuje też usuwanie kaskadowe produktu;
+    # kolektor wykonuje je w transakcji razem z aktualizacją statystyk.
+    RentalDailyStats.bump(Counter({instance.stats_key(): -1}))
+
+
+# ====================
+# Zwalnianie produktów
+# ====================
+def release_products(product_ids):
+    """
+    Udostępnia ponownie produkty, których nie zajmuje już żadne niezwrócone wypożyczenie,
+    i aktualizuje liczniki kategorii oraz znaczniki zmian ich list.
+    Wywoływać także po operacjach masowych na wypożyczeniach (transition_rentals).
+    """
+    active = Rental.objects.filter(product=OuterRef('pk')).exclude(status='returned')
+    released = Product.objects.filter(pk__in=product_ids, is_available=False).exclude(Exists(active))
+    rows = list(released.values_list('id', 'category_id', 'owner_id'))
+    if not rows:
+        return
+    Product.objects.filter(pk__in=[row[0] for row in rows]).update(is_available=True, updated_at=now())
+    CategoryOwnerStats.bump(CategoryOwnerStats.reservation_deltas(((row[1], row[2]) for row in rows), sign=-1))
+    notify_products_changed({row[2] for row in rows})
+
+
+def occupy_products(product_ids):
+    """
+    Odwrotność release_products po rezerwacji: produkty z niezwróconym wypożyczeniem
+    przestają być dostępne; aktualizuje liczniki kategorii i znaczniki zmian ich list.
+    """
+    rows = list(Product.objects.filter(pk__in=product_ids).values_list('id', 'is_available', 'category_id', 'owner_id'))
+    occupied = [row for row in rows if row[1]]
+    if occupied:
+        Product.objects.filter(pk__in=[row[0] for row in occupied]).update(is_available=False)
+        CategoryOwnerStats.bump(CategoryOwnerStats.reservation_deltas((row[2], row[3]) for row in occupied))
+    notify_products_changed({row[3] for row in rows})
+
+
+@receiver(post_save, sender=Rental)
+def release_returned_product(sender, instance, raw=False, **kwargs):
+    # Zwrot przez Rental.save (np. w panelu admina) - jak w transition_rentals.
+    previous = getattr(instance, '_previous_status', None)
+    if not raw and previous not in (None, 'returned') and instance.status == 'returned':
+        release_products([instance.product_id])
+
+
+@receiver(pre_delete, sender=Product)
+def mark_deleted_product(sender, instance, origin=None, **kwargs):
+    # Wypożyczenia usuwanego produktu znikają razem z nim (kaskada) - jego się nie zwalnia,
+    # a product_deleted liczy go jako niedostępny. Znacznik żyje tyle, co ta operacja usuwania.
+    if origin is not None:
+        origin.__dict__.setdefault('_deleted_products', set()).add(instance.pk)
+
+
+@receiver(post_delete, sender=Rental)
+def release_deleted_rental_product(sender, instance, origin=None, **kwargs):
+    # Obejmuje usuwanie bezpośrednie i kaskadowe (np. użytkownika z wypożyczeniami cudzych produktów).
+    if instance.status != 'returned' and instance.product_id not in getattr(origin, '_deleted_products', ()):
+        release_products([instance.product_id])
+
+
+# ====================
+# Liczniki produktów w kategoriach
+# ====================
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    # Jak rental_deleted: obejmuje usuwanie kaskadowe (kategorii, właściciela).
+    CategoryOwnerStats.bump(Counter({instance.stats_key(): -1}))
+
+
+# ====================
+# Cache odpowiedzi i znaczniki zmian (ETag)
+# ====================
+def notify_changed(*scopes):
+    """
+    Podbija znaczniki zmian zakresów (ETag) i unieważnia ich cache odpowiedzi i walidatorów.
+    Cache jest unieważniany od razu i ponownie po zatwierdzeniu transakcji - równoległe
+    żądanie mogło w międzyczasie zapisać w nim stan sprzed zmiany.
+    Wywoływać także po operacjach masowych, które pomijają sygnały.
+    """
+    ChangeStamp.bump(*scopes)
+    caching.invalidate(*scopes)
+    transaction.on_commit(lambda: caching.invalidate(*scopes))
+
+
+def notify_products_changed(owner_ids):
+    """
+    notify_changed dla list produktów admina i podanych właścicieli.
+    """
+    notify_changed('products:all', *(f'products:owner:{owner_id}' for owner_id in owner_ids))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_responses(sender, instance, **kwargs):
+    owner_ids = {instance.owner_id, getattr(instance, '_previous_owner_id', None)} - {None}
+    notify_products_changed(owner_ids)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_responses(sender, instance, **kwargs):
+    notify_changed(caching.category_scope(instance.pk))
+
+
+@receiver(pre_save, sender=User)
+def invalidate_user_responses(sender, instance, update_fields=None, **kwargs):
+    # `owner_role` jest częścią odpowiedzi produktów; zmiana roli lub aktywności je unieważnia.
+    if instance._state.adding or (update_fields is not None and not {'role', 'is_active'} & set(update_fields)):
+        return
+    previous = User.objects.filter(pk=instance.pk).values_list('role', 'is_active').first()
+    if previous != (instance.role, instance.is_active):
+        notify_products_changed([instance.pk])
+        instance._credentials_changed = True
+
+
+@receiver(post_save, sender=Rental)
+@receiver(post_delete, sender=Rental)
+@receiver(post_delete, sender=ArchivedRental)
+def bump_rental_stamp(sender, instance, **kwargs):
+    notify_changed(rentals_scope(instance.user_id))
+
+
+# ====================
+# Cache tokenów (authentication.py)
+# ====================
+# Po zatwierdzeniu transakcji - inaczej równoległe żądanie mogłoby zapisać w cache stary stan.
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    # Klucz jest kluczem głównym - po usunięciu Django ustawia go na None.
+    keys = [instance.key]
+    transaction.on_commit(lambda: forget_tokens(keys))
+
+
+@receiver(post_save, sender=User)
+def forget_user_tokens(sender, instance, **kwargs):
+    if getattr(instance, '_credentials_changed', False):
+        instance._credentials_changed = False
+        keys = list(Token.objects.filter(user=instance).values_list('key', flat=True))
+        transaction.on_commit(lambda: forget_tokens(keys))
+
+
+# ====================
+# Pomiary zapytań
+# ====================
+connection_created.connect(install_query_recorder, dispatch_uid='folder_apki_query_recorder')
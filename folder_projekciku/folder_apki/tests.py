@@ -1,3 +1,1912 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import gzip
+import importlib
+import json
+import os
+import threading
+import time
+import unittest
+from collections import Counter
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.template import engines
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import ResolverMatch, reverse
+from django.utils.timezone import now
+from django.utils.translation import gettext_lazy
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from . import benchmark, compression, fastjson, routers
+from .admin import EstimatedCountPaginator, estimated_count
+from .archive import archivable, archive_rentals
+from .availability import calendar, free_products, is_free
+from .authentication import LRUCache, clear_token_cache, token_cache_stats
+from .asyncapi import JSONResponse
+from .caching import cache_stats, coalesced
+from .fastjson import FastJSONRenderer
+from .throttling import clear_buckets, throttle_stats
+from .models import User, Category, Product, Rental, ArchivedRental, RentalDailyStats, CategoryOwnerStats
+from .imports import import_products
+from .compression import choose_encoding
+from .middleware import CompressionMiddleware, PerformanceMiddleware
+from .rentals import ProductUnavailable, reserve_product, transition_rentals
+from .search import get_backend
+from .signals import notify_products_changed
+
+
+def seed_products(owner, category, count, **extra):
+    """
+    Tworzy `count` produktów jednym zapytaniem bulk_create.
+    """
+    products = Product.objects.bulk_create(
+        Product(name=f'Produkt {i:06d}', description='Opis', category=category, owner=owner, **extra)
+        for i in range(count)
+    )
+    # bulk_create pomija Product.save i sygnały, więc liczniki, cache i znaczniki zmian trzeba odświeżyć ręcznie.
+    CategoryOwnerStats.bump(Counter(product.stats_key() for product in products))
+    notify_products_changed([owner.pk])
+
+
+def run_data_migration(migration, function):
+    """
+    Uruchamia krok RunPython migracji na bieżących danych - jak migrate na bazie sprzed zmiany.
+    """
+    getattr(importlib.import_module(f'folder_apki.migrations.{migration}'), function)(apps, None)
+
+
+# Zapytania walidatorów ETag/Last-Modified po zmianie danych (odczyt znaczników zmian,
+# potem są w cache), patrz conditional.py.
+VALIDATOR_QUERIES = 1
+
+
+class ApiTestCase(TestCase):
+    """
+    Czyści cache przed każdym testem - baza jest cofana po teście, cache nie.
+    """
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        clear_token_cache()
+        clear_buckets()
+
+
+class ProductQueryCountTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user('admin', password='haslo', role='adminki')
+        self.user = User.objects.create_user('user', password='haslo')
+        self.category = Category.objects.create(name='Książki')
+        self.client = APIClient()
+
+    def assert_constant_queries(self, url, user, counts=(10, 10000)):
+        self.client.force_authenticate(user)
+        seeded = 0
+        for count in counts:
+            seed_products(user, self.category, count - seeded)
+            seeded = count
+            with self.assertNumQueries(VALIDATOR_QUERIES + 1):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), min(count, 100))
+
+    def test_product_list_admin(self):
+        self.assert_constant_queries(reverse('product-list'), self.admin)
+
+    def test_product_list_user(self):
+        self.assert_constant_queries(reverse('product-list'), self.user)
+
+    def test_product_search(self):
+        # Zapytanie do indeksu pełnotekstowego + pobranie strony produktów.
+        self.client.force_authenticate(self.admin)
+        url = reverse('product-search', args=['Produkt'])
+        for count in (10, 10000):
+            Product.objects.all().delete()
+            seed_products(self.user, self.category, count)
+            call_command('rebuild_search_index', stdout=StringIO())
+            with self.assertNumQueries(VALIDATOR_QUERIES + 2):
+                response = self.client.get(url)
+            self.assertEqual(len(response.data['results']), min(count, 100))
+
+    def test_category_products(self):
+        # Jedno dodatkowe zapytanie sprawdza istnienie kategorii.
+        self.client.force_authenticate(self.user)
+        url = reverse('category-products', args=[self.category.pk])
+        for count in (10, 10000):
+            Product.objects.all().delete()
+            seed_products(self.user, self.category, count)
+            with self.assertNumQueries(VALIDATOR_QUERIES + 2):
+                response = self.client.get(url)
+            self.assertEqual(len(response.data), count)
+
+    def test_serializer_shape(self):
+        seed_products(self.user, self.category, 1)
+        self.client.force_authenticate(self.user)
+        product = self.client.get(reverse('product-list')).data['results'][0]
+        self.assertEqual(product['owner'], 'user')
+        self.assertEqual(product['owner_role'], 'user')
+        self.assertEqual(product['category'], self.category.pk)
+
+
+class KeysetPaginationTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('user', password='haslo')
+        self.category = Category.objects.create(name='Filmy')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def collect(self, url, page_size):
+        ids, pages = [], 0
+        url = f'{url}?page_size={page_size}'
+        while url:
+            # Od drugiej strony znaczniki zmian są już w cache.
+            with self.assertNumQueries(1 if pages else VALIDATOR_QUERIES + 1):
+                response = self.client.get(url)
+            ids += [row['id'] for row in response.data['results']]
+            url = response.data['next']
+            pages += 1
+        return ids, pages
+
+    def test_products_walk_all_pages_with_duplicate_names(self):
+        Product.objects.bulk_create(
+            Product(name=f'Produkt {i % 3}', description='Opis', category=self.category, owner=self.user)
+            for i in range(25)
+        )
+        ids, pages = self.collect(reverse('product-list'), 10)
+        expected = list(Product.objects.order_by('name', 'id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+        self.assertEqual(pages, 3)
+
+    def test_rentals_walk_all_pages_with_equal_start_dates(self):
+        seed_products(self.user, self.category, 1)
+        product = Product.objects.get()
+        Rental.objects.bulk_create(
+            Rental(user=self.user, product=product, start_date=now().replace(microsecond=i % 2))
+            for i in range(7)
+        )
+        ids, pages = self.collect(reverse('rental-list'), 3)
+        expected = list(Rental.objects.order_by('start_date', 'id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+        self.assertEqual(pages, 3)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('product-list'), {'cursor': 'nie-kursor'})
+        self.assertEqual(response.status_code, 404)
+
+
+class IndexUsageTests(ApiTestCase):
+    """
+    Sprawdza plan zapytań SQLite (EXPLAIN QUERY PLAN) dla filtrów używanych w widokach.
+    Liczbę wierszy można zwiększyć zmienną FOLDER_APKI_EXPLAIN_ROWS (np. 1000000).
+    """
+    rows = int(os.environ.get('FOLDER_APKI_EXPLAIN_ROWS', 20000))
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owners = User.objects.bulk_create(User(username=f'user{i}') for i in range(20))
+        cls.categories = Category.objects.bulk_create(Category(name=f'Kategoria {i}') for i in range(10))
+        batch = []
+        for i in range(cls.rows):
+            batch.append(Product(
+                name=f'Produkt {i:07d}', description='Opis',
+                category=cls.categories[i % 10], owner=cls.owners[i % 20], is_available=i % 4 != 0,
+            ))
+            if len(batch) == 10000:
+                Product.objects.bulk_create(batch)
+                batch = []
+        Product.objects.bulk_create(batch)
+        product = Product.objects.first()
+        Rental.objects.bulk_create(
+            Rental(user=cls.owners[i % 20], product=product, start_date=now() - datetime.timedelta(hours=i))
+            for i in range(cls.rows // 10)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+
+    def test_owner_available(self):
+        user = self.owners[3]
+        products = Product.objects.for_listing().visible_to(user).filter(is_available=True).order_by('name', 'id')
+        self.assertUsesIndex(products, 'product_owner_avail_idx')
+
+    def test_category_owner_available(self):
+        products = Product.objects.filter(category=self.categories[2], owner=self.owners[2], is_available=True)
+        self.assertUsesIndex(products.order_by('name', 'id'), 'product_cat_owner_avail_idx')
+
+    def test_admin_listing_order(self):
+        products = Product.objects.filter(is_available=True).order_by('name', 'id')[:100]
+        self.assertUsesIndex(products, 'product_avail_name_idx')
+
+    def test_rentals_of_user(self):
+        rentals = Rental.objects.filter(user=self.owners[5]).order_by('start_date', 'id')
+        self.assertUsesIndex(rentals, 'rental_user_start_idx')
+
+    def test_monthly_report_range(self):
+        start = now() - datetime.timedelta(days=3)
+        rentals = Rental.objects.filter(start_date__gte=start, start_date__lt=now())
+        self.assertUsesIndex(rentals.values('start_date__date'), 'rental_start_date_idx')
+
+
+class ProductSearchTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('user', password='haslo')
+        self.other = User.objects.create_user('other', password='haslo')
+        self.category = Category.objects.create(name='Książki')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create(self, name, description='Opis', owner=None):
+        return Product.objects.create(
+            name=name, description=description, category=self.category, owner=owner or self.user
+        )
+
+    def search(self, query):
+        response = self.client.get(reverse('product-search', args=[query]))
+        self.assertEqual(response.status_code, 200)
+        return [row['name'] for row in response.data['results']]
+
+    def test_prefix_and_diacritics(self):
+        self.create('Dostępny laptop')
+        self.create('Łódka')
+        self.assertEqual(self.search('dostep'), ['Dostępny laptop'])
+        self.assertEqual(self.search('DOSTĘ'), ['Dostępny laptop'])
+        self.assertEqual(self.search('lodk'), ['Łódka'])
+
+    def test_description_category_and_ranking(self):
+        self.create('Zwykły film', description='Laptop w opisie')
+        self.create('Laptop gamingowy')
+        self.assertEqual(self.search('laptop'), ['Laptop gamingowy', 'Zwykły film'])
+        self.assertEqual(len(self.search('ksiazki')), 2)
+
+    def test_visibility_and_sync(self):
+        own = self.create('Rower miejski')
+        self.create('Rower górski', owner=self.other)
+        self.assertEqual(self.search('rower'), ['Rower miejski'])
+
+        own.name = 'Hulajnoga'
+        own.save()
+        self.assertEqual(self.search('rower'), [])
+        self.category.name = 'Pojazdy'
+        self.category.save()
+        self.assertEqual(self.search('pojazd'), ['Hulajnoga'])
+        own.delete()
+        self.assertEqual(self.search('hulajnoga'), [])
+
+    def pages(self, query, page_size):
+        names = []
+        url = reverse('product-search', args=[query]) + f'?page_size={page_size}'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            names.append([row['name'] for row in response.data['results']])
+            url = response.data['next']
+        return names
+
+    def test_pagination(self):
+        for i in range(5):
+            self.create(f'Gra {i}', description='gra ' * (i % 2))
+        pages = self.pages('gra', page_size=2)
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual(sum(pages, []), self.search('gra'))
+        self.assertEqual(self.client.get(reverse('product-search', args=['gra']), {'cursor': 'zly'}).status_code, 404)
+
+    @override_settings(FOLDER_APKI_SEARCH_BACKEND='folder_apki.search.LikeSearchBackend')
+    def test_like_backend_folds_like_fts(self):
+        self.create('Dostępny laptop')
+        self.create('Łódka', description='Żaglówka')
+        self.create('Rower górski', owner=self.other)
+        self.assertEqual(self.search('dostep'), ['Dostępny laptop'])
+        self.assertEqual(self.search('DOSTĘ'), ['Dostępny laptop'])
+        self.assertEqual(self.search('lodk zaglowka'), ['Łódka'])
+        self.assertEqual(self.search('KSIĄŻKI'), ['Dostępny laptop', 'Łódka'])
+        self.assertEqual(self.search('gorski'), [])
+        self.assertEqual(self.pages('ksiazki', page_size=1), [['Dostępny laptop'], ['Łódka']])
+
+
+class RentalDailyStatsTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user('admin', password='haslo', role='adminki')
+        self.books = Category.objects.create(name='Książki')
+        self.films = Category.objects.create(name='Filmy')
+        self.book = Product.objects.create(name='Lalka', description='Opis', category=self.books, owner=self.admin)
+        self.film = Product.objects.create(name='Rejs', description='Opis', category=self.films, owner=self.admin)
+
+    def assertConsistent(self):
+        self.assertEqual(RentalDailyStats.mismatches(), {})
+
+    def test_create_update_delete(self):
+        rental = Rental.objects.create(user=self.admin, product=self.book)
+        Rental.objects.create(user=self.admin, product=self.film, start_date=now() - datetime.timedelta(days=400))
+        self.assertConsistent()
+
+        rental.status = 'approved'
+        rental.save()
+        rental.product = self.film
+        rental.start_date -= datetime.timedelta(days=1)
+        rental.save()
+        self.assertConsistent()
+
+        rental.delete()
+        self.book.delete()
+        self.films.delete()
+        self.assertConsistent()
+        self.assertFalse(RentalDailyStats.objects.exclude(count=0).exists())
+
+    def test_report_reads_current_month_only(self):
+        Rental.objects.create(user=self.admin, product=self.book)
+        Rental.objects.create(user=self.admin, product=self.film)
+        # Ten sam miesiąc rok temu nie może trafić do raportu.
+        Rental.objects.create(user=self.admin, product=self.book, start_date=now() - datetime.timedelta(days=365))
+
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        with self.assertNumQueries(1):
+            response = client.get(reverse('monthly-report'))
+        self.assertEqual(response.data, [{'start_date__date': now().date(), 'count': 2}])
+
+    def test_rebuild_and_check_command(self):
+        Rental.objects.create(user=self.admin, product=self.book)
+        Rental.objects.filter(product=self.book).update(status='returned')
+        with self.assertRaises(CommandError):
+            call_command('rebuild_rental_stats', check=True, stdout=StringIO(), stderr=StringIO())
+        call_command('rebuild_rental_stats', stdout=StringIO())
+        call_command('rebuild_rental_stats', check=True, stdout=StringIO())
+
+
+class ResponseCacheTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user('admin', password='haslo', role='adminki')
+        self.user = User.objects.create_user('user', password='haslo')
+        self.category = Category.objects.create(name='Laptopy')
+        self.product = Product.objects.create(
+            name='ThinkPad', description='Opis', category=self.category, owner=self.user
+        )
+        self.client = APIClient()
+
+    def get(self, user, url):
+        self.client.force_authenticate(user)
+        return self.client.get(url)
+
+    def test_second_read_is_served_from_cache(self):
+        url = reverse('product-detail', args=[self.product.pk])
+        before = cache_stats()
+        with self.assertNumQueries(VALIDATOR_QUERIES + 1):
+            self.assertEqual(self.get(self.user, url)['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = self.get(self.user, url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.data['name'], 'ThinkPad')
+        after = cache_stats()
+        self.assertEqual((after['hits'] - before['hits'], after['misses'] - before['misses']), (1, 1))
+
+    def test_product_change_invalidates_owner_and_admin(self):
+        url = reverse('product-list')
+        self.get(self.user, url)
+        self.get(self.admin, url)
+        self.product.name = 'Latitude'
+        self.product.save()
+        for user in (self.user, self.admin):
+            response = self.get(user, url)
+            self.assertEqual(response['X-Cache'], 'MISS')
+            self.assertEqual(response.data['results'][0]['name'], 'Latitude')
+
+    def test_ownership_change_invalidates_previous_owner(self):
+        url = reverse('product-list')
+        self.assertEqual(len(self.get(self.user, url).data['results']), 1)
+        self.product.owner = self.admin
+        self.product.save()
+        self.assertEqual(self.get(self.user, url).data['results'], [])
+
+    def test_role_change_invalidates(self):
+        url = reverse('product-list')
+        self.get(self.admin, url)
+        self.user.role = 'adminki'
+        self.user.save()
+        self.assertEqual(self.get(self.admin, url).data['results'][0]['owner_role'], 'adminki')
+
+    def test_category_delete_invalidates(self):
+        url = reverse('category-products', args=[self.category.pk])
+        self.assertEqual(self.get(self.user, url).status_code, 200)
+        self.category.delete()
+        self.assertEqual(self.get(self.user, url).status_code, 404)
+
+    def test_users_do_not_share_entries(self):
+        url = reverse('product-detail', args=[self.product.pk])
+        self.assertEqual(self.get(self.user, url).status_code, 200)
+        other = User.objects.create_user('other', password='haslo')
+        self.assertEqual(self.get(other, url).status_code, 404)
+
+
+class ConditionalGetTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('user', password='haslo')
+        self.category = Category.objects.create(name='Gry')
+        self.product = Product.objects.create(
+            name='Szachy', description='Opis', category=self.category, owner=self.user
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_unchanged_list_returns_304_without_loading_rows(self):
+        url = reverse('product-list')
+        response = self.client.get(url)
+        self.assertIn('Last-Modified', response)
+        # Znaczniki zmian są już w cache - 304 bez żadnego zapytania.
+        with self.assertNumQueries(0):
+            self.assertEqual(self.revalidate(url, response).status_code, 304)
+        modified_since = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(modified_since.status_code, 304)
+
+    def test_edit_and_bulk_insert_change_etag(self):
+        url = reverse('product-list')
+        response = self.client.get(url)
+        self.product.description = 'Nowy opis'
+        self.product.save()
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+        response = self.client.get(url)
+        # Operacje masowe (import, paczki wypożyczeń) zgłaszają zmianę jak seed_products.
+        seed_products(self.user, self.category, 1)
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    def test_pages_have_distinct_etags(self):
+        url = reverse('product-list')
+        self.assertNotEqual(self.client.get(url)['ETag'], self.client.get(url, {'page_size': 1})['ETag'])
+
+    def test_representations_have_distinct_etags(self):
+        url = reverse('product-list')
+        json_response = self.client.get(url)
+        html = self.client.get(url, HTTP_ACCEPT='text/html', HTTP_IF_NONE_MATCH=json_response['ETag'])
+        self.assertEqual(html.status_code, 200)
+        self.assertNotEqual(html['ETag'], json_response['ETag'])
+        for response in (json_response, html, self.revalidate(url, json_response)):
+            self.assertIn('Accept', response['Vary'])
+
+    def test_rentals(self):
+        url = reverse('rental-list')
+        rental = Rental.objects.create(user=self.user, product=self.product)
+        response = self.client.get(url)
+        self.assertEqual(self.revalidate(url, response).status_code, 304)
+        rental.status = 'approved'
+        rental.save()
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+
+class BulkRentalTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user('admin', password='haslo', role='adminki')
+        self.user = User.objects.create_user('user', password='haslo')
+        self.category = Category.objects.create(name='Laptopy')
+        seed_products(self.admin, self.category, 50)
+        self.products = list(Product.objects.order_by('id'))
+        self.client = APIClient()
+
+    def post(self, user, name, data):
+        self.client.force_authenticate(user)
+        return self.client.post(reverse(name), data, format='json')
+
+    def test_bulk_create_in_constant_queries(self):
+        # Pierwsza paczka zakłada wiersz statystyk dnia; kolejni użytkownicy mają świeże znaczniki zmian.
+        self.post(self.admin, 'rental-bulk', [{'product': self.products[0].pk}])
+        other = User.objects.create_user('other', password='haslo')
+        queries = []
+        for user, products in ((other, self.products[1:6]), (self.user, self.products[6:])):
+            with CaptureQueriesContext(connection) as context:
+                response = self.post(user, 'rental-bulk', [{'product': product.pk} for product in products])
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(len(response.data['created']), len(products))
+            queries.append(len(context))
+        self.assertEqual(queries[0], queries[1])
+        self.assertEqual(Rental.objects.filter(user=self.user).count(), 44)
+        self.assertFalse(Product.objects.filter(is_available=True).exists())
+        self.assertEqual(RentalDailyStats.mismatches(), {})
+
+    def test_bulk_create_reports_item_errors(self):
+        unavailable = self.products[1]
+        reserve_product(self.admin, unavailable.pk)
+        items = [
+            {'product': self.products[0].pk},
+            {'product': unavailable.pk},
+            {'product': 999999},
+            {'product': self.products[0].pk},
+            {'status': 'zly'},
+            {'product': self.products[2].pk, 'status': 'approved'},
+            {'product': self.products[3].pk, 'start_date': (now() - datetime.timedelta(days=1)).isoformat()},
+        ]
+        response = self.post(self.user, 'rental-bulk', items)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['created']), 1)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2, 3, 4, 5, 6])
+        self.assertEqual(set(response.data['errors'][4]['errors']), {'status'})
+        self.assertEqual(set(response.data['errors'][5]['errors']), {'start_date'})
+        self.assertTrue(Product.objects.get(pk=self.products[3].pk).is_available)
+
+    def test_bulk_transitions(self):
+        created = self.post(self.user, 'rental-bulk', [{'product': p.pk} for p in self.products[:3]]).data['created']
+        ids = [rental['id'] for rental in created]
+
+        self.assertEqual(self.post(self.user, 'rental-bulk-status', {'ids': ids, 'status': 'approved'}).status_code, 403)
+        response = self.post(self.admin, 'rental-bulk-status', {'ids': ids[:2], 'status': 'approved'})
+        self.assertEqual(response.data, {'updated': ids[:2], 'errors': []})
+
+        response = self.post(self.admin, 'rental-bulk-status', {'ids': ids, 'status': 'returned'})
+        self.assertEqual(response.data['updated'], ids[:2])
+        self.assertEqual([error['id'] for error in response.data['errors']], [ids[2]])
+        self.assertEqual(RentalDailyStats.mismatches(), {})
+
+
+class ReservationTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('user', password='haslo')
+        self.category = Category.objects.create(name='Rowery')
+        self.product = Product.objects.create(name='Kross', description='Opis', category=self.category, owner=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_second_reservation_conflicts(self):
+        url = reverse('rental-list')
+        self.assertEqual(self.client.post(url, {'product': self.product.pk}, format='json').status_code, 201)
+        self.assertEqual(self.client.post(url, {'product': self.product.pk}, format='json').status_code, 409)
+        self.product.refresh_from_db()
+        self.assertFalse(self.product.is_available)
+        self.assertEqual(Rental.objects.count(), 1)
+
+    def test_return_releases_product(self):
+        rental = reserve_product(self.user, self.product.pk)
+        transition_rentals([rental.pk], 'approved')
+        transition_rentals([rental.pk], 'returned')
+        self.product.refresh_from_db()
+        self.assertTrue(self.product.is_available)
+
+    def assertReleased(self, product, released=True):
+        product.refresh_from_db()
+        self.assertEqual(product.is_available, released)
+        self.assertEqual(CategoryOwnerStats.mismatches(), {})
+
+    def test_client_cannot_choose_status(self):
+        response = self.client.post(reverse('rental-list'), {'product': self.product.pk, 'status': 'returned'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['status'], 'pending')
+        self.assertReleased(self.product, released=False)
+
+    def test_admin_return_and_delete_release_product(self):
+        rental = reserve_product(self.user, self.product.pk)
+        rental.status = 'approved'
+        rental.save()
+        self.assertReleased(self.product, released=False)
+        rental.status = 'returned'
+        rental.save()
+        self.assertReleased(self.product)
+
+        rental = reserve_product(self.user, self.product.pk)
+        rental.delete()
+        self.assertReleased(self.product)
+
+    def test_cascade_delete_releases_other_products(self):
+        other = User.objects.create_user('other', password='haslo')
+        borrowed = Product.objects.create(name='Romet', description='Opis', category=self.category, owner=other)
+        reserve_product(self.user, borrowed.pk)
+        reserve_product(other, self.product.pk)
+        # Usunięcie użytkownika usuwa jego produkty z wypożyczeniami i jego wypożyczenia cudzych produktów.
+        self.user.delete()
+        self.assertReleased(borrowed)
+        self.assertFalse(Product.objects.filter(pk=self.product.pk).exists())
+        self.assertEqual(RentalDailyStats.mismatches(), {})
+
+
+class ConcurrentReservationTests(TransactionTestCase):
+    """
+    Wątki rezerwują równolegle te same produkty na bazie testowej
+    (pełny test: manage.py stress_reservations na bazie plikowej lub PostgreSQL).
+    """
+    def test_no_double_booking(self):
+        out = StringIO()
+        call_command('stress_reservations', threads=4, products=5, attempts=10, stdout=out)
+        self.assertIn('podwójne rezerwacje 0', out.getvalue())
+
+
+class ExportTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user('admin', password='haslo', role='adminki')
+        self.category = Category.objects.create(name='Płyty')
+        seed_products(self.admin, self.category, 1200)
+        self.end_date = now().replace(microsecond=0) + datetime.timedelta(days=3)
+        reserve_product(self.admin, Product.objects.first().pk, end_date=self.end_date)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_csv_products_stream(self):
+        response = self.client.get(reverse('export-products', args=['csv']))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,name,description,category_id,category,is_available,date_added,owner,owner_role')
+        self.assertEqual(len(lines), 1201)
+        self.assertIn(',Płyty,', lines[1])
+
+    def test_ndjson_rentals_stream(self):
+        response = self.client.get(reverse('export-rentals', args=['ndjson']))
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['user'], 'admin')
+        self.assertEqual(rows[0]['category'], 'Płyty')
+        self.assertEqual(datetime.datetime.fromisoformat(rows[0]['end_date']), self.end_date)
+        self.assertIsNone(rows[0]['returned_at'])
+
+    def test_csv_rentals_stream(self):
+        Rental.objects.update(status='returned', returned_at=self.end_date)
+        response = self.client.get(reverse('export-rentals', args=['csv']))
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,user,product_id,product,category,status,start_date,end_date,returned_at')
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].endswith(2 * f',{self.end_date}'))
+
+    def test_admin_only_and_unknown_format(self):
+        self.assertEqual(self.client.get(reverse('export-products', args=['xml'])).status_code, 400)
+        self.client.force_authenticate(User.objects.create_user('user', password='haslo'))
+        self.assertEqual(self.client.get(reverse('export-products', args=['csv'])).status_code, 403)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('export_data', 'products', format='ndjson', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 1200)
+
+
+class ProductImportTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user('admin', password='haslo', role='adminki')
+        Category.objects.create(name='Książki')
+
+    def csv_file(self, rows):
+        lines = ['name,description,category,owner,is_available']
+        lines += [','.join(row) for row in rows]
+        return StringIO('\n'.join(lines) + '\n')
+
+    def test_batches_use_constant_queries(self):
+        rows = [(f'Książka {i}', 'Opis', 'Książki', 'admin', 'tak') for i in range(300)]
+        with CaptureQueriesContext(connection) as small:
+            import_products(self.csv_file(rows[:10]), 'csv', batch_size=1000)
+        with CaptureQueriesContext(connection) as large:
+            report = import_products(self.csv_file(rows), 'csv', batch_size=1000)
+        self.assertEqual(report.imported, 300)
+        self.assertLessEqual(len(large), len(small) + 2)
+        self.assertEqual(len(get_backend().search('ksiazka 299', self.admin, 10)), 1)
+
+    def test_validation_errors_and_resume(self):
+        rows = [
+            ('Pan Tadeusz', 'Epopeja', 'Książki', 'admin', '1'),
+            ('AB', 'Za krótka nazwa', 'Książki', 'admin', '1'),
+            ('Lalka', ' ', 'Nieznana', 'nikt', '1'),
+            ('Quo Vadis', 'Powieść', 'Książki', 'admin', '0'),
+        ]
+        report = import_products(self.csv_file(rows), 'csv', offset=1, batch_size=2)
+        self.assertEqual(report.imported, 1)
+        self.assertEqual(report.next_offset, 4)
+        self.assertEqual([error['row'] for error in report.errors], [1, 2])
+        self.assertEqual(len(report.errors[1]['errors']), 3)
+        self.assertFalse(Product.objects.filter(name='Pan Tadeusz').exists())
+        self.assertFalse(Product.objects.get(name='Quo Vadis').is_available)
+
+    def test_upload_endpoint_jsonl(self):
+        content = '\n'.join(json.dumps({
+            'name': f'Film {i}', 'description': 'Opis', 'category': 'Książki', 'owner': 'admin',
+        }) for i in range(5))
+        upload = SimpleUploadedFile('produkty.jsonl', content.encode())
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.post(reverse('product-import'), {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['imported'], 5)
+        self.assertEqual(response.data['next_offset'], 5)
+
+    def test_malformed_rows_are_reported(self):
+        lines = [
+            json.dumps({'name': 'Film 0', 'description': 'Opis', 'category': 'Książki', 'owner': 'admin'}),
+            '{"name": "Zepsuty',
+            '["nie", "obiekt"]',
+            json.dumps({'name': ['Film'], 'description': 7, 'category': 'Książki', 'owner': 'admin'}),
+            json.dumps({'name': 'Film 4', 'description': 'Opis', 'category': {'id': 1}, 'owner': 'admin'}),
+            json.dumps({'name': 'Film 5', 'description': 'Opis', 'category': 'Książki', 'owner': 'admin'}),
+        ]
+        report = import_products(StringIO('\n'.join(lines)), 'jsonl', batch_size=4)
+        self.assertEqual((report.imported, report.failed, report.next_offset), (2, 4, 6))
+        self.assertEqual([error['row'] for error in report.errors], [1, 2, 3, 4])
+        self.assertIn('JSON', report.errors[0]['errors'][0])
+        self.assertEqual(len(report.errors[2]['errors']), 2)
+
+    def test_null_availability_and_ambiguous_categories(self):
+        Category.objects.create(name='Filmy')
+        Category.objects.create(name='Filmy')
+        lines = [
+            json.dumps({'name': 'Film 0', 'description': 'Opis', 'category': 'Książki', 'owner': 'admin', 'is_available': None}),
+            json.dumps({'name': 'Film 1', 'description': 'Opis', 'category': 'Filmy', 'owner': 'admin'}),
+        ]
+        report = import_products(StringIO('\n'.join(lines)), 'jsonl')
+        self.assertEqual((report.imported, report.failed), (1, 1))
+        self.assertTrue(Product.objects.get(name='Film 0').is_available)
+        self.assertEqual(report.errors[0]['row'], 1)
+        self.assertIn('niejednoznaczna', report.errors[0]['errors'][0])
+
+    def test_unreadable_file_keeps_progress(self):
+        content = ''.join(
+            json.dumps({'name': f'Film {i}', 'description': 'Opis', 'category': 'Książki', 'owner': 'admin'}) + '\n'
+            for i in range(3)
+        ).encode() + b'\xff\xfe\n' * 5000
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        upload = SimpleUploadedFile('produkty.jsonl', content)
+        response = client.post(reverse('product-import'), {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.data)
+        self.assertEqual(response.data['next_offset'], 0)
+
+
+class BenchmarkHarnessTests(ApiTestCase):
+    def test_every_route_runs_and_regressions_are_flagged(self):
+        users = benchmark.seed(users=3, categories=2, products=60, rentals=30)
+        results = benchmark.run(requests=2, users=users)
+        self.assertEqual(results['meta']['missing_routes'], [])
+        for name, result in results['routes'].items():
+            self.assertTrue(all(200 <= code < 300 for code in result['statuses']), (name, result))
+
+        slower = json.loads(json.dumps(results))
+        slower['routes']['product-list']['queries_per_request'] *= 3
+        self.assertEqual(len(benchmark.compare(slower, results)), 1)
+
+
+class PerformanceMiddlewareTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user('admin', password='haslo', role='adminki')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_server_timing_and_metrics(self):
+        response = self.client.get(reverse('product-list'))
+        self.assertRegex(response['Server-Timing'], r'total;dur=[\d.]+;desc="product_view", db;dur=[\d.]+;desc="\d+ queries"')
+
+        metrics = self.client.get(reverse('metrics'))
+        self.assertEqual(metrics.status_code, 200)
+        body = metrics.content.decode()
+        self.assertIn('folder_apki_request_duration_seconds_count{view="product_view"}', body)
+        self.assertIn('folder_apki_db_queries_total{view="product_view"}', body)
+        self.assertIn('folder_apki_response_cache_total{result="miss"}', body)
+
+    def test_duplicate_and_slow_queries_are_logged(self):
+        def view(request):
+            for _ in range(5):
+                list(User.objects.filter(pk=self.admin.pk))
+            return HttpResponse('ok')
+
+        middleware = PerformanceMiddleware(view)
+        request = RequestFactory().get('/')
+        request.resolver_match = ResolverMatch(view, (), {})
+        with override_settings(FOLDER_APKI_SLOW_QUERY_MS=0), self.assertLogs('folder_apki.performance') as logs:
+            middleware(request)
+        messages = '\n'.join(logs.output)
+        self.assertIn('Możliwe N+1 w view: 5×', messages)
+        self.assertIn('folder_apki/tests.py', messages)
+        self.assertIn('Wolne zapytanie', messages)
+
+    def test_call_site_only_for_reported_queries(self):
+        def view(request):
+            for pk in range(20):
+                list(User.objects.filter(pk=pk).values_list('id', flat=True)[:pk + 1])
+            for _ in range(5):
+                list(User.objects.filter(pk=self.admin.pk))
+            return HttpResponse('ok')
+
+        middleware = PerformanceMiddleware(view)
+        request = RequestFactory().get('/')
+        request.resolver_match = ResolverMatch(view, (), {})
+        with mock.patch('folder_apki.middleware.call_site', return_value='tu') as call_site:
+            with self.assertLogs('folder_apki.performance'):
+                middleware(request)
+        # 20 różnych zapytań bez stosu, jedno powtarzane - raz, przy osiągnięciu progu.
+        self.assertEqual(call_site.call_count, 1)
+
+
+class AsyncViewTests(ApiTestCase):
+    """
+    Widoki async zwracają te same bajty co widoki sync i nie dotykają bazy synchronicznie
+    (SynchronousOnlyOperation przerwałby test).
+    """
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('jan', password='haslo')
+        self.category = Category.objects.create(name='Narzędzia')
+        seed_products(self.user, self.category, 30)
+        self.product = Product.objects.filter(owner=self.user).first()
+        self.rental = reserve_product(self.user, self.product.pk)
+        self.headers = {'Authorization': f'Token {Token.objects.create(user=self.user).key}'}
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=self.headers['Authorization'])
+
+    async def test_same_content_as_sync_views(self):
+        routes = [
+            ('product-list', [], '?page_size=10'),
+            ('product-detail', [self.product.pk], ''),
+            ('category-products', [self.category.pk], ''),
+            ('rental-list', [], ''),
+            ('rental-detail', [self.rental.pk], ''),
+            ('product-search', ['produkt'], '?page_size=5'),
+        ]
+        for name, args, query in routes:
+            sync_response = await self.client_get(reverse(name, args=args) + query)
+            response = await self.async_client.get(reverse(f'async-{name}', args=args) + query, headers=self.headers)
+            self.assertEqual(response.status_code, 200, name)
+            self.assertEqual(response['Content-Type'], 'application/json')
+            # Linki `next` wskazują na własną ścieżkę widoku.
+            self.assertEqual(
+                response.content.replace(b'/async/', b'/'), sync_response.content, name,
+            )
+
+    async def client_get(self, path):
+        return await sync_to_async(self.client.get)(path)
+
+    async def test_authentication_and_errors(self):
+        response = await self.async_client.get(reverse('async-product-list'))
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Token')
+
+        response = await self.async_client.get(reverse('async-product-list'), headers={'Authorization': 'Token zly'})
+        self.assertEqual(response.status_code, 401)
+
+        response = await self.async_client.post(reverse('async-rental-list'), headers=self.headers)
+        self.assertEqual(response.status_code, 405)
+
+        response = await self.async_client.get(reverse('async-product-detail', args=[10 ** 9]), headers=self.headers)
+        self.assertEqual(response.status_code, 404)
+
+        response = await self.async_client.get(reverse('async-product-list') + '?cursor=zly', headers=self.headers)
+        self.assertEqual(response.status_code, 404)
+
+    async def test_cache_and_conditional_get(self):
+        path = reverse('async-product-list')
+        first = await self.async_client.get(path, headers=self.headers)
+        second = await self.async_client.get(path, headers=self.headers)
+        self.assertEqual((first['X-Cache'], second['X-Cache']), ('MISS', 'HIT'))
+        self.assertEqual(first.content, second.content)
+
+        not_modified = await self.async_client.get(path, headers={**self.headers, 'If-None-Match': first['ETag']})
+        self.assertEqual(not_modified.status_code, 304)
+
+    async def test_session_authentication(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('async-rental-list'))
+        self.assertEqual(response.status_code, 200)
+
+
+class DeploymentBenchmarkTests(TransactionTestCase):
+    """
+    Porównanie WSGI/ASGI wywołuje handlery w wielu wątkach i zadaniach, więc dane muszą być zatwierdzone.
+    """
+    def test_both_deployments_serve_every_route(self):
+        users = benchmark.seed(users=2, categories=2, products=40, rentals=20)
+        key = Token.objects.get(user=users['user']).key
+        results = benchmark.compare_deployments(
+            benchmark.deployment_paths(users), {'Authorization': f'Token {key}'}, connections=3, requests=6,
+        )
+        self.assertEqual(set(results['routes']), set(benchmark.ASYNC_ROUTES))
+        for name, result in results['routes'].items():
+            self.assertEqual(result['wsgi']['statuses'], {200: 6}, name)
+            self.assertEqual(result['asgi']['statuses'], {200: 6}, name)
+
+
+class TokenCacheTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('jan', password='haslo')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def token_queries(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        return response, [q['sql'] for q in queries if 'authtoken_token' in q['sql']]
+
+    def test_token_lookup_is_cached(self):
+        before = token_cache_stats()
+        response, lookups = self.token_queries(reverse('rental-list'))
+        self.assertEqual((response.status_code, len(lookups)), (200, 1))
+        response, lookups = self.token_queries(reverse('rental-list'))
+        self.assertEqual((response.status_code, len(lookups)), (200, 0))
+
+        # Inny proces (pusty lokalny LRU) korzysta ze wspólnego cache.
+        clear_token_cache()
+        response, lookups = self.token_queries(reverse('rental-list'))
+        self.assertEqual((response.status_code, len(lookups)), (200, 0))
+
+        after = token_cache_stats()
+        self.assertEqual(after['misses'] - before['misses'], 1)
+        self.assertEqual(after['local_hits'] - before['local_hits'], 1)
+        self.assertEqual(after['shared_hits'] - before['shared_hits'], 1)
+
+    async def test_async_views_share_the_cache(self):
+        headers = {'Authorization': f'Token {self.token.key}'}
+        await sync_to_async(self.client.get)(reverse('rental-list'))
+        before = token_cache_stats()
+        response = await self.async_client.get(reverse('async-rental-list'), headers=headers)
+        self.assertEqual(response.status_code, 200)
+        after = token_cache_stats()
+        self.assertEqual((after['misses'], after['local_hits']), (before['misses'], before['local_hits'] + 1))
+
+    def test_deleted_token_is_rejected(self):
+        self.assertEqual(self.client.get(reverse('rental-list')).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token.delete()
+        self.assertEqual(self.client.get(reverse('rental-list')).status_code, 401)
+
+    def test_role_and_activity_changes_invalidate(self):
+        self.assertEqual(self.client.get(reverse('monthly-report')).status_code, 403)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.role = 'adminki'
+            self.user.save()
+        self.assertEqual(self.client.get(reverse('monthly-report')).status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.client.get(reverse('rental-list')).status_code, 401)
+
+    def test_lru_size_and_ttl(self):
+        lru = LRUCache(max_size=2, ttl=60)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertEqual((lru.get('a'), lru.get('b'), lru.get('c')), (1, None, 3))
+
+        lru.ttl = -1
+        lru.set('d', 4)
+        self.assertIsNone(lru.get('d'))
+
+    def test_hit_ratio_metric(self):
+        admin = User.objects.create_user('admin', password='haslo', role='adminki')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=admin).key}')
+        self.client.get(reverse('metrics'))
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('folder_apki_token_cache_total{result="local_hit"}', body)
+        self.assertRegex(body, r'folder_apki_token_cache_hit_ratio 0\.\d{4}')
+
+
+class CategoryCounterTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user('admin', password='haslo', role='adminki')
+        self.user = User.objects.create_user('jan', password='haslo')
+        self.tools = Category.objects.create(name='Narzędzia')
+        self.games = Category.objects.create(name='Gry')
+        seed_products(self.user, self.tools, 5)
+        seed_products(self.admin, self.tools, 3)
+
+    def counts(self, category):
+        category.refresh_from_db()
+        return category.product_count, category.available_count
+
+    def test_product_save_and_delete(self):
+        product = Product.objects.create(name='Wiertarka', description='Opis', category=self.games, owner=self.user)
+        self.assertEqual(self.counts(self.games), (1, 1))
+
+        product.is_available = False
+        product.save()
+        self.assertEqual(self.counts(self.games), (1, 0))
+
+        product.category = self.tools
+        product.owner = self.admin
+        product.save()
+        self.assertEqual((self.counts(self.games), self.counts(self.tools)), ((0, 0), (9, 8)))
+
+        product.delete()
+        self.assertEqual(self.counts(self.tools), (8, 8))
+        self.assertEqual(CategoryOwnerStats.mismatches(), {})
+
+    def test_saving_stale_category_keeps_counters(self):
+        stale = Category.objects.get(pk=self.games.pk)
+        Product.objects.create(name='Szachy', description='Opis', category=self.games, owner=self.user)
+        stale.description = 'Planszówki'
+        stale.save()
+        self.assertEqual(self.counts(self.games), (1, 1))
+        self.assertEqual(self.games.description, 'Planszówki')
+
+    def test_bulk_paths_keep_counters_consistent(self):
+        ids = list(Product.objects.filter(owner=self.user).values_list('id', flat=True))
+        rental = reserve_product(self.user, ids[0])
+        client = APIClient()
+        client.force_authenticate(self.user)
+        client.post(reverse('rental-bulk'), [{'product': ids[1]}], format='json')
+        self.assertEqual(self.counts(self.tools), (8, 6))
+
+        Rental.objects.filter(pk=rental.pk).update(status='approved')
+        transition_rentals([rental.pk], 'returned')
+        import_products(StringIO('name,description,category,owner\nNowy,Opis,Gry,jan\n'), 'csv')
+        self.assertEqual(self.counts(self.tools), (8, 7))
+        self.assertEqual(self.counts(self.games), (1, 1))
+        self.assertEqual(CategoryOwnerStats.mismatches(), {})
+
+        self.user.delete()
+        self.assertEqual(self.counts(self.tools), (3, 3))
+        self.assertEqual(CategoryOwnerStats.mismatches(), {})
+
+    def test_summary_endpoint(self):
+        Product.objects.filter(owner=self.user).first().delete()
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with self.assertNumQueries(1):
+            response = client.get(reverse('category-summary'))
+        self.assertEqual(response.data, [
+            {'id': self.games.pk, 'name': 'Gry', 'product_count': 0, 'available_count': 0},
+            {'id': self.tools.pk, 'name': 'Narzędzia', 'product_count': 4, 'available_count': 4},
+        ])
+
+        client.force_authenticate(self.admin)
+        response = client.get(reverse('category-summary'))
+        self.assertEqual([row['product_count'] for row in response.data], [0, 7])
+
+    def test_summary_projection(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(reverse('category-summary'), {'fields': 'name,available_count'})
+        self.assertEqual(response.data, [
+            {'name': 'Gry', 'available_count': 0},
+            {'name': 'Narzędzia', 'available_count': 5},
+        ])
+        self.assertNotIn('"total"', queries[-1]['sql'])
+
+        client.force_authenticate(self.admin)
+        response = client.get(reverse('category-summary'), {'exclude': 'id,name'})
+        self.assertEqual(response.data, [
+            {'product_count': 0, 'available_count': 0},
+            {'product_count': 8, 'available_count': 8},
+        ])
+        response = client.get(reverse('category-summary'), {'fields': 'owner'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_repair_command(self):
+        Product.objects.filter(owner=self.user).update(is_available=False)
+        with self.assertRaises(CommandError):
+            call_command('repair_category_counters', check=True, stdout=StringIO(), stderr=StringIO())
+        call_command('repair_category_counters', stdout=StringIO())
+        self.assertEqual(CategoryOwnerStats.mismatches(), {})
+        self.assertEqual(self.counts(self.tools), (8, 3))
+
+
+class HtmlRenderingTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('jan', password='haslo')
+        self.category = Category.objects.create(name='Książki')
+        seed_products(self.user, self.category, 150)
+        self.client.force_login(self.user)
+
+    def test_list_is_paginated(self):
+        response = self.client.get(reverse('product-list-html'))
+        self.assertEqual(response.content.count(b'<tr>') - 1, 100)
+        next_link = response.context['next']
+        self.assertIn('cursor=', next_link)
+        response = self.client.get(next_link)
+        self.assertEqual(response.content.count(b'<tr>') - 1, 50)
+        self.assertIsNone(response.context['next'])
+
+    def test_fragments_are_cached_and_refreshed_on_change(self):
+        path = reverse('product-list-html')
+        with CaptureQueriesContext(connection) as cold:
+            self.client.get(path)
+        with CaptureQueriesContext(connection) as warm:
+            response = self.client.get(path)
+        # Trafienie w fragment strony pomija zapytanie o pełne wiersze.
+        self.assertEqual(len(warm), len(cold) - 1)
+
+        product = Product.objects.order_by('name', 'id').first()
+        product.description = 'Nowy opis'
+        product.save()
+        response = self.client.get(path)
+        self.assertContains(response, 'Nowy opis')
+
+        reserve_product(self.user, product.pk)
+        self.assertNotContains(self.client.get(path), product.name + '<')
+
+    def test_detail_fragment_follows_product_changes(self):
+        product = Product.objects.first()
+        path = reverse('product-detail-html', args=[product.pk])
+        self.assertContains(self.client.get(path), 'Dostępność: Dostępny')
+        reserve_product(self.user, product.pk)
+        self.assertContains(self.client.get(path), 'Dostępność: Niedostępny')
+
+    def test_cached_template_loader_is_enabled(self):
+        loaders = engines['django'].engine.template_loaders
+        self.assertEqual([type(loader).__module__ for loader in loaders], ['django.template.loaders.cached'])
+
+
+class RentalArchiveTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('jan', password='haslo')
+        self.other = User.objects.create_user('ola', password='haslo')
+        self.category = Category.objects.create(name='Narzędzia')
+        seed_products(self.user, self.category, 6)
+        products = list(Product.objects.order_by('id'))
+        old = now() - datetime.timedelta(days=400)
+        # Trzy dawno zwrócone, jedno zwrócone niedawno, jedno aktywne i jedno cudze sprzed pola returned_at
+        # (uzupełnione przez migrację 0013).
+        self.old = [
+            Rental.objects.create(user=self.user, product=product, status='returned', start_date=old, returned_at=old)
+            for product in products[:3]
+        ]
+        self.recent = Rental.objects.create(user=self.user, product=products[3], status='returned')
+        self.active = Rental.objects.create(user=self.user, product=products[4], status='approved', start_date=old)
+        self.legacy = Rental.objects.create(user=self.other, product=products[5], status='returned', start_date=old)
+        Rental.objects.filter(pk=self.legacy.pk).update(returned_at=None)
+        run_data_migration('0013_rental_archive', 'backfill_returned_at')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_moves_old_returned_rentals_in_batches(self):
+        stats = list(RentalDailyStats.objects.order_by('id').values_list('date', 'status', 'count'))
+        self.assertEqual(archive_rentals(batch_size=2, max_batches=1), 2)
+        self.assertEqual(archive_rentals(batch_size=2), 2)
+        self.assertEqual(archive_rentals(batch_size=2), 0)
+
+        self.assertEqual(
+            set(ArchivedRental.objects.values_list('id', flat=True)),
+            {rental.pk for rental in self.old} | {self.legacy.pk},
+        )
+        self.assertEqual(set(Rental.objects.values_list('id', flat=True)), {self.recent.pk, self.active.pk})
+        # Statystyki liczą archiwum, więc przeniesienie ich nie zmienia.
+        self.assertEqual(list(RentalDailyStats.objects.order_by('id').values_list('date', 'status', 'count')), stats)
+        self.assertEqual(RentalDailyStats.mismatches(), {})
+
+    def test_legacy_rows_use_returned_index(self):
+        self.legacy.refresh_from_db()
+        self.assertEqual(self.legacy.returned_at, self.legacy.start_date)
+        self.assertFalse(Rental.objects.filter(status='returned', returned_at__isnull=True).exists())
+        self.assertIn('rental_returned_idx', archivable().explain())
+
+    def test_transition_sets_returned_at(self):
+        transition_rentals([self.active.pk], 'returned')
+        self.active.refresh_from_db()
+        self.assertIsNotNone(self.active.returned_at)
+        self.assertEqual(archive_rentals(), 4)
+        self.assertTrue(Rental.objects.filter(pk=self.active.pk).exists())
+
+    def test_rental_list_and_history(self):
+        archive_rentals()
+        response = self.client.get(reverse('rental-list'))
+        self.assertEqual([row['id'] for row in response.data['results']], [self.active.pk, self.recent.pk])
+
+        response = self.client.get(reverse('rental-history'), {'page_size': 2})
+        first = [row['id'] for row in response.data['results']]
+        response = self.client.get(response.data['next'])
+        second = [row['id'] for row in response.data['results']]
+        self.assertIsNone(response.data['next'])
+        # Od najnowszych; przy tej samej dacie początku - malejąco po id.
+        self.assertEqual(first + second, sorted((rental.pk for rental in self.old), reverse=True))
+
+    def test_history_etag_changes_after_archiving(self):
+        response = self.client.get(reverse('rental-history'))
+        self.assertEqual(response.data['results'], [])
+        etag = response['ETag']
+        self.assertEqual(self.client.get(reverse('rental-history'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        archive_rentals()
+        response = self.client.get(reverse('rental-history'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_deleting_product_removes_archived_rental_from_stats(self):
+        archive_rentals()
+        self.old[0].product.delete()
+        self.assertFalse(ArchivedRental.objects.filter(pk=self.old[0].pk).exists())
+        self.assertEqual(RentalDailyStats.mismatches(), {})
+
+    def test_command(self):
+        out = StringIO()
+        call_command('archive_rentals', dry_run=True, stdout=out)
+        self.assertIn('4', out.getvalue())
+        call_command('archive_rentals', days=0, batch_size=10, stdout=StringIO())
+        self.assertEqual(list(Rental.objects.values_list('id', flat=True)), [self.active.pk])
+
+
+class AdminChangelistTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser('admin', password='haslo', role='adminki')
+        self.client.force_login(self.admin)
+        self.categories = [Category.objects.create(name=f'Kategoria {i}') for i in range(3)]
+
+    def grow(self, count):
+        owner = User.objects.create_user(f'wlasciciel-{User.objects.count()}', password='haslo')
+        for category in self.categories:
+            seed_products(owner, category, count)
+        Rental.objects.bulk_create(
+            Rental(user=owner, product=product) for product in Product.objects.filter(owner=owner)
+        )
+
+    def changelist_queries(self, model):
+        url = reverse(f'admin:folder_apki_{model}_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        for model in ('product', 'rental', 'archivedrental'):
+            self.grow(2)
+            small = self.changelist_queries(model)
+            self.grow(20)
+            self.assertEqual(self.changelist_queries(model), small, model)
+
+    def test_unfiltered_count_uses_table_statistics(self):
+        self.grow(10)
+        # Indeksy częściowe dostępnych produktów mają w statystykach mniej wierszy niż tabela.
+        unavailable = list(Product.objects.values_list('id', flat=True)[:27])
+        Product.objects.filter(pk__in=unavailable).update(is_available=False)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.assertEqual(estimated_count(Product.objects.all()), 30)
+        # Wiersze dodane po ANALYZE nie zmieniają szacunku - dowód, że nie było COUNT(*).
+        self.grow(10)
+        url = reverse('admin:folder_apki_product_changelist')
+        with mock.patch.object(EstimatedCountPaginator, 'exact_below', 1):
+            self.assertEqual(self.client.get(url).context['cl'].result_count, 30)
+            filtered = self.client.get(url, {'is_available__exact': '1'})
+        self.assertEqual(filtered.context['cl'].result_count, 33)
+        self.assertEqual(self.client.get(url).context['cl'].result_count, 60)
+
+    def test_search_uses_index(self):
+        self.grow(2)
+        Product.objects.create(name='Wiertarka', description='Udarowa bezprzewodowa', category=self.categories[0], owner=self.admin)
+        response = self.client.get(reverse('admin:folder_apki_product_changelist'), {'q': 'bezprzewod'})
+        self.assertEqual([product.name for product in response.context['cl'].result_list], ['Wiertarka'])
+
+    def test_related_fields_use_search_widgets(self):
+        self.grow(2)
+        response = self.client.get(reverse('admin:folder_apki_rental_add'))
+        form = response.context['adminform'].form
+        self.assertEqual(form.fields['user'].widget.widget.__class__.__name__, 'AutocompleteSelect')
+        self.assertEqual(form.fields['product'].widget.__class__.__name__, 'ForeignKeyRawIdWidget')
+        response = self.client.get(reverse('admin:folder_apki_product_add'))
+        self.assertNotContains(response, 'wlasciciel-')
+
+
+@override_settings(FOLDER_APKI_READ_REPLICAS={'replica': 1}, FOLDER_APKI_PRIMARY_STICKY_SECONDS=60)
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Dwie osobne bazy SQLite: `default` (primary) i `replica`. Replikację zastępuje
+    jawne kopiowanie tabel w replicate(), więc widać, z której bazy czyta żądanie.
+    """
+    databases = {'default', 'replica'}
+    replicated = (User, Token, Category, Product, Rental)
+
+    def setUp(self):
+        cache.clear()
+        clear_token_cache()
+        self.user = User.objects.create_user('jan', password='haslo')
+        self.other = User.objects.create_user('ola', password='haslo')
+        self.category = Category.objects.create(name='Narzędzia')
+        seed_products(self.user, self.category, 2)
+        seed_products(self.other, self.category, 2)
+        self.replicate()
+
+    def replicate(self):
+        for model in reversed(self.replicated):
+            model.objects.using('replica').all().delete()
+        for model in self.replicated:
+            model.objects.using('replica').bulk_create(model.objects.using('default').order_by('pk'))
+
+    def client_for(self, user):
+        client = APIClient()
+        token, _ = Token.objects.get_or_create(user=user)
+        if not Token.objects.using('replica').filter(pk=token.pk).exists():
+            Token.objects.using('replica').bulk_create([token])
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return client
+
+    def product_names(self, client):
+        return {row['name'] for row in client.get(reverse('product-list')).data['results']}
+
+    def test_reads_use_replica(self):
+        client = self.client_for(self.user)
+        Product.objects.create(name='Tylko na primary', description='Opis', category=self.category, owner=self.user)
+        self.assertEqual(self.product_names(client), {'Produkt 000000', 'Produkt 000001'})
+
+        self.replicate()
+        cache.clear()
+        self.assertIn('Tylko na primary', self.product_names(client))
+
+    def test_writing_client_sticks_to_primary(self):
+        writer, reader = self.client_for(self.user), self.client_for(self.other)
+        product = Product.objects.filter(owner=self.user).first()
+        response = writer.post(reverse('rental-list'), {'product': product.pk}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        # Replika nie ma jeszcze wypożyczenia; piszący czyta z primary, inni z repliki.
+        self.assertEqual(len(writer.get(reverse('rental-list')).data['results']), 1)
+        self.assertFalse(Rental.objects.using('replica').exists())
+        self.assertEqual(len(reader.get(reverse('product-list')).data['results']), 2)
+        with self.settings(FOLDER_APKI_PRIMARY_STICKY_SECONDS=0):
+            cache.clear()
+            self.assertEqual(writer.get(reverse('rental-list')).data['results'], [])
+
+    def test_outside_requests_and_transactions_use_primary(self):
+        router = routers.ReplicaRouter()
+        self.assertEqual(router.db_for_read(Product), 'default')
+        state, token = routers.begin('replica')
+        try:
+            self.assertEqual(router.db_for_read(Product), 'replica')
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(Product), 'default')
+            self.assertEqual(router.db_for_write(Product), 'default')
+            self.assertEqual(router.db_for_read(Product), 'default')
+        finally:
+            routers.end(token)
+
+    def test_round_robin_follows_weights(self):
+        selector = routers.ReplicaSelector()
+        with self.settings(FOLDER_APKI_READ_REPLICAS={'a': 2, 'b': 1, 'c': 0}, FOLDER_APKI_REPLICA_SELECTION='round_robin'):
+            self.assertEqual([selector.choose() for _ in range(6)], ['a', 'a', 'b', 'a', 'a', 'b'])
+        with self.settings(FOLDER_APKI_READ_REPLICAS={'a': 1, 'b': 3}):
+            self.assertEqual({selector.choose() for _ in range(200)}, {'a', 'b'})
+        with self.settings(FOLDER_APKI_READ_REPLICAS={}):
+            self.assertIsNone(selector.choose())
+
+
+class AvailabilityTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('jan', password='haslo')
+        self.category = Category.objects.create(name='Narzędzia')
+        seed_products(self.user, self.category, 4)
+        self.p1, self.p2, self.p3, self.p4 = Product.objects.order_by('id')
+        self.day = now().replace(microsecond=0) + datetime.timedelta(days=1)
+        self.rent(self.p1, 1, 3)
+        self.rent(self.p1, 2, 4)
+        self.rent(self.p2, 5, None)
+        self.rent(self.p3, -10, -8, status='returned')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def at(self, days):
+        return self.day + datetime.timedelta(days=days)
+
+    def rent(self, product, start, end, status='approved'):
+        return Rental.objects.create(
+            user=self.user, product=product, status=status,
+            start_date=self.at(start), end_date=self.at(end) if end is not None else None,
+        )
+
+    def free(self, start, end):
+        return set(free_products(Product.objects.all(), self.at(start), self.at(end)))
+
+    def test_free_products_in_window(self):
+        self.assertEqual(self.free(0, 1), {self.p1, self.p2, self.p3, self.p4})
+        self.assertEqual(self.free(2, 6), {self.p3, self.p4})
+        # Przedziały są półotwarte: koniec jednego i początek okna mogą się stykać.
+        self.assertEqual(self.free(4, 5), {self.p1, self.p2, self.p3, self.p4})
+        self.assertEqual(self.free(-9, 100), {self.p4})
+        self.assertTrue(is_free(self.p2.pk, self.at(0), self.at(5)))
+        self.assertFalse(is_free(self.p2.pk, self.at(0), self.at(500)))
+
+    def test_calendar_merges_and_clips_intervals(self):
+        busy = calendar([self.p1.pk, self.p2.pk, self.p4.pk], self.at(0), self.at(10))
+        self.assertEqual(busy, {
+            self.p1.pk: [(self.at(1), self.at(4))],
+            self.p2.pk: [(self.at(5), self.at(10))],
+        })
+
+    def test_legacy_returned_rentals_end_at_return(self):
+        legacy = self.rent(self.p4, -20, None, status='returned')
+        Rental.objects.filter(pk=legacy.pk).update(end_date=None, returned_at=self.at(-15))
+        archived = ArchivedRental.objects.create(
+            id=10 ** 6, user=self.user, product=self.p4, status='returned', start_date=self.at(-30),
+        )
+        self.assertNotIn(self.p4, self.free(0, 1))
+
+        run_data_migration('0014_rental_end_date', 'backfill_end_date')
+        legacy.refresh_from_db()
+        archived.refresh_from_db()
+        self.assertEqual(legacy.end_date, self.at(-15))
+        self.assertEqual(archived.end_date, self.at(-30))
+        self.assertIn(self.p4, self.free(0, 1))
+        self.assertEqual(calendar([self.p4.pk], self.at(0), self.at(10)), {})
+
+    def test_disjoint_windows_can_be_booked(self):
+        reserve_product(self.user, self.p4.pk, start_date=self.at(30), end_date=self.at(40))
+        self.assertEqual(self.free(0, 10), {self.p3, self.p4})
+        self.assertNotIn(self.p4, self.free(35, 36))
+
+        response = self.client.post(reverse('rental-list'), {'product': self.p4.pk, 'end_date': self.at(10).isoformat()}, format='json')
+        self.assertEqual(response.status_code, 201)
+        with self.assertRaises(ProductUnavailable):
+            reserve_product(self.user, self.p4.pk, start_date=self.at(35), end_date=self.at(50))
+        with self.assertRaises(ProductUnavailable):
+            reserve_product(self.user, self.p4.pk, start_date=self.at(20))
+        self.assertEqual(Rental.objects.filter(product=self.p4).count(), 2)
+        self.assertEqual(CategoryOwnerStats.mismatches(), {})
+
+    def test_bulk_reservation_checks_intervals(self):
+        window = lambda start, end: {'product': self.p1.pk, 'start_date': self.at(start).isoformat(), 'end_date': self.at(end).isoformat()}
+        response = self.client.post(reverse('rental-bulk'), [window(4, 5), {'product': self.p2.pk}], format='json')
+        self.assertEqual(len(response.data['created']), 1)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1])
+        response = self.client.post(reverse('rental-bulk'), [window(4, 6)], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn(self.p1, self.free(4, 5))
+
+    def test_return_ends_interval(self):
+        rental = reserve_product(self.user, self.p4.pk, end_date=self.at(30))
+        self.assertFalse(is_free(self.p4.pk, self.at(10), self.at(11)))
+        transition_rentals([rental.pk], 'approved')
+        transition_rentals([rental.pk], 'returned')
+        rental.refresh_from_db()
+        self.assertEqual(rental.end_date, rental.returned_at)
+        self.assertTrue(is_free(self.p4.pk, self.at(0), self.at(30)))
+
+    def test_endpoint_uses_one_query(self):
+        url = reverse('category-availability', args=[self.category.pk])
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'start': self.at(2).isoformat(), 'end': self.at(6).isoformat()})
+        self.assertEqual([row['id'] for row in response.data['results']], [self.p3.pk, self.p4.pk])
+
+        other = User.objects.create_user('ola', password='haslo')
+        self.client.force_authenticate(other)
+        response = self.client.get(url, {'start': self.at(2).isoformat(), 'end': self.at(6).isoformat()})
+        self.assertEqual(response.data['results'], [])
+
+    def test_endpoint_validates_window(self):
+        url = reverse('category-availability', args=[self.category.pk])
+        for params in ({}, {'start': 'jutro', 'end': 'pojutrze'}, {'start': self.at(2).isoformat(), 'end': self.at(1).isoformat()}):
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn('error', response.data)
+
+    def test_rental_end_date_is_validated(self):
+        url = reverse('rental-list')
+        response = self.client.post(url, {'product': self.p4.pk, 'end_date': self.at(-2).isoformat()}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(url, {'product': self.p4.pk, 'end_date': self.at(2).isoformat()}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(is_free(self.p4.pk, self.at(0), self.at(1)))
+        self.assertTrue(is_free(self.p4.pk, self.at(2), self.at(3)))
+
+    def test_benchmark_index_matches_scan(self):
+        users = benchmark.seed(users=2, categories=2, products=50, rentals=0)
+        benchmark.seed_rental_history(500)
+        results = benchmark.product_availability(users['admin'], repeat=1)
+        self.assertEqual(set(results['windows']), set(benchmark.availability_windows()))
+        self.assertIn('rental_product_interval_idx', results['query_plan'])
+
+
+@override_settings(FOLDER_APKI_THROTTLE_RATES={'search': '3/min', 'report': '1/min'})
+class ThrottlingTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('jan', password='haslo')
+        self.other = User.objects.create_user('ola', password='haslo')
+        self.headers = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=self.user).key}'}
+        self.path = reverse('product-search', args=['rower'])
+
+    def search(self, **headers):
+        return APIClient().get(self.path, **(headers or self.headers))
+
+    def test_bucket_allows_burst_then_refills(self):
+        before = throttle_stats()
+        self.assertEqual([self.search().status_code for _ in range(3)], [200, 200, 200])
+        response = self.search()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '20')
+        after = throttle_stats()
+        self.assertEqual(after['allowed'] - before['allowed'], 3)
+        self.assertEqual(after['throttled'] - before['throttled'], 1)
+
+        # Inny klient ma własny kubełek.
+        other = APIClient()
+        other.force_authenticate(self.other)
+        self.assertEqual(other.get(self.path).status_code, 200)
+
+        # Po 20 s (60 s / 3) przybywa jeden token.
+        later = time.time() + 20
+        with mock.patch('folder_apki.throttling.time.time', return_value=later):
+            self.assertEqual(self.search().status_code, 200)
+            self.assertEqual(self.search().status_code, 429)
+
+    @override_settings(FOLDER_APKI_THROTTLE_CACHE='default')
+    def test_shared_bucket(self):
+        self.assertEqual([self.search().status_code for _ in range(4)], [200, 200, 200, 429])
+        clear_buckets()
+        # Kubełki są w cache, nie w procesie.
+        self.assertEqual(self.search().status_code, 429)
+
+    def test_scopes_and_unlimited_views(self):
+        admin = User.objects.create_user('admin', password='haslo', role='adminki')
+        client = APIClient()
+        client.force_authenticate(admin)
+        self.assertEqual(client.get(reverse('monthly-report')).status_code, 200)
+        self.assertEqual(client.get(reverse('monthly-report')).status_code, 429)
+        self.assertEqual(client.get(self.path).status_code, 200)
+        for _ in range(5):
+            self.assertEqual(client.get(reverse('product-list')).status_code, 200)
+
+    async def test_async_view(self):
+        headers = {'Authorization': self.headers['HTTP_AUTHORIZATION']}
+        path = reverse('async-product-search', args=['rower'])
+        statuses = [(await self.async_client.get(path, headers=headers)).status_code for _ in range(4)]
+        self.assertEqual(statuses, [200, 200, 200, 429])
+
+    async def test_sync_and_async_views_share_bucket(self):
+        self.assertEqual((await sync_to_async(self.search)()).status_code, 200)
+        self.assertEqual((await sync_to_async(self.search)()).status_code, 200)
+        headers = {'Authorization': self.headers['HTTP_AUTHORIZATION']}
+        path = reverse('async-product-search', args=['rower'])
+        statuses = [(await self.async_client.get(path, headers=headers)).status_code for _ in range(2)]
+        self.assertEqual(statuses, [200, 429])
+
+
+class CoalescingTests(TransactionTestCase):
+    """
+    Równoległe identyczne wyszukiwania w wątkach - odpowiedź liczy jedno żądanie, więc
+    zapytań do bazy jest tyle, co dla jednego wyszukiwania.
+    """
+    def setUp(self):
+        cache.clear()
+        clear_buckets()
+        self.user = User.objects.create_user('jan', password='haslo')
+        category = Category.objects.create(name='Narzędzia')
+        for name in ('Wiertarka', 'Wiertło'):
+            Product.objects.create(name=name, description='Opis', category=category, owner=self.user)
+
+    def test_concurrent_identical_requests(self):
+        backend = type(get_backend())
+        original = backend.ranked
+        calls = []
+
+        def slow_search(self, *args, **kwargs):
+            calls.append(args)
+            time.sleep(0.3)
+            return original(self, *args, **kwargs)
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        # Pierwsze wyszukiwanie zapisuje znaczniki zmian w cache; kolejne (inna fraza,
+        # ten sam plan) pokazuje, ile zapytań kosztuje jedno nowe wyszukiwanie.
+        client.get(reverse('product-search', args=['wiertarka']))
+        with CaptureQueriesContext(connection) as single:
+            client.get(reverse('product-search', args=['wiertło']))
+        self.assertGreater(len(single), 0)
+
+        threads = 8
+        barrier = threading.Barrier(threads)
+        responses = [None] * threads
+        queries = []
+        queries_lock = threading.Lock()
+
+        def count_query(execute, sql, params, many, context):
+            with queries_lock:
+                queries.append(sql)
+            return execute(sql, params, many, context)
+
+        def request(index):
+            client = APIClient()
+            client.force_authenticate(self.user)
+            barrier.wait()
+            try:
+                with connection.execute_wrapper(count_query):
+                    responses[index] = client.get(reverse('product-search', args=['wiert']))
+            finally:
+                connection.close()
+
+        before = cache_stats()['coalesced']
+        with mock.patch.object(backend, 'ranked', slow_search):
+            workers = [threading.Thread(target=request, args=[i]) for i in range(threads)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual({response.status_code for response in responses}, {200})
+        self.assertEqual(len({response.content for response in responses}), 1)
+        self.assertEqual(len(responses[0].data['results']), 2)
+        self.assertEqual(cache_stats()['coalesced'] - before, threads - 1)
+        self.assertEqual(len(queries), len(single))
+
+    async def test_leader_cancellation_keeps_followers(self):
+        release = asyncio.Event()
+        calls = []
+
+        @coalesced()
+        async def view(request):
+            calls.append(request)
+            await release.wait()
+            return JSONResponse({'ok': True})
+
+        factory = RequestFactory()
+        requests = [factory.get('/coalesced/'), factory.get('/coalesced/')]
+        for request in requests:
+            request.user = self.user
+        leader = asyncio.ensure_future(view(requests[0]))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(view(requests[1]))
+        await asyncio.sleep(0)
+        leader.cancel()  # Klient pierwszego żądania się rozłączył.
+        await asyncio.sleep(0)
+        release.set()
+
+        response = await follower
+        self.assertTrue(leader.cancelled())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'ok': True})
+        self.assertEqual(len(calls), 1)
+
+
+class FastJsonTests(ApiTestCase):
+    """
+    Listy z values_list i FastJSONRenderer mają te same bajty co serializatory i JSONRenderer.
+    """
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('jan', password='haslo')
+        self.category = Category.objects.create(name='Różne')
+        names = ['Zwykły', 'Cudzysłów " i \\ ukośnik', 'Linia\u2028akapit\u2029', 'Sterujące \x01\t\n', 'Emoji 🚲']
+        products = [
+            Product.objects.create(name=name, description='Opis', category=self.category, owner=self.user)
+            for name in names
+        ]
+        start = now().replace(microsecond=123456)
+        for i, product in enumerate(products):
+            Rental.objects.create(
+                user=self.user, product=product, start_date=start - datetime.timedelta(days=i),
+                end_date=start + datetime.timedelta(days=1) if i % 2 else None,
+            )
+        ArchivedRental.objects.create(
+            id=10 ** 6, user=self.user, product=products[0], status='returned',
+            start_date=start, end_date=start, returned_at=start, archived_at=start,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def both(self, path, params=None):
+        contents = []
+        for fast in (False, True):
+            cache.clear()
+            with override_settings(FOLDER_APKI_FAST_JSON=fast):
+                response = self.client.get(path, params)
+            self.assertEqual(response.status_code, 200, path)
+            contents.append(response.content)
+        return contents
+
+    def test_lists_are_byte_identical(self):
+        routes = [
+            (reverse('product-list'), {'page_size': 2}),
+            (reverse('product-list'), None),
+            (reverse('category-products', args=[self.category.pk]), None),
+            (reverse('rental-list'), {'page_size': 3}),
+            (reverse('rental-history'), None),
+        ]
+        for path, params in routes:
+            before, after = self.both(path, params)
+            self.assertEqual(after, before, path)
+
+    @override_settings(TIME_ZONE='Europe/Warsaw')
+    def test_datetimes_in_current_timezone(self):
+        before, after = self.both(reverse('rental-list'))
+        self.assertEqual(after, before)
+        self.assertIn(b'+0', after)
+
+    def test_cursor_from_rows(self):
+        response = self.client.get(reverse('product-list'), {'page_size': 2})
+        names = [row['name'] for row in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            names += [row['name'] for row in response.data['results']]
+        self.assertEqual(names, sorted(Product.objects.values_list('name', flat=True)))
+
+    def test_renderer_matches_json_renderer(self):
+        data = {
+            'data': now(), 'dzień': now().date(), 'kwota': Decimal('1.50'), 'leniwy': gettext_lazy('Tak'),
+            'tekst': 'a\u2028b', 'lista': [None, True, 1, 'ż'],
+        }
+        # Liczby spoza 64 bitów orjson odrzuca - koduje je JSONRenderer.
+        for value in (data, {'duża': 2 ** 70}):
+            for media_type in (None, 'application/json; indent=4'):
+                self.assertEqual(
+                    FastJSONRenderer().render(value, media_type), JSONRenderer().render(value, media_type),
+                )
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+
+# Kategoria też ma kolumnę description - sprawdzamy tylko kolumnę produktu.
+PRODUCT_DESCRIPTION = '"folder_apki_product"."description"'
+
+
+class FieldProjectionTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('jan', password='haslo')
+        self.category = Category.objects.create(name='Rowery')
+        self.products = [
+            Product.objects.create(name=f'Rower {i}', description='Długi opis ' * 100, category=self.category, owner=self.user)
+            for i in range(3)
+        ]
+        self.rental = Rental.objects.create(user=self.user, product=self.products[0])
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, name, args=(), **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(name, args=args), params)
+        self.assertEqual(response.status_code, 200, name)
+        return response, ' '.join(query['sql'] for query in queries)
+
+    def test_fields_shrink_json_and_sql(self):
+        response, sql = self.get('product-list', fields='id,name,is_available')
+        self.assertEqual([list(row) for row in response.data['results']], [['id', 'name', 'is_available']] * 3)
+        self.assertNotIn(PRODUCT_DESCRIPTION, sql)
+
+        response, sql = self.get('product-list', exclude='description,owner_role')
+        self.assertEqual(
+            list(response.data['results'][0]),
+            ['id', 'name', 'category', 'is_available', 'date_added', 'owner'],
+        )
+        self.assertNotIn(PRODUCT_DESCRIPTION, sql)
+
+    def test_endpoints(self):
+        product = self.products[0]
+        cases = [
+            ('product-detail', [product.pk], 'id,name', {'id': product.pk, 'name': product.name}),
+            ('category-products', [self.category.pk], 'id,name', [{'id': p.pk, 'name': p.name} for p in self.products]),
+            ('rental-detail', [self.rental.pk], 'id', {'id': self.rental.pk}),
+        ]
+        for name, args, fields, expected in cases:
+            response, sql = self.get(name, args, fields=fields)
+            self.assertEqual(json.loads(response.content), expected, name)
+            self.assertNotIn(PRODUCT_DESCRIPTION, sql, name)
+
+        response, _ = self.get('rental-list', fields='status')
+        self.assertEqual(response.data['results'], [{'status': 'pending'}])
+        response, sql = self.get('product-search', ['rower'], fields='id')
+        self.assertEqual(sorted(row['id'] for row in response.data['results']), [p.pk for p in self.products])
+        self.assertNotIn(PRODUCT_DESCRIPTION, sql)
+
+    def test_cursor_without_ordering_fields(self):
+        response, _ = self.get('product-list', fields='is_available', page_size=2)
+        self.assertEqual(response.data['results'], [{'is_available': True}] * 2)
+        response = self.client.get(response.data['next'])
+        self.assertEqual(response.data, {'next': None, 'results': [{'is_available': True}]})
+
+    @override_settings(FOLDER_APKI_FAST_JSON=False)
+    def test_projection_without_fast_json(self):
+        response, sql = self.get('product-list', fields='id')
+        self.assertEqual(response.data['results'], [{'id': p.pk} for p in self.products])
+        self.assertNotIn(PRODUCT_DESCRIPTION, sql)
+
+    def test_invalid_fields(self):
+        for params in ({'fields': 'id,haslo'}, {'fields': 'id', 'exclude': 'name'}, {'fields': ','}):
+            response = self.client.get(reverse('product-list'), params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn('error', response.data)
+
+    async def test_async_views(self):
+        headers = {'Authorization': f'Token {self.token.key}'}
+        for name, args in (('product-list', []), ('product-detail', [self.products[0].pk]), ('rental-list', [])):
+            path = reverse(f'async-{name}', args=args)
+            response = await self.async_client.get(path, {'fields': 'id'}, headers=headers)
+            sync_response = await sync_to_async(self.client.get)(reverse(name, args=args), {'fields': 'id'})
+            self.assertEqual(response.content.replace(b'/async/', b'/'), sync_response.content, name)
+
+        response = await self.async_client.get(reverse('async-product-list'), {'fields': 'haslo'}, headers=headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.content), {'error': 'Nieznane pola: haslo.'})
+
+
+class CompressionTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user('admin', password='haslo', role='adminki', is_staff=True)
+        category = Category.objects.create(name='Książki')
+        seed_products(self.admin, category, 50)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_negotiation(self):
+        self.assertEqual(choose_encoding('gzip, deflate'), 'gzip')
+        self.assertEqual(choose_encoding('*'), 'gzip')
+        for header in ('', 'identity', 'deflate', 'gzip;q=0', 'gzip;q=zle'):
+            self.assertIsNone(choose_encoding(header), header)
+
+        with mock.patch.dict(compression.CODECS, {'br': bytes, 'zstd': bytes}):
+            # Równe wagi - preferencja serwera; wyższa waga klienta wygrywa.
+            self.assertEqual(choose_encoding('gzip, br, zstd'), 'zstd')
+            self.assertEqual(choose_encoding('gzip, br;q=0.5, zstd;q=0'), 'gzip')
+            with override_settings(FOLDER_APKI_COMPRESSION_ENCODINGS=['gzip']):
+                self.assertEqual(choose_encoding('br, gzip;q=0.1'), 'gzip')
+
+    def test_gzip_response(self):
+        before = compression.compression_stats().get('gzip', {'responses': 0})['responses']
+        plain = self.client.get(reverse('product-list'))
+        self.assertNotIn('Content-Encoding', plain)
+
+        response = self.client.get(reverse('product-list'), HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertEqual(int(response['Content-Length']), len(response.content))
+        self.assertLess(len(response.content), len(plain.content) / 3)
+        self.assertEqual(response['ETag'], 'W/' + plain['ETag'])
+        self.assertEqual(compression.compression_stats()['gzip']['responses'], before + 1)
+
+        not_modified = self.client.get(
+            reverse('product-list'), HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'],
+        )
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_skipped_responses(self):
+        # Poniżej progu.
+        response = self.client.get(reverse('product-list'), {'page_size': 1}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', response)
+        # Strumień (eksport).
+        response = self.client.get(reverse('export-products', args=['csv']), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertTrue(response.streaming)
+        self.assertNotIn('Content-Encoding', response)
+
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+        body = b'x' * 5000
+        for headers in (
+            {'Content-Encoding': 'br'},
+            {'Content-Type': 'image/png'},
+            {'Content-Type': 'application/json', 'Cache-Control': 'no-transform'},
+        ):
+            response = CompressionMiddleware(lambda request: HttpResponse(body, headers=headers))(request)
+            self.assertEqual(response.content, body, headers)
+            self.assertEqual(response.get('Content-Encoding'), headers.get('Content-Encoding'))
+
+    @unittest.skipUnless(compression.brotli, 'brak biblioteki brotli')
+    def test_brotli_response(self):
+        plain = self.client.get(reverse('product-list'))
+        response = self.client.get(reverse('product-list'), HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(compression.brotli.decompress(response.content), plain.content)
+
+    @unittest.skipUnless(compression.zstandard, 'brak biblioteki zstandard')
+    def test_zstd_response(self):
+        plain = self.client.get(reverse('product-list'))
+        response = self.client.get(reverse('product-list'), HTTP_ACCEPT_ENCODING='zstd')
+        self.assertEqual(response['Content-Encoding'], 'zstd')
+        self.assertEqual(compression.zstandard.ZstdDecompressor().decompress(response.content), plain.content)
+
+    @unittest.skipUnless(fastjson.msgpack, 'brak biblioteki msgpack')
+    def test_msgpack_renderer(self):
+        plain = self.client.get(reverse('product-list'))
+        response = self.client.get(reverse('product-list'), HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(fastjson.msgpack.unpackb(response.content), json.loads(plain.content))
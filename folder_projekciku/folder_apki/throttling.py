@@ -0,0 +1,134 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authtoken.models import Token
+from rest_framework.throttling import BaseThrottle
+
+from .authentication import LRUCache
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# Liczniki są per proces, jak w caching.py.
+_stats = {'allowed': 0, 'throttled': 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def throttle_stats():
+    """
+    Zwraca liczniki żądań przepuszczonych i odrzuconych przez TokenBucketThrottle.
+    """
+    with _stats_lock:
+        return dict(_stats)
+
+
+def parse_rate(rate):
+    """
+    'liczba/okres' jak w DRF ('30/min', '5/s'): pojemność kubełka i czas jego pełnego napełnienia (s).
+    """
+    count, period = rate.split('/')
+    return int(count), DURATIONS[period[0]]
+
+
+# ====================
+# Kubełki
+# ====================
+# Stan kubełka to (tokeny, czas ostatniej aktualizacji). Kubełki lokalne są dokładne w procesie;
+# we wspólnym cache odczyt i zapis nie są atomowe (ani blokowane - blokada procesu na czas
+# zapytań sieciowych szeregowałaby wszystkie żądania), więc przy równoległych żądaniach
+# limit jest przybliżony (może przepuścić kilka żądań ponad limit).
+_local = LRUCache(max_size=10000, ttl=DURATIONS['d'])
+_lock = threading.Lock()
+
+
+def bucket_cache():
+    alias = getattr(settings, 'FOLDER_APKI_THROTTLE_CACHE', None)
+    return caches[alias] if alias else None
+
+
+def refill(state, capacity, period, moment):
+    tokens, updated = state or (capacity, moment)
+    return min(capacity, tokens + (moment - updated) * capacity / period)
+
+
+def spend(state, capacity, period):
+    """
+    Nowy stan kubełka po próbie pobrania tokenu: (czy przepuścić, tokeny, czas).
+    """
+    moment = time.time()
+    tokens = refill(state, capacity, period, moment)
+    allowed = tokens >= 1
+    return allowed, tokens - 1 if allowed else tokens, moment
+
+
+def take(key, capacity, period):
+    """
+    Pobiera token z kubełka `key`; zwraca (czy przepuścić, ile sekund do następnego tokenu).
+    """
+    shared = bucket_cache()
+    if shared is None:
+        with _lock:
+            allowed, tokens, moment = spend(_local.get(key), capacity, period)
+            _local.set(key, (tokens, moment))
+    else:
+        allowed, tokens, moment = spend(shared.get(key), capacity, period)
+        shared.set(key, (tokens, moment), period)
+    return allowed, 0.0 if allowed else (1 - tokens) * period / capacity
+
+
+def clear_buckets():
+    _local.clear()
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Limit żądań algorytmem kubełka z tokenami: kubełek o pojemności N napełnia się
+    równomiernie N tokenami na okres, więc dopuszcza krótkie serie do N żądań, a średnio
+    N na okres. Kubełek jest per token API, w pozostałych przypadkach per użytkownik
+    (anonimy - per adres IP) i per `scope`. Limity w FOLDER_APKI_THROTTLE_RATES
+    (scope -> 'N/okres'; brak wpisu - bez limitu); kubełki w procesie albo we wspólnym
+    cache FOLDER_APKI_THROTTLE_CACHE.
+    """
+    scope = None
+
+    def __init__(self):
+        self.wait_seconds = None
+
+    def get_rate(self):
+        return getattr(settings, 'FOLDER_APKI_THROTTLE_RATES', {}).get(self.scope)
+
+    def get_ident_key(self, request):
+        auth = getattr(request, 'auth', None)
+        if isinstance(auth, Token):
+            return f'token:{hashlib.sha256(auth.key.encode()).hexdigest()}'
+        if request.user and request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        return f'ip:{self.get_ident(request)}'
+
+    def allow_request(self, request, view):
+        rate = self.get_rate()
+        if rate is None:
+            return True
+        capacity, period = parse_rate(rate)
+        key = f'folder_apki:throttle:{self.scope}:{self.get_ident_key(request)}'
+        allowed, self.wait_seconds = take(key, capacity, period)
+        _count('allowed' if allowed else 'throttled')
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class SearchThrottle(TokenBucketThrottle):
+    scope = 'search'
+
+
+class ReportThrottle(TokenBucketThrottle):
+    scope = 'report'
@@ -17,13 +17,30 @@ urlpatterns = [
     path('products/', views.product_view, name='product-list'),
     path('products/<int:pk>/', views.product_detail_view, name='product-detail'),
     path('categories/<int:category_id>/products/', views.category_products_view, name='category-products'),
+    path('categories/<int:category_id>/availability/', views.category_availability_view, name='category-availability'),
+    path('categories/summary/', views.category_summary_view, name='category-summary'),
     path('rentals/', views.rental_view, name='rental-list'),
     path('rentals/<int:pk>/', views.rental_view, name='rental-detail'),
+    path('rentals/history/', views.rental_history_view, name='rental-history'),
+    path('rentals/bulk/', views.rental_bulk_view, name='rental-bulk'),
+    path('rentals/bulk/status/', views.rental_bulk_status_view, name='rental-bulk-status'),
     path('rentals/report/monthly/', views.monthly_rental_report, name='monthly-report'),
     path('products/search/<str:query>/', views.product_search, name='product-search'),
+    path('products/import/', views.product_import_view, name='product-import'),
     path('products/delete/<int:pk>/', views.delete_product_admin, name='delete-product-admin'),
+    path('export/products.<str:fmt>', views.export_view, {'name': 'products'}, name='export-products'),
+    path('export/rentals.<str:fmt>', views.export_view, {'name': 'rentals'}, name='export-rentals'),
+    path('metrics/', views.metrics_view, name='metrics'),
     path('register/', register_view, name='register'),  # Ścieżka do rejestracji
 
+    # API JSON - wersje async do uruchamiania pod serwerem ASGI (asgi.py)
+    path('async/products/', views.product_view_async, name='async-product-list'),
+    path('async/products/<int:pk>/', views.product_detail_view_async, name='async-product-detail'),
+    path('async/categories/<int:category_id>/products/', views.category_products_view_async, name='async-category-products'),
+    path('async/rentals/', views.rental_view_async, name='async-rental-list'),
+    path('async/rentals/<int:pk>/', views.rental_view_async, name='async-rental-detail'),
+    path('async/products/search/<str:query>/', views.product_search_async, name='async-product-search'),
+
 
     # HTML
     path('welcome/', views.welcome_view, name='welcome'),
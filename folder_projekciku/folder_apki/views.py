@@ -1,18 +1,69 @@
-from rest_framework.authentication import TokenAuthentication, SessionAuthentication
+from rest_framework.authentication import SessionAuthentication
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
-from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.decorators import (
+    api_view, authentication_classes, permission_classes, parser_classes, renderer_classes, throttle_classes,
+)
+from rest_framework.parsers import MultiPartParser
+from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework import status
-from django.http import HttpResponse
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect
-from django.utils.timezone import now
-from django.db.models import Count
+from django.utils.timezone import localdate
+from django.db.models import FilteredRelation, Q, Sum
+from django.db.models.functions import Coalesce
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib import messages
 import datetime
+import io
 
-from .models import Product, Rental, Category
-from .serializers import ProductSerializer, RentalSerializer, CategorySerializer
+from .models import Product, Rental, ArchivedRental, Category, RentalDailyStats
+from .serializers import (
+    ProductSerializer,
+    RentalSerializer,
+    ArchivedRentalSerializer,
+    CategorySerializer,
+    BulkRentalTransitionSerializer,
+)
+from .pagination import RankedPagination, product_pagination, rental_pagination, rental_history_pagination
+from .search import get_backend
+from .availability import free_products, parse_window
+from .exports import FORMATS, stream_export
+from .imports import import_products
+from .middleware import prometheus_text
+from .rentals import (
+    MAX_BATCH,
+    ProductUnavailable,
+    create_rentals,
+    reserve_product,
+    transition_rentals,
+)
+from .caching import cached_response, category_scope, coalesced, products_scope
+from .asyncapi import JSONResponse, async_api_view
+from .fastjson import (
+    LIST_RENDERERS,
+    aserialize,
+    aserialize_ids,
+    aserialize_object,
+    aserialize_page,
+    select_fields,
+    serialize,
+    serialize_ids,
+    serialize_object,
+    serialize_page,
+)
+from .authentication import CachedTokenAuthentication
+from .throttling import ReportThrottle, SearchThrottle
+from .conditional import (
+    conditional,
+    product_list_validators,
+    product_detail_validators,
+    product_search_validators,
+    category_products_validators,
+    rental_validators,
+    rental_history_validators,
+)
 
 # ====================
 # Widoki HTML
@@ -20,29 +71,40 @@ from .serializers import ProductSerializer, RentalSerializer, CategorySerializer
 def product_detail_html(request, id):
     """
     Wyświetla szczegóły produktu w formacie HTML.
+    Treść jest fragmentem cache szablonu z kluczem id i czasu zmiany produktu.
     """
     try:
-        product = Product.objects.get(id=id)
+        product = Product.objects.for_listing().get(id=id)
     except Product.DoesNotExist:
         return HttpResponse('Produkt nie istnieje', status=404)
     
-    return render(request, 'folder_apki/product_detail.html', {'product': product})
+    return render(request, 'folder_apki/product_detail.html', {
+        'product': product,
+        'fragment_timeout': settings.FOLDER_APKI_FRAGMENT_CACHE_TIMEOUT,
+    })
 
 
 def product_list_html(request):
     """
-    Wyświetla listę produktów w formacie HTML.
+    Wyświetla listę produktów w formacie HTML, stronicowaną kursorem (parametr `cursor`).
     - Admin widzi wszystkie produkty.
     - Zwykły użytkownik widzi tylko swoje produkty.
+    Tabela strony i każdy wiersz to fragmenty cache szablonu. Klucz strony liczy lekkie
+    zapytanie (id, czas zmiany, właściciel); pełne wiersze są pobierane tylko przy chybieniu.
     """
-    if request.user.is_staff:
-        # Admin widzi wszystkie produkty
-        products = Product.objects.filter(is_available=True)
-    else:
-        # Zwykły użytkownik widzi tylko swoje produkty
-        products = Product.objects.filter(owner=request.user, is_available=True)
-    
-    return render(request, 'folder_apki/product_list.html', {'products': products})
+    products = Product.objects.visible_to(request.user).filter(is_available=True)
+    paginator = product_pagination()
+    # Paginator czyta parametry przez API żądania DRF.
+    page = paginator.paginate_queryset(
+        products.select_related('owner').only('id', 'name', 'updated_at', 'owner__username'), Request(request),
+    )
+    page_key = ','.join(f'{product.pk}.{product.updated_at.timestamp()}.{product.owner.username}' for product in page)
+    return render(request, 'folder_apki/product_list.html', {
+        'products': Product.objects.for_listing().filter(pk__in=[product.pk for product in page]).order_by('name', 'id'),
+        'page_key': page_key,
+        'next': paginator.get_next_link(),
+        'fragment_timeout': settings.FOLDER_APKI_FRAGMENT_CACHE_TIMEOUT,
+    })
 
 
 def welcome_view(request):
@@ -77,69 +139,77 @@ def register_view(request):
 # ====================
 # Widoki API (JSON)
 # ====================
+# Produkty i wypożyczenia (listy i szczegóły) oraz podsumowanie kategorii przyjmują ?fields=a,b
+# albo ?exclude=c - tylko te pola trafiają do JSON i do SELECT (fastjson.requested_fields).
 @api_view(['GET'])
-@authentication_classes([TokenAuthentication, SessionAuthentication])
+@authentication_classes([CachedTokenAuthentication, SessionAuthentication])
 @permission_classes([IsAuthenticated])
+@renderer_classes(LIST_RENDERERS)
+@conditional(product_list_validators)
+@cached_response(lambda request: [products_scope(request.user)])
 def product_view(request):
     """
-    Wyświetla listę produktów.
+    Wyświetla listę produktów (stronicowaną kursorem, parametr `cursor`).
     - Admin widzi wszystkie produkty.
     - Zwykły użytkownik widzi tylko swoje produkty.
     """
-    if request.user.is_staff:
-        products = Product.objects.filter(is_available=True)
-    else:
-        products = Product.objects.filter(owner=request.user, is_available=True)
-
-    serializer = ProductSerializer(products, many=True)
-    return Response(serializer.data)
+    products = Product.objects.for_listing().visible_to(request.user).filter(is_available=True)
+    paginator = product_pagination()
+    data = serialize_page(paginator, products, request, ProductSerializer)
+    return paginator.get_paginated_response(data)
 
 
 @api_view(['GET'])
-@authentication_classes([TokenAuthentication, SessionAuthentication])
+@authentication_classes([CachedTokenAuthentication, SessionAuthentication])
 @permission_classes([IsAuthenticated])
+@conditional(product_detail_validators)
+@cached_response(lambda request, pk: [products_scope(request.user)])
 def product_detail_view(request, pk):
     """
     Wyświetla szczegóły produktu.
     - Admin widzi wszystkie produkty.
     - Zwykły użytkownik widzi tylko swoje produkty.
     """
+    products = Product.objects.for_listing().visible_to(request.user).filter(pk=pk)
     try:
-        if request.user.is_staff:
-            product = Product.objects.get(pk=pk)
-        else:
-            product = Product.objects.get(pk=pk, owner=request.user)
+        data = serialize_object(products, request, ProductSerializer)
     except Product.DoesNotExist:
         return Response({'error': 'Produkt nie istnieje lub nie należy do użytkownika.'}, status=status.HTTP_404_NOT_FOUND)
 
-    serializer = ProductSerializer(product)
-    return Response(serializer.data)
+    return Response(data)
 
 
 @api_view(['GET'])
-@authentication_classes([TokenAuthentication, SessionAuthentication])
+@authentication_classes([CachedTokenAuthentication, SessionAuthentication])
 @permission_classes([IsAuthenticated])
+@throttle_classes([SearchThrottle])
+@conditional(product_search_validators)
+@coalesced()
 def product_search(request, query):
     """
-    Wyszukuje produkty na podstawie fragmentu nazwy.
+    Wyszukuje produkty w nazwie, opisie i kategorii (indeks pełnotekstowy, patrz search.py).
+    Wyniki są uszeregowane według trafności i stronicowane kursorem (`next`).
     - Admin widzi wszystkie produkty pasujące do zapytania.
     - Zwykły użytkownik widzi tylko swoje produkty pasujące do zapytania.
     """
-    if request.user.is_staff:
-        # Admin widzi wszystkie produkty pasujące do zapytania
-        products = Product.objects.filter(name__icontains=query)
-    else:
-        # Zwykły użytkownik widzi tylko swoje produkty pasujące do zapytania
-        products = Product.objects.filter(owner=request.user, name__icontains=query)
-    
-    serializer = ProductSerializer(products, many=True)
-    return Response(serializer.data)
+    backend = get_backend()
+    paginator = RankedPagination()
+    ids = paginator.paginate_search(
+        lambda limit, after: backend.ranked(query, request.user, limit, after), request
+    )
+    data = serialize_ids(Product.objects.for_listing(), ids, request, ProductSerializer)
+    return paginator.get_paginated_response(data)
 
 
 
 @api_view(['GET'])
-@authentication_classes([TokenAuthentication, SessionAuthentication])
+@authentication_classes([CachedTokenAuthentication, SessionAuthentication])
 @permission_classes([IsAuthenticated])
+@renderer_classes(LIST_RENDERERS)
+@conditional(category_products_validators)
+@cached_response(lambda request, category_id: [
+    products_scope(request.user), category_scope(category_id),
+])
 def category_products_view(request, category_id):
     """
     Wyświetla produkty z wybranej kategorii przypisane do zalogowanego użytkownika.
@@ -149,59 +219,175 @@ def category_products_view(request, category_id):
     except Category.DoesNotExist:
         return Response({'error': 'Kategoria nie istnieje.'}, status=status.HTTP_404_NOT_FOUND)
 
-    products = Product.objects.filter(category=category, owner=request.user, is_available=True)
-    serializer = ProductSerializer(products, many=True)
-    return Response(serializer.data)
+    products = Product.objects.for_listing().filter(category=category, owner=request.user, is_available=True)
+    return Response(serialize(products, request, ProductSerializer))
+
+
+@api_view(['GET'])
+@authentication_classes([CachedTokenAuthentication, SessionAuthentication])
+@permission_classes([IsAuthenticated])
+@renderer_classes(LIST_RENDERERS)
+def category_availability_view(request, category_id):
+    """
+    Produkty kategorii wolne w całym oknie ?start=...&end=... (ISO 8601), stronami po nazwie.
+    Jedno zapytanie: NOT EXISTS po indeksie przedziałów wypożyczeń (availability.py).
+    - Admin widzi wszystkie produkty, zwykły użytkownik - swoje.
+    """
+    try:
+        start, end = parse_window(request.query_params)
+    except ValueError as error:
+        return Response({'error': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+    products = Product.objects.for_listing().visible_to(request.user).filter(category_id=category_id)
+    paginator = product_pagination()
+    data = serialize_page(paginator, free_products(products, start, end), request, ProductSerializer)
+    return paginator.get_paginated_response(data)
 
 
 @api_view(['GET'])
-@authentication_classes([TokenAuthentication, SessionAuthentication])
+@authentication_classes([CachedTokenAuthentication, SessionAuthentication])
+@permission_classes([IsAuthenticated])
+def category_summary_view(request):
+    """
+    Liczba wszystkich i dostępnych produktów w każdej kategorii, jednym zapytaniem
+    z liczników utrzymywanych przy zapisie produktów (bez pobierania list).
+    - Admin widzi liczby wszystkich produktów.
+    - Zwykły użytkownik widzi liczby swoich produktów.
+    """
+    categories = Category.objects.order_by('name', 'id')
+    if request.user.is_staff:
+        columns = {'product_count': 'product_count', 'available_count': 'available_count'}
+    else:
+        categories = categories.annotate(
+            own=FilteredRelation('owner_stats', condition=Q(owner_stats__owner=request.user)),
+        )
+        columns = {'product_count': Coalesce('own__total', 0), 'available_count': Coalesce('own__available', 0)}
+    columns = {'id': 'id', 'name': 'name', **columns}
+    names = select_fields(request, list(columns)) or tuple(columns)
+    rows = categories.values_list(*(columns[name] for name in names))
+    return Response([dict(zip(names, row)) for row in rows])
+
+
+@api_view(['GET'])
+@authentication_classes([CachedTokenAuthentication, SessionAuthentication])
 @permission_classes([IsAdminUser])
+@throttle_classes([ReportThrottle])
+@coalesced()
 def monthly_rental_report(request):
     """
     Zwraca raport miesięczny wypożyczeń.
     """
-    current_month = now().month
-    rentals = (
-        Rental.objects.filter(start_date__month=current_month)
-        .values('start_date__date')
-        .annotate(count=Count('id'))
+    # Czyta dzienny rollup (O(liczba dni)) zamiast agregować wszystkie wypożyczenia.
+    month_start = localdate().replace(day=1)
+    next_month_start = (month_start + datetime.timedelta(days=32)).replace(day=1)
+    days = (
+        RentalDailyStats.objects.filter(date__gte=month_start, date__lt=next_month_start)
+        .values('date')
+        .annotate(count=Sum('count'))
+        .filter(count__gt=0)
+        .order_by('date')
     )
-    return Response(rentals)
+    return Response([{'start_date__date': day['date'], 'count': day['count']} for day in days])
 
 
 @api_view(['GET', 'POST'])
-@authentication_classes([TokenAuthentication, SessionAuthentication])
+@authentication_classes([CachedTokenAuthentication, SessionAuthentication])
 @permission_classes([IsAuthenticated])
+@renderer_classes(LIST_RENDERERS)
+@conditional(rental_validators)
 def rental_view(request, pk=None):
     """
     Obsługuje API wypożyczeń.
+    POST rezerwuje produkt od teraz do end_date; kolizja z innym wypożyczeniem daje 409.
     """
     if request.method == 'GET':
         if pk:
             try:
-                rental = Rental.objects.get(pk=pk, user=request.user)
+                data = serialize_object(Rental.objects.filter(pk=pk, user=request.user), request, RentalSerializer)
             except Rental.DoesNotExist:
                 return Response({'error': 'Wypożyczenie nie istnieje'}, status=status.HTTP_404_NOT_FOUND)
-            serializer = RentalSerializer(rental)
-            return Response(serializer.data)
+            return Response(data)
         else:
             rentals = Rental.objects.filter(user=request.user)
-            serializer = RentalSerializer(rentals, many=True)
-            return Response(serializer.data)
+            paginator = rental_pagination()
+            data = serialize_page(paginator, rentals, request, RentalSerializer)
+            return paginator.get_paginated_response(data)
 
     elif request.method == 'POST':
         data = request.data.copy()
         data['user'] = request.user.id
         serializer = RentalSerializer(data=data)
         if serializer.is_valid():
-            serializer.save()
+            # Rezerwacja produktu i utworzenie wypożyczenia w jednej krótkiej transakcji.
+            try:
+                serializer.instance = reserve_product(
+                    request.user,
+                    serializer.validated_data['product'].pk,
+                    end_date=serializer.validated_data.get('end_date'),
+                )
+            except ProductUnavailable as error:
+                return Response({'error': str(error)}, status=status.HTTP_409_CONFLICT)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(['GET'])
+@authentication_classes([CachedTokenAuthentication, SessionAuthentication])
+@permission_classes([IsAuthenticated])
+@renderer_classes(LIST_RENDERERS)
+@conditional(rental_history_validators)
+def rental_history_view(request):
+    """
+    Zarchiwizowane (zwrócone dawno temu) wypożyczenia zalogowanego użytkownika,
+    od najnowszych, stronami. rental_view zwraca tylko wypożyczenia z tabeli bieżącej.
+    """
+    rentals = ArchivedRental.objects.filter(user=request.user)
+    paginator = rental_history_pagination()
+    data = serialize_page(paginator, rentals, request, ArchivedRentalSerializer)
+    return paginator.get_paginated_response(data)
+
+
+@api_view(['POST'])
+@authentication_classes([CachedTokenAuthentication, SessionAuthentication])
+@permission_classes([IsAuthenticated])
+def rental_bulk_view(request):
+    """
+    Tworzy paczkę oczekujących wypożyczeń zalogowanego użytkownika, rezerwując produkty.
+    """
+    items = request.data
+    if not isinstance(items, list) or not items:
+        return Response({'error': 'Oczekiwano niepustej listy wypożyczeń.'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(items) > MAX_BATCH:
+        return Response({'error': f'Maksymalnie {MAX_BATCH} wypożyczeń w jednym żądaniu.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    rentals, errors = create_rentals(request.user, items)
+    return Response(
+        {'created': RentalSerializer(rentals, many=True).data, 'errors': errors},
+        status=status.HTTP_201_CREATED if rentals else status.HTTP_400_BAD_REQUEST,
+    )
+
+
+@api_view(['POST'])
+@authentication_classes([CachedTokenAuthentication, SessionAuthentication])
+@permission_classes([IsAdminUser])
+def rental_bulk_status_view(request):
+    """
+    Zmienia status wielu wypożyczeń: {ids: [...], status: 'approved' | 'returned'}.
+    Dozwolone przejścia: pending -> approved -> returned. Endpoint dostępny tylko dla adminów.
+    """
+    serializer = BulkRentalTransitionSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    updated, errors = transition_rentals(serializer.validated_data['ids'], serializer.validated_data['status'])
+    return Response(
+        {'updated': updated, 'errors': errors},
+        status=status.HTTP_200_OK if updated else status.HTTP_400_BAD_REQUEST,
+    )
+
+
 @api_view(['DELETE'])
-@authentication_classes([TokenAuthentication, SessionAuthentication])
+@authentication_classes([CachedTokenAuthentication, SessionAuthentication])
 @permission_classes([IsAdminUser])
 def delete_product_admin(request, pk):
     """
@@ -215,3 +401,145 @@ def delete_product_admin(request, pk):
 
     product.delete()
     return Response({'message': f'Produkt o ID {pk} został usunięty.'}, status=status.HTTP_204_NO_CONTENT)
+
+
+@api_view(['GET'])
+@authentication_classes([CachedTokenAuthentication, SessionAuthentication])
+@permission_classes([IsAdminUser])
+def export_view(request, name, fmt):
+    """
+    Strumieniowy eksport produktów lub wypożyczeń (z właścicielem i kategorią) jako CSV lub NDJSON.
+    Endpoint dostępny tylko dla adminów.
+    """
+    if fmt not in FORMATS:
+        return Response({'error': f'Nieobsługiwany format: {fmt}.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    response = StreamingHttpResponse(stream_export(name, fmt), content_type=FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{name}.{fmt}"'
+    return response
+
+
+@api_view(['POST'])
+@authentication_classes([CachedTokenAuthentication, SessionAuthentication])
+@permission_classes([IsAdminUser])
+@parser_classes([MultiPartParser])
+def product_import_view(request):
+    """
+    Importuje produkty z przesłanego pliku CSV lub JSONL (pole `file`).
+    Opcjonalne pola: `format` ('csv' | 'jsonl', domyślnie z nazwy pliku) i `offset` do wznowienia.
+    Endpoint dostępny tylko dla adminów.
+    """
+    upload = request.FILES.get('file')
+    if upload is None:
+        return Response({'error': 'Brak pliku w polu "file".'}, status=status.HTTP_400_BAD_REQUEST)
+    fmt = request.data.get('format') or ('jsonl' if upload.name.endswith(('.jsonl', '.ndjson')) else 'csv')
+    if fmt not in ('csv', 'jsonl'):
+        return Response({'error': f'Nieobsługiwany format: {fmt}.'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        offset = int(request.data.get('offset', 0))
+        if offset < 0:
+            raise ValueError
+    except ValueError:
+        return Response({'error': 'Nieprawidłowy offset.'}, status=status.HTTP_400_BAD_REQUEST)
+    # Błędne wiersze i nieczytelny plik są w raporcie - zawsze z next_offset do wznowienia.
+    stream = io.TextIOWrapper(upload.file, encoding='utf-8', newline='')
+    report = import_products(stream, fmt, offset)
+    return Response(report.as_dict(), status=status.HTTP_201_CREATED if report.imported else status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(['GET'])
+@authentication_classes([CachedTokenAuthentication, SessionAuthentication])
+@permission_classes([IsAdminUser])
+def metrics_view(request):
+    """
+    Metryki wydajności widoków (PerformanceMiddleware) w formacie tekstowym Prometheusa.
+    Endpoint dostępny tylko dla adminów.
+    """
+    return HttpResponse(prometheus_text(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# ====================
+# Widoki API async (ASGI)
+# ====================
+# Te same dane, nagłówki (ETag, X-Cache) i uprawnienia co widoki powyżej, ale z async ORM:
+# pod serwerem ASGI żądanie czekające na bazę nie zajmuje wątku. Pod WSGI używać wersji sync.
+@async_api_view()
+@conditional(product_list_validators)
+@cached_response(lambda request: [products_scope(request.user)])
+async def product_view_async(request):
+    """
+    Asynchroniczna wersja product_view.
+    """
+    products = Product.objects.for_listing().visible_to(request.user).filter(is_available=True)
+    paginator = product_pagination()
+    data = await aserialize_page(paginator, products, request, ProductSerializer)
+    return JSONResponse(paginator.get_paginated_data(data))
+
+
+@async_api_view()
+@conditional(product_detail_validators)
+@cached_response(lambda request, pk: [products_scope(request.user)])
+async def product_detail_view_async(request, pk):
+    """
+    Asynchroniczna wersja product_detail_view.
+    """
+    products = Product.objects.for_listing().visible_to(request.user).filter(pk=pk)
+    try:
+        data = await aserialize_object(products, request, ProductSerializer)
+    except Product.DoesNotExist:
+        return JSONResponse({'error': 'Produkt nie istnieje lub nie należy do użytkownika.'}, status=status.HTTP_404_NOT_FOUND)
+
+    return JSONResponse(data)
+
+
+@async_api_view(throttles=[SearchThrottle])
+@conditional(product_search_validators)
+@coalesced()
+async def product_search_async(request, query):
+    """
+    Asynchroniczna wersja product_search.
+    """
+    backend = get_backend()
+    paginator = RankedPagination()
+    ids = await paginator.apaginate_search(
+        lambda limit, after: backend.aranked(query, request.user, limit, after), request
+    )
+    data = await aserialize_ids(Product.objects.for_listing(), ids, request, ProductSerializer)
+    return JSONResponse(paginator.get_paginated_data(data))
+
+
+@async_api_view()
+@conditional(category_products_validators)
+@cached_response(lambda request, category_id: [
+    products_scope(request.user), category_scope(category_id),
+])
+async def category_products_view_async(request, category_id):
+    """
+    Asynchroniczna wersja category_products_view.
+    """
+    try:
+        category = await Category.objects.aget(pk=category_id)
+    except Category.DoesNotExist:
+        return JSONResponse({'error': 'Kategoria nie istnieje.'}, status=status.HTTP_404_NOT_FOUND)
+
+    products = Product.objects.for_listing().filter(category=category, owner=request.user, is_available=True)
+    return JSONResponse(await aserialize(products, request, ProductSerializer))
+
+
+@async_api_view()
+@conditional(rental_validators)
+async def rental_view_async(request, pk=None):
+    """
+    Asynchroniczna wersja GET z rental_view (tworzenie wypożyczeń zostaje w wersji sync).
+    """
+    if pk:
+        try:
+            data = await aserialize_object(Rental.objects.filter(pk=pk, user=request.user), request, RentalSerializer)
+        except Rental.DoesNotExist:
+            return JSONResponse({'error': 'Wypożyczenie nie istnieje'}, status=status.HTTP_404_NOT_FOUND)
+        return JSONResponse(data)
+
+    rentals = Rental.objects.filter(user=request.user)
+    paginator = rental_pagination()
+    data = await aserialize_page(paginator, rentals, request, RentalSerializer)
+    return JSONResponse(paginator.get_paginated_data(data))
@@ -43,6 +43,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Pierwszy, żeby mierzyć całe żądanie (Server-Timing, /folder_apki/metrics/)
+    'folder_apki.middleware.PerformanceMiddleware',
+    # Zaraz po pomiarze, żeby metryki liczyły bajty wysłane klientowi; kompresuje gotowe odpowiedzi
+    'folder_apki.middleware.CompressionMiddleware',
+    # Przed wszystkim, co czyta z bazy (sesje, uwierzytelnianie) - wybiera replikę do odczytu
+    'folder_apki.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -57,7 +63,6 @@ ROOT_URLCONF = 'folder_projekciku.urls'
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -65,6 +70,14 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Skompilowane szablony trzymane w pamięci procesu, także przy DEBUG
+            # (autoreloader runserver czyści je po zmianie pliku szablonu).
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
         },
     },
 ]
@@ -79,9 +92,87 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+    },
+    # Lokalna replika do odczytu: kopia pliku primary (np. `cp db.sqlite3 db-replica.sqlite3`).
+    # Używana tylko, gdy jest w FOLDER_APKI_READ_REPLICAS; w produkcji - aliasy replik bazy.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db-replica.sqlite3',
+    },
+}
+
+# Zapisy na `default`, odczyty żądań GET/HEAD/OPTIONS na repliki (folder_apki/routers.py)
+DATABASE_ROUTERS = ['folder_apki.routers.ReplicaRouter']
+
+# Repliki do odczytu {alias: waga}, np. {'replica': 1}; puste - wszystko na `default`
+FOLDER_APKI_READ_REPLICAS = {}
+# Wybór repliki dla żądania: 'weighted' (losowo z wagami) albo 'round_robin'
+FOLDER_APKI_REPLICA_SELECTION = 'weighted'
+# Ile sekund po zapisie klient (token / sesja) czyta z `default`; znaczniki w cache FOLDER_APKI_PRIMARY_PIN_CACHE
+FOLDER_APKI_PRIMARY_STICKY_SECONDS = 5
+FOLDER_APKI_PRIMARY_PIN_CACHE = 'default'
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Backend locmem usuwa najdawniej używane wpisy (LRU) po przekroczeniu MAX_ENTRIES.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'folder_apki',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
     }
 }
 
+# Cache odpowiedzi API produktów (folder_apki/caching.py): alias cache i czas życia w sekundach
+FOLDER_APKI_RESPONSE_CACHE = 'default'
+FOLDER_APKI_RESPONSE_CACHE_TIMEOUT = 60
+
+# Cache uwierzytelniania tokenem: lokalny LRU w procesie + wspólny cache Django (None wyłącza)
+FOLDER_APKI_TOKEN_CACHE = 'default'
+FOLDER_APKI_TOKEN_CACHE_TIMEOUT = 300
+FOLDER_APKI_TOKEN_CACHE_SIZE = 10000
+FOLDER_APKI_TOKEN_CACHE_TTL = 60
+
+# Limity żądań kosztownych widoków (folder_apki/throttling.py): scope -> 'N/okres' (kubełek
+# N tokenów napełniany N na okres), per token API / użytkownik; kubełki w procesie (None)
+# albo we wspólnym cache o podanym aliasie
+FOLDER_APKI_THROTTLE_RATES = {
+    'search': '60/min',
+    'report': '20/min',
+}
+FOLDER_APKI_THROTTLE_CACHE = None
+
+# Szybkie listy API (folder_apki/fastjson.py): wiersze z values_list zamiast serializatorów
+# i kodowanie przez orjson, jeśli jest zainstalowany; bajty odpowiedzi są te same
+FOLDER_APKI_FAST_JSON = True
+
+# Kompresja odpowiedzi (folder_apki/compression.py, CompressionMiddleware): kodowania w kolejności
+# preferencji (zstd i br tylko z bibliotekami zstandard / brotli), minimalny rozmiar w bajtach
+# i prefiksy typów MIME, które warto kompresować (obrazy i archiwa już są skompresowane)
+FOLDER_APKI_COMPRESSION_ENCODINGS = ['zstd', 'br', 'gzip']
+FOLDER_APKI_COMPRESSION_MIN_BYTES = 1024
+FOLDER_APKI_COMPRESSIBLE_TYPES = [
+    'text/', 'application/json', 'application/javascript', 'application/xml', 'application/msgpack', 'image/svg+xml',
+]
+
+# Czas życia fragmentów szablonów HTML ({% cache %}) w sekundach; klucze zawierają czas zmiany produktu
+FOLDER_APKI_FRAGMENT_CACHE_TIMEOUT = 600
+
+# Archiwizacja wypożyczeń (folder_apki/archive.py, `archive_rentals`): wiek zwróconego
+# wypożyczenia w dniach, po którym trafia do ArchivedRental, i rozmiar paczki
+FOLDER_APKI_RENTAL_ARCHIVE_AFTER_DAYS = 180
+FOLDER_APKI_RENTAL_ARCHIVE_BATCH = 1000
+
+# PerformanceMiddleware: próg wolnego zapytania (ms) i liczba powtórzeń tego samego
+# zapytania w jednym żądaniu, od której logowane jest podejrzenie N+1 (None/0 wyłącza)
+FOLDER_APKI_SLOW_QUERY_MS = 100
+FOLDER_APKI_DUPLICATE_QUERY_THRESHOLD = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators